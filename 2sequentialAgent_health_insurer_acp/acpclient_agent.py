@@ -1,64 +1,123 @@
 from acp_sdk.client import Client
 import asyncio
+import os
 from colorama import Fore 
+from circuit import GuardedClient
+from compression import ContextCompressor, measure_latency_delta
+from workflow import Step, Workflow, WorkflowResult, run_output_text
 
-async def run_hospital_workflow() -> None:
+# Health answers are long; the insurer only needs the parts about the question
+context_compressor = ContextCompressor(max_tokens=250)
+
+# Sequential health + insurance chain: the insurer sees the health agent's answer.
+# In speculative mode the insurer is asked the bare question while the health
+# agent works, and only gets a short follow-up if that answer isn't definitive.
+HOSPITAL_STEPS = [
+    Step(
+        name="health",
+        client="langgraph_hospital",
+        agent="health_agent",
+        prompt="Do I need rehabilitation after a shoulder reconstruction?",
+    ),
+    Step(
+        name="insurance",
+        client="insurer",
+        agent="policy_agent",
+        prompt="Context: {health}\n\nQuestion: What is the waiting period for rehabilitation?",
+        depends_on=["health"],
+        speculate="What is the waiting period for rehabilitation after a shoulder reconstruction?",
+        refine="Your earlier answer: {speculative}\n\nMedical context: {health}\n\n"
+               "Give the exact waiting period for this rehabilitation, citing the policy.",
+        compressor=context_compressor,
+    ),
+]
+
+DOCTOR_FINDER_STEPS = [
+    Step(
+        name="doctors",
+        client="langgraph_hospital",
+        agent="doctor_finder_agent",
+        prompt="I'm based in New York City. Are there any cardiologists near me?",
+    ),
+]
+
+def print_hospital_result(result: WorkflowResult) -> None:
+    print(f"{Fore.LIGHTMAGENTA_EX}Health Agent Response: {result.outputs.get('health')}{Fore.RESET}\n")
+    print(f"{Fore.YELLOW}Insurance Agent Response: {result.outputs.get('insurance')}{Fore.RESET}\n")
+
+def print_doctor_finder_result(result: WorkflowResult) -> None:
+    print(f"{Fore.LIGHTBLUE_EX}Doctor Finder Response: {result.outputs.get('doctors')}{Fore.RESET}\n")
+
+async def run_hospital_workflow(clients: dict) -> WorkflowResult:
     """
     Sequential workflow using LangGraph hospital agents and insurance agents
     """
-    async with Client(base_url="http://localhost:8002") as langgraph_hospital, Client(base_url="http://localhost:8001") as insurer:
-        # Step 1: Ask health question to LangGraph health agent
-        print(f"{Fore.CYAN}Step 1: Consulting LangGraph Health Agent...{Fore.RESET}")
-        
-        run1 = await langgraph_hospital.run_sync(
-            agent="health_agent", input="Do I need rehabilitation after a shoulder reconstruction?"
-        )
-        content = run1.output[0].parts[0].content
-        print(f"{Fore.LIGHTMAGENTA_EX}Health Agent Response: {content}{Fore.RESET}\n")
-
-        # Step 2: Use health context to ask insurance question
-        print(f"{Fore.CYAN}Step 2: Consulting Insurance Policy Agent for Question: What is the waiting period for rehabilitation? {Fore.RESET}")
-        
-        run2 = await insurer.run_sync(
-            agent="policy_agent", input=f"Context: {content}\n\nQuestion: What is the waiting period for rehabilitation?"
-        )
-        print(f"{Fore.YELLOW}Insurance Agent Response: {run2.output[0].parts[0].content}{Fore.RESET}\n")
+    print(f"{Fore.CYAN}Consulting LangGraph Health Agent, then Insurance Policy Agent...{Fore.RESET}")
+    result = await Workflow(HOSPITAL_STEPS).run(clients, speculative=True)
+    print_hospital_result(result)
+    return result
 
-async def run_doctoer_finder_workflow()->None:
+async def run_doctoer_finder_workflow(clients: dict) -> WorkflowResult:
     """
     Test the LangGraph doctor finder agent
     """
-    async with Client(base_url="http://localhost:8002") as langgraph_hospital:
-        print(f"{Fore.CYAN}Testing LangGraph Doctor Finder Agent...{Fore.RESET}")
-        run1=await langgraph_hospital.run_sync(
-            agent="doctor_finder_agent",input="I'm based in New York City. Are there any cardiologists near me?"
-        )
-        content=run1.output[0].parts[0].content
-        print(f"{Fore.LIGHTBLUE_EX}Doctor Finder Response: {content}{Fore.RESET}\n")
+    print(f"{Fore.CYAN}Testing LangGraph Doctor Finder Agent...{Fore.RESET}")
+    result = await Workflow(DOCTOR_FINDER_STEPS).run(clients)
+    print_doctor_finder_result(result)
+    return result
+
 
 
+async def report_compression_latency(insurer: Client, health_content: str) -> None:
+    """
+    Time the insurance call with the full and the compressed health answer.
+    Costs extra agent runs, so main() only does it when MEASURE_COMPRESSION is set.
+    """
+    async def call(prompt: str) -> str:
+        return run_output_text(await insurer.run_sync(agent="policy_agent", input=prompt))
+
+    question = "What is the waiting period for rehabilitation?"
+    delta = await measure_latency_delta(
+        call, "Context: {context}\n\nQuestion: " + question, health_content, question, ContextCompressor(max_tokens=250)
+    )
+    print(
+        f"{Fore.CYAN}Context {delta['full_tokens']} -> {delta['compressed_tokens']} tokens, "
+        f"insurer latency {delta['full_seconds']:.2f}s -> {delta['compressed_seconds']:.2f}s "
+        f"(delta {delta['latency_delta_seconds']:+.2f}s){Fore.RESET}"
+    )
 
 async def main():
     """
-    Run both workflows to demonstrate LangGraph agents
+    Run both workflows to demonstrate LangGraph agents. They are independent, so
+    they run as branches of one DAG on shared clients and finish in max() time.
     """
-    print(f"{Fore.GREEN}=== Sequential Agent Workflow with LangGraph ==={Fore.RESET}\n")
+    print(f"{Fore.GREEN}=== Concurrent Agent Workflows with LangGraph ==={Fore.RESET}\n")
     
     try:
-        # Run the sequential health + insurance workflow
-        await run_hospital_workflow()
+        async with Client(base_url="http://localhost:8002") as hospital_client, Client(base_url="http://localhost:8001") as insurer_client:
+            # Health probes and circuit breakers fail calls to a down or overloaded server at once
+            async with GuardedClient(hospital_client) as langgraph_hospital, GuardedClient(insurer_client) as insurer:
+                clients = {"langgraph_hospital": langgraph_hospital, "insurer": insurer}
+                result = await Workflow(HOSPITAL_STEPS + DOCTOR_FINDER_STEPS).run(clients, speculative=True)
+                if os.getenv("MEASURE_COMPRESSION") and result.outputs.get("health"):
+                    await report_compression_latency(insurer, result.outputs["health"])
+                print(f"Circuits: hospital {langgraph_hospital.snapshot()}, insurer {insurer.snapshot()}")
+
         
+        print_hospital_result(result)
         print(f"{Fore.GREEN}--- Separator ---{Fore.RESET}\n")
+        print_doctor_finder_result(result)
+        print(result.timings())
+        print(context_compressor.summary())
         
-        # Run the doctor finder workflow
-        await run_doctoer_finder_workflow()
-        
+        if not result.ok:
+            raise RuntimeError("; ".join(f"{name}: {step.error}" for name, step in result.steps.items() if step.error))
         print(f"{Fore.GREEN}=== All workflows completed successfully! ==={Fore.RESET}")
         
     except Exception as e:
         print(f"{Fore.RED}Error occurred: {str(e)}{Fore.RESET}")
         print(f"{Fore.RED}Make sure both servers are running:{Fore.RESET}")
-        print(f"{Fore.RED}  - LangGraph Hospital Server: python langgraph_hospital_server.py (port 8001){Fore.RESET}")
-        print(f"{Fore.RED}  - Insurance Server: python crewAIInsuranceAgentServer.py (port 8002){Fore.RESET}")
+        print(f"{Fore.RED}  - LangGraph Hospital Server: python langgraph_hospital_server.py (port 8002){Fore.RESET}")
+        print(f"{Fore.RED}  - Insurance Server: python crewAiInsurerservice_server.py (port 8001){Fore.RESET}")
         
-asyncio.run(main())
\ No newline at end of file
+asyncio.run(main())
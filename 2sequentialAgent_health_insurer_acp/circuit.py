@@ -0,0 +1,207 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+# === Health checking and circuit breaking for ACP servers ===
+#
+# When a server is down or overloaded, every call to it waits for a
+# connection timeout before failing, and workflows stack those waits up.
+# GuardedClient wraps an ACP client with a circuit breaker:
+#
+#   closed     calls go through; `failure_threshold` failures in a row trip it
+#   open       calls fail at once with CircuitOpenError for `reset_timeout` seconds
+#   half-open  one trial call (or health probe) decides: success closes it,
+#              failure opens it again
+#
+# Failures are connection errors, timeouts and HTTP 429/5xx answers; a run
+# that completes with an agent error is the agent's problem, not the server's.
+# Started as an async context manager, it also probes GET /ping every
+# `probe_interval` seconds, so a dead server is noticed before a call hits it
+# and a recovered one is let back in once `reset_timeout` has passed, without
+# waiting for traffic to try it.
+#
+# CircuitOpenError is an httpx.ConnectError: like a refused connection it
+# means nothing ran, so replica sets reroute the call to another replica.
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.ConnectError):
+    """Raised instead of calling a server whose circuit is open."""
+
+    def __init__(self, url: str, retry_in: float):
+        super().__init__(f"Circuit open for {url}, retrying in {retry_in:.0f}s")
+        self.url = url
+        self.retry_in = retry_in
+
+
+def is_server_failure(error: BaseException) -> bool:
+    """True for errors that say the server is unreachable or overloaded."""
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    # The ACP client raises ACPError from the HTTP error of a failed response
+    cause = error.__cause__ or error.__context__
+    if isinstance(cause, httpx.HTTPStatusError):
+        status = cause.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open state of one server.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open before a trial call is let through.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 15.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state only one trial call at a time."""
+        if self.state == OPEN and not self.retry_in():
+            self.state = HALF_OPEN
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._trial:
+            self._trial = True
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    @property
+    def available(self) -> bool:
+        """False while calls would be rejected; a half-open server is offered again for its trial call."""
+        return self.state != OPEN or not self.retry_in()
+
+    def release_trial(self) -> None:
+        """Let another trial call through after one ended without a result."""
+        self._trial = False
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.stats["opened"] += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, object]:
+        return {"state": self.state, "failures": self.failures, "retry_in": self.retry_in(), **self.stats}
+
+
+class GuardedClient:
+    """
+    ACP client behind a circuit breaker, with active health probes while used as a context manager.
+
+    Everything but the run calls is delegated to the wrapped client, so it can
+    stand in for one in workflows, replica sets and agent collections.
+
+    Args:
+        client: The ACP client (or DetachedClient) to guard.
+        breaker (CircuitBreaker, optional): Breaker to use; a default one otherwise.
+        probe_interval (float): Seconds between GET /ping probes, 0 to disable probing.
+        probe_timeout (float): Seconds a probe may take before it counts as a failure.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        breaker: Optional[CircuitBreaker] = None,
+        probe_interval: float = 5.0,
+        probe_timeout: float = 2.0,
+    ):
+        self.wrapped = client
+        self.breaker = breaker or CircuitBreaker()
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._prober: Optional[asyncio.Task] = None
+
+    @property
+    def url(self) -> str:
+        return str(getattr(getattr(self.wrapped, "client", None), "base_url", "")) or repr(self.wrapped)
+
+    @property
+    def available(self) -> bool:
+        return self.breaker.available
+
+    async def _guarded(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.url, self.breaker.retry_in())
+        try:
+            result = await call()
+        except Exception as e:
+            if is_server_failure(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            # Cancelled (speculation, deadlines): no verdict on the server, but free the trial slot
+            self.breaker.release_trial()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def run_sync(self, input: Any, *, agent: str, **kwargs: Any) -> Any:
+        return await self._guarded(lambda: self.wrapped.run_sync(input, agent=agent, **kwargs))
+
+    async def run_async(self, input: Any, *, agent: str, **kwargs: Any) -> Any:
+        return await self._guarded(lambda: self.wrapped.run_async(input, agent=agent, **kwargs))
+
+    async def probe(self) -> bool:
+        """Ping the server once and feed the result to the breaker."""
+        try:
+            response = await self.wrapped.client.get("ping", timeout=self.probe_timeout)
+            healthy = response.status_code < 500 and response.status_code != 429
+        except httpx.HTTPError:
+            healthy = False
+        if healthy:
+            # /ping answers even when runs are rejected with 429, so an open circuit still waits out reset_timeout
+            if self.breaker.available:
+                self.breaker.record_success()
+        elif self.breaker.state != OPEN:
+            self.breaker.record_failure()
+        return healthy
+
+    async def _probe_forever(self) -> None:
+        while True:
+            await self.probe()
+            await asyncio.sleep(self.probe_interval)
+
+    async def __aenter__(self) -> "GuardedClient":
+        if self.probe_interval > 0 and self._prober is None:
+            self._prober = asyncio.create_task(self._probe_forever())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._prober is not None:
+            self._prober.cancel()
+            self._prober = None
+
+    def snapshot(self) -> Dict[str, object]:
+        return self.breaker.snapshot()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.wrapped, name)
@@ -1,15 +1,21 @@
+import functools
 from collections.abc import AsyncGenerator
 from acp_sdk.models import Message, MessagePart
 from acp_sdk.server import RunYield, RunYieldResume, Server
 
-from crewai import Crew, Task, Agent, LLM
-from crewai_tools import RagTool
 import nest_asyncio
+from serving import serve
+from warmup import Warmup, force_import, lazy_import
+
+# Imported on first use (or during warmup) so the server binds its port at once
+crewai = lazy_import("crewai")
+crewai_tools = lazy_import("crewai_tools")
+litellm = lazy_import("litellm")
 
 nest_asyncio.apply()
 
 server = Server()
-llm = LLM(model="openai/gpt-4", max_tokens=1024)
+LLM_MODEL = "openai/gpt-4"
 from dotenv import load_dotenv
 load_dotenv()
 import os
@@ -28,38 +34,57 @@ config = {
         }
     }
 }
-rag_tool = RagTool(config=config,  
-                   chunk_size=1200,       
-                   chunk_overlap=200,     
-                  )
-rag_tool.add("data/gold-hospital-and-premium-extras.pdf", data_type="pdf_file")
+
+
+@functools.lru_cache(maxsize=None)
+def get_llm():
+    return crewai.LLM(model=LLM_MODEL, max_tokens=1024)
+
+
+@functools.lru_cache(maxsize=None)
+def get_rag_tool():
+    """Build the RAG tool and index the policy PDF; done during warmup rather than at import"""
+    rag_tool = crewai_tools.RagTool(config=config, chunk_size=1200, chunk_overlap=200)
+    rag_tool.add("data/gold-hospital-and-premium-extras.pdf", data_type="pdf_file")
+    return rag_tool
+
+
+def prime_llm() -> None:
+    """Open the connection to the LLM provider with a one-token completion."""
+    litellm.completion(model=LLM_MODEL, messages=[{"role": "user", "content": "ping"}], max_tokens=1)
+
+
+warmup = Warmup("CrewAI Insurance server")
+warmup.add("imports", lambda: force_import(crewai, crewai_tools) or get_llm())
+warmup.add("policy index", get_rag_tool)
+warmup.add("llm connection", prime_llm, required=False)
 
 
 @server.agent()
 async def policy_agent(input: list[Message]) -> AsyncGenerator[RunYield, RunYieldResume]:
     "This is an agent for questions around policy coverage, it uses a RAG pattern to find answers based on policy documentation. Use it to help answer questions on coverage and waiting periods."
 
-    insurance_agent = Agent(
+    insurance_agent = crewai.Agent(
         role="Senior Insurance Coverage Assistant", 
         goal="Determine whether something is covered or not",
         backstory="You are an expert insurance agent designed to assist with coverage queries",
         verbose=True,
         allow_delegation=False,
-        llm=llm,
-        tools=[rag_tool], 
+        llm=get_llm(),
+        tools=[get_rag_tool()], 
         max_retry_limit=5
     )
     
-    task1 = Task(
+    task1 = crewai.Task(
          description=input[0].parts[0].content,
          expected_output = "A comprehensive response as to the users question",
          agent=insurance_agent
     )
-    crew = Crew(agents=[insurance_agent], tasks=[task1], verbose=True)
+    crew = crewai.Crew(agents=[insurance_agent], tasks=[task1], verbose=True)
     
     task_output = await crew.kickoff_async()
     yield Message(parts=[MessagePart(content=str(task_output))])
 
 if __name__ == "__main__":
     print(f"ACP server crewAI Insurance running....")
-    server.run(port=8001)
\ No newline at end of file
+    serve(server, warmup, port=8001)
\ No newline at end of file
@@ -1,91 +1,141 @@
 from collections.abc import AsyncGenerator
+import functools
 from typing import TypedDict, Annotated
 from acp_sdk.models import Message, MessagePart
 from acp_sdk.server import RunYield, RunYieldResume, Server, Context
 from dotenv import load_dotenv
+import asyncio
 import os
 
-# LangGraph and LangChain imports
-from langgraph.graph import StateGraph, END
-from langgraph.graph.message import add_messages
-from langchain_openai import ChatOpenAI
-from langchain_community.tools import DuckDuckGoSearchRun
-from langchain_community.document_loaders import WebBaseLoader
-from langchain.agents import create_openai_tools_agent, AgentExecutor
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage
+from serving import serve
+from sessions import SessionStore, Turn
+from warmup import Warmup, force_import, lazy_import
+
+# LangGraph and LangChain are imported on first use (or during warmup) so the server binds its port at once
+langgraph_graph = lazy_import("langgraph.graph")
+langgraph_message = lazy_import("langgraph.graph.message")
+langchain_openai = lazy_import("langchain_openai")
+langchain_tools = lazy_import("langchain_community.tools")
+langchain_agents = lazy_import("langchain.agents")
+langchain_prompts = lazy_import("langchain_core.prompts")
+langchain_messages = lazy_import("langchain_core.messages")
 
 load_dotenv()
 os.environ['OPENAI_API_KEY'] = os.getenv('OPENAI_API_KEY')
 
 server = Server()
 
-# Initialize LLM
-llm = ChatOpenAI(model="gpt-4", max_tokens=2048, temperature=0)
-
-# Define state for the graph
-class GraphState(TypedDict):
-    messages: Annotated[list, add_messages]
-    query: str
-    response: str
-
-# Tools
-search_tool = DuckDuckGoSearchRun()
-
-# Create prompt template
-prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are a helpful health assistant for a hospital. 
-    You help patients with health-related questions and provide information about hospital treatments.
-    Use the search tool when you need current medical information or specific treatment details.
-    Always provide accurate, helpful, and empathetic responses."""),
-    MessagesPlaceholder(variable_name="chat_history"),
-    ("user", "{input}"),
-    MessagesPlaceholder(variable_name="agent_scratchpad"),
-])
-
-# Create agent
-tools = [search_tool]
-agent = create_openai_tools_agent(llm, tools, prompt)
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
-
-# Define nodes for the graph
-def health_search_node(state: GraphState):
-    """Node that processes health queries using search and LLM"""
-    query = state["query"]
-    
-    # Run the agent with the query
-    result = agent_executor.invoke({
-        "input": query,
-        "chat_history": []
-    })
-    
-    response = result["output"]
-    
-    return {
-        "messages": [HumanMessage(content=query), AIMessage(content=response)],
-        "response": response
-    }
+@functools.lru_cache(maxsize=None)
+def get_llm():
+    return langchain_openai.ChatOpenAI(model="gpt-4", max_tokens=2048, temperature=0)
+
+@functools.lru_cache(maxsize=None)
+def get_search_tool():
+    return langchain_tools.DuckDuckGoSearchRun()
+
+@functools.lru_cache(maxsize=None)
+def get_health_graph():
+    """Compile the health agent's graph; built once, on first use or during warmup"""
+    # Define state for the graph
+    class GraphState(TypedDict):
+        messages: Annotated[list, langgraph_message.add_messages]
+        query: str
+        response: str
+        chat_history: list
+
+    # Create prompt template
+    prompt = langchain_prompts.ChatPromptTemplate.from_messages([
+        ("system", """You are a helpful health assistant for a hospital. 
+        You help patients with health-related questions and provide information about hospital treatments.
+        Use the search tool when you need current medical information or specific treatment details.
+        Always provide accurate, helpful, and empathetic responses."""),
+        langchain_prompts.MessagesPlaceholder(variable_name="chat_history"),
+        ("user", "{input}"),
+        langchain_prompts.MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ])
+
+    # Create agent
+    tools = [get_search_tool()]
+    agent = langchain_agents.create_openai_tools_agent(get_llm(), tools, prompt)
+    agent_executor = langchain_agents.AgentExecutor(agent=agent, tools=tools, verbose=True)
+
+    # Define nodes for the graph
+    def health_search_node(state: GraphState):
+        """Node that processes health queries using search and LLM"""
+        query = state["query"]
+        
+        # Run the agent with the query
+        result = agent_executor.invoke({
+            "input": query,
+            "chat_history": state.get("chat_history", [])
+        })
+        
+        response = result["output"]
+        
+        return {
+            "messages": [langchain_messages.HumanMessage(content=query), langchain_messages.AIMessage(content=response)],
+            "response": response
+        }
+
+    # Build the graph
+    workflow = langgraph_graph.StateGraph(GraphState)
+
+    # Add nodes
+    workflow.add_node("health_search", health_search_node)
 
-def should_search(state: GraphState):
-    """Determine if we need to search or can answer directly"""
-    # For this simple example, we always search
-    # In a more complex scenario, you could add logic here
-    return "search"
+    # Set entry point
+    workflow.set_entry_point("health_search")
 
-# Build the graph
-workflow = StateGraph(GraphState)
+    # Add edges
+    workflow.add_edge("health_search", langgraph_graph.END)
 
-# Add nodes
-workflow.add_node("health_search", health_search_node)
+    # Compile the graph
+    return workflow.compile()
 
-# Set entry point
-workflow.set_entry_point("health_search")
+def summarize_turns(summary: str, turns: list[Turn]) -> str:
+    """Fold older turns into the running conversation summary"""
+    transcript = "\n".join(f"Patient: {user}\nAssistant: {answer}" for user, answer in turns)
+    result = get_llm().invoke(
+        "Update the summary of this conversation between a patient and a hospital health assistant. "
+        "Keep symptoms, conditions, treatments, names and numbers; drop pleasantries. "
+        "Answer with the updated summary only, in at most 150 words.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"
+    )
+    return result.content.strip()
 
-# Add edges
-workflow.add_edge("health_search", END)
+# Conversations keyed by ACP session id: clients in `client.session()` send only the new message
+sessions = SessionStore(
+    max_sessions=int(os.getenv("SESSION_CACHE_SIZE", "256")),
+    spill_dir=os.getenv("SESSION_SPILL_DIR") or None,
+    token_budget=1500,
+    summarize=summarize_turns,
+)
 
-# Compile the graph
-app = workflow.compile()
+def chat_history(session_id) -> list:
+    """The session's summary and recent turns as chat messages"""
+    conversation = sessions.get(session_id)
+    history = []
+    if conversation.summary:
+        history.append(
+            langchain_messages.SystemMessage(content=f"Summary of the earlier conversation: {conversation.summary}")
+        )
+    for user, answer in conversation.turns:
+        history += [langchain_messages.HumanMessage(content=user), langchain_messages.AIMessage(content=answer)]
+    return history
+
+def prime_llm() -> None:
+    """Open the connection to the LLM provider with a one-token completion"""
+    get_llm().bind(max_tokens=1).invoke("ping")
+
+warmup = Warmup("LangGraph Hospital Server")
+warmup.add(
+    "imports",
+    lambda: force_import(
+        langgraph_graph, langgraph_message, langchain_openai, langchain_tools,
+        langchain_agents, langchain_prompts, langchain_messages,
+    ) or get_health_graph(),
+)
+warmup.add("llm connection", prime_llm, required=False)
 
 @server.agent()
 async def health_agent(input: list[Message], context: Context) -> AsyncGenerator[RunYield, RunYieldResume]:
@@ -94,20 +144,24 @@ async def health_agent(input: list[Message], context: Context) -> AsyncGenerator
     # Extract the user query
     prompt = input[0].parts[0].content
     
-    # Create initial state
+    # Create initial state, continuing the session's conversation
     initial_state = {
         "query": prompt,
         "messages": [],
-        "response": ""
+        "response": "",
+        "chat_history": chat_history(context.session.id)
     }
     
     # Run the workflow
-    final_state = app.invoke(initial_state)
+    final_state = get_health_graph().invoke(initial_state)
     
     # Extract the response
     response = final_state["response"]
     
     yield Message(parts=[MessagePart(content=str(response))])
+    
+    # Remember the turn; summarizing may call the LLM, so keep it off the event loop
+    await asyncio.to_thread(sessions.record, context.session.id, prompt, str(response))
 
 @server.agent()
 async def doctor_finder_agent(input: list[Message], context: Context) -> AsyncGenerator[RunYield, RunYieldResume]:
@@ -115,7 +169,7 @@ async def doctor_finder_agent(input: list[Message], context: Context) -> AsyncGe
     
     # Define a specialized state for doctor finding
     class DoctorState(TypedDict):
-        messages: Annotated[list, add_messages]
+        messages: Annotated[list, langgraph_message.add_messages]
         query: str
         location: str
         specialty: str
@@ -134,7 +188,7 @@ async def doctor_finder_agent(input: list[Message], context: Context) -> AsyncGe
         Specialty: [extracted specialty or "general practitioner"]
         """
         
-        result = llm.invoke(extraction_prompt)
+        result = get_llm().invoke(extraction_prompt)
         
         # Simple parsing (in production, you'd want more robust parsing)
         lines = result.content.split('\n')
@@ -159,7 +213,7 @@ async def doctor_finder_agent(input: list[Message], context: Context) -> AsyncGe
         
         search_query = f"find {specialty} doctors near {location} contact information"
         print(f"Search query- langgraph-doctor finder:{search_query}\n")
-        search_result = search_tool.run(search_query)
+        search_result = get_search_tool().run(search_query)
         
         # Create a comprehensive response
         response_prompt = f"""
@@ -175,24 +229,24 @@ async def doctor_finder_agent(input: list[Message], context: Context) -> AsyncGe
         Make the response conversational and helpful.
         """
         
-        response = llm.invoke(response_prompt)
+        response = get_llm().invoke(response_prompt)
         
         return {
             "response": response.content,
             "messages": [
-                HumanMessage(content=state["query"]),
-                AIMessage(content=response.content)
+                langchain_messages.HumanMessage(content=state["query"]),
+                langchain_messages.AIMessage(content=response.content)
             ]
         }
     
     # Build doctor finder workflow
-    doctor_workflow = StateGraph(DoctorState)
+    doctor_workflow = langgraph_graph.StateGraph(DoctorState)
     doctor_workflow.add_node("extract_info", extract_location_specialty)
     doctor_workflow.add_node("search_doctors", search_doctors)
     
     doctor_workflow.set_entry_point("extract_info")
     doctor_workflow.add_edge("extract_info", "search_doctors")
-    doctor_workflow.add_edge("search_doctors", END)
+    doctor_workflow.add_edge("search_doctors", langgraph_graph.END)
     
     doctor_app = doctor_workflow.compile()
     
@@ -218,4 +272,4 @@ async def doctor_finder_agent(input: list[Message], context: Context) -> AsyncGe
 
 if __name__ == "__main__":
     print("LangGraph Hospital Server running...")
-    server.run(port=8002)
\ No newline at end of file
+    serve(server, warmup, port=8002)
\ No newline at end of file
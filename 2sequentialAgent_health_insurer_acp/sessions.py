@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from compression import count_tokens
+
+# === Server-side conversation sessions ===
+#
+# Agents used to start every run with an empty chat history, so a client that
+# wanted follow-ups had to resend the whole conversation each turn. The server
+# now keeps each conversation keyed by the ACP session id: clients run inside
+# `client.session()` and send only the new message. Conversations live in a
+# bounded LRU; evicted ones can spill to local disk and are reloaded on their
+# next turn. Once a conversation's history exceeds its token budget, the older
+# turns are folded into a running summary and only the latest turns stay verbatim.
+
+Turn = Tuple[str, str]
+
+
+class Conversation:
+    """One session's history: a summary of older turns plus the recent (user, assistant) turns."""
+
+    def __init__(self, session_id: str, summary: str = "", turns: Optional[List[Turn]] = None):
+        self.session_id = session_id
+        self.summary = summary
+        self.turns: List[Turn] = turns or []
+        self.lock = threading.Lock()
+
+    def tokens(self) -> int:
+        return count_tokens(self.summary) + sum(count_tokens(user) + count_tokens(answer) for user, answer in self.turns)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"session_id": self.session_id, "summary": self.summary, "turns": [list(turn) for turn in self.turns]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "Conversation":
+        return cls(data["session_id"], data.get("summary") or "", [tuple(turn) for turn in data.get("turns") or []])
+
+
+class SessionStore:
+    """
+    Bounded store of conversations keyed by session id.
+
+    Args:
+        max_sessions (int): Conversations kept in memory; the least recently used are evicted.
+        spill_dir (str, optional): Directory evicted conversations are written to. Without it they are dropped.
+        max_spilled (int): Cap on spilled conversations; the oldest files are deleted past it.
+        token_budget (int): History size past which older turns are summarized.
+        keep_turns (int): Latest turns always kept verbatim.
+        summarize (callable, optional): `summarize(summary, turns) -> str` folding turns into the
+            running summary. Without it, turns past the budget are simply dropped.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 256,
+        spill_dir: Optional[str] = None,
+        max_spilled: int = 10000,
+        token_budget: int = 1500,
+        keep_turns: int = 2,
+        summarize: Optional[Callable[[str, List[Turn]], str]] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.spill_dir = spill_dir
+        self.max_spilled = max_spilled
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summarize = summarize
+        self._sessions: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "restored": 0, "evicted": 0, "spilled": 0, "summarized": 0}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def get(self, session_id: str) -> Conversation:
+        """The conversation for a session, reloaded from disk or started empty if it isn't in memory."""
+        session_id = str(session_id)
+        with self._lock:
+            conversation = self._sessions.get(session_id)
+            if conversation is not None:
+                self._sessions.move_to_end(session_id)
+                return conversation
+            conversation = self._restore(session_id)
+            if conversation is None:
+                conversation = Conversation(session_id)
+                self.stats["created"] += 1
+            self._sessions[session_id] = conversation
+            self._evict()
+            return conversation
+
+    def record(self, session_id: str, user: str, answer: str) -> Conversation:
+        """
+        Append a finished turn, summarizing older turns if the history is now over budget.
+
+        Runs the summarizer (usually an LLM call) inline, so call it off the event loop.
+        """
+        conversation = self.get(session_id)
+        with conversation.lock:
+            conversation.turns.append((user, answer))
+            if conversation.tokens() > self.token_budget:
+                self._compact(conversation)
+        return conversation
+
+    def _compact(self, conversation: Conversation) -> None:
+        older = conversation.turns[:-self.keep_turns] if self.keep_turns else list(conversation.turns)
+        if not older:
+            return
+        if self.summarize is not None:
+            conversation.summary = self.summarize(conversation.summary, older)
+            self.stats["summarized"] += 1
+        conversation.turns = conversation.turns[len(older):]
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{session_id}.json")
+
+    def _restore(self, session_id: str) -> Optional[Conversation]:
+        if not self.spill_dir or not os.path.exists(self._path(session_id)):
+            return None
+        try:
+            with open(self._path(session_id), encoding="utf-8") as f:
+                conversation = Conversation.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            # A torn or foreign file: start the conversation over
+            return None
+        os.remove(self._path(session_id))
+        self.stats["restored"] += 1
+        return conversation
+
+    def _evict(self) -> None:
+        while len(self._sessions) > self.max_sessions:
+            _, conversation = self._sessions.popitem(last=False)
+            self.stats["evicted"] += 1
+            if self.spill_dir and (conversation.turns or conversation.summary):
+                self._spill(conversation)
+
+    def _spill(self, conversation: Conversation) -> None:
+        path = self._path(conversation.session_id)
+        staging = f"{path}.tmp{os.getpid()}"
+        with open(staging, "w", encoding="utf-8") as f:
+            json.dump(conversation.to_dict(), f)
+        os.replace(staging, path)
+        self.stats["spilled"] += 1
+        files = [os.path.join(self.spill_dir, name) for name in os.listdir(self.spill_dir) if name.endswith(".json")]
+        if len(files) > self.max_spilled:
+            files.sort(key=os.path.getmtime)
+            for stale in files[:len(files) - self.max_spilled]:
+                os.remove(stale)
@@ -4,7 +4,7 @@ from colorama import Fore
 
 async def test_health_agent():
     """Test the LangGraph health agent"""
-    async with Client(base_url="http://localhost:8001") as hospital:
+    async with Client(base_url="http://localhost:8002") as hospital:
         # Test health-related query
         health_query = "What are the symptoms of diabetes and what treatments are available?"
         
@@ -19,9 +19,21 @@ async def test_health_agent():
         print(f"{Fore.GREEN}Health Agent Response:{Fore.RESET}")
         print(f"{Fore.LIGHTGREEN_EX}{content}{Fore.RESET}\n")
 
+async def test_health_follow_up():
+    """Test a multi-turn conversation: the follow-up only sends the new message"""
+    async with Client(base_url="http://localhost:8002") as hospital, hospital.session() as session:
+        first = "I had a shoulder reconstruction last week. How long is the recovery?"
+        follow_up = "Will I need physiotherapy for it?"
+        
+        for query in (first, follow_up):
+            print(f"{Fore.CYAN}Testing Health Agent session with query: {query}{Fore.RESET}")
+            run = await session.run_sync(agent="health_agent", input=query)
+            content = run.output[0].parts[0].content
+            print(f"{Fore.LIGHTGREEN_EX}{content}{Fore.RESET}\n")
+
 async def test_doctor_finder_agent():
     """Test the LangGraph doctor finder agent"""
-    async with Client(base_url="http://localhost:8001") as hospital:
+    async with Client(base_url="http://localhost:8002") as hospital:
         # Test doctor finder query
         doctor_query = "I'm based in Atlanta, GA. Are there any cardiologists near me?"
         
@@ -41,6 +53,7 @@ async def main():
     print(f"{Fore.YELLOW}Testing LangGraph Hospital Server Agents{Fore.RESET}\n")
     
     await test_health_agent()
+    await test_health_follow_up()
     await test_doctor_finder_agent()
     
     print(f"{Fore.YELLOW}All tests completed!{Fore.RESET}")
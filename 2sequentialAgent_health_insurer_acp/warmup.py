@@ -0,0 +1,146 @@
+import asyncio
+import importlib.util
+import inspect
+import sys
+import time
+from contextlib import asynccontextmanager
+from types import ModuleType
+from typing import Callable, Dict, List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+# === Lazy imports, warmup and readiness ===
+#
+# crewai, smolagents, langchain and friends take seconds to import, and model
+# clients and the RAG index used to be built at import time, so a server only
+# bound its port once all of that was done. Entry points now import heavy
+# packages lazily, bind the port straight away and run an explicit warmup that
+# primes everything in the background. GET /ready answers 503 until it's done.
+
+# Reference point for ready_seconds: entry points import this module early
+PROCESS_STARTED = time.perf_counter()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Return a module that is only executed when one of its attributes is first used.
+
+    Use `crewai = lazy_import("crewai")` and `crewai.Crew(...)` instead of
+    `from crewai import Crew`, which imports the package immediately.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def force_import(*modules: ModuleType) -> None:
+    """Execute lazily imported modules now (a warmup step)."""
+    for module in modules:
+        # Any attribute access makes a lazy module execute
+        getattr(module, "__file__", None)
+
+
+class Warmup:
+    """
+    Startup steps run once in the background, plus the readiness probe.
+
+    Register steps with `add()` (sync functions run in a thread), pass the
+    instance to `serving.serve`, and point health checks at GET /ready: it
+    answers 200 once every required step has succeeded and 503 before that.
+
+    Args:
+        name (str): Server name shown in the startup summary.
+    """
+
+    def __init__(self, name: str = "server"):
+        self.name = name
+        self.steps: Dict[str, Callable] = {}
+        self.required: Dict[str, bool] = {}
+        self.results: Dict[str, Dict[str, object]] = {}
+        self.shutdown_hooks: List[Callable] = []
+        self.ready = False
+        self.ready_seconds: Optional[float] = None
+
+    def add(self, name: str, fn: Callable, required: bool = True) -> None:
+        """
+        Register a warmup step.
+
+        Args:
+            name (str): Step name reported on /ready.
+            fn (callable): Sync or async function without arguments.
+            required (bool): Whether readiness waits for this step to succeed.
+        """
+        self.steps[name] = fn
+        self.required[name] = required
+        self.results[name] = {"status": "pending", "seconds": None, "error": None}
+
+    def on_shutdown(self, fn: Callable) -> None:
+        """Register a sync or async function run when the server stops."""
+        self.shutdown_hooks.append(fn)
+
+    async def run(self) -> bool:
+        """Run every step concurrently. Returns whether the server is ready."""
+        await asyncio.gather(*(self._run_step(name, fn) for name, fn in self.steps.items()))
+        self.ready = all(
+            self.results[name]["status"] == "ok" for name, required in self.required.items() if required
+        )
+        if self.ready:
+            self.ready_seconds = time.perf_counter() - PROCESS_STARTED
+            print(f"{self.name} ready {self.ready_seconds:.2f}s after start: {self.summary()}")
+        else:
+            print(f"{self.name} NOT ready, warmup failed: {self.summary()}")
+        return self.ready
+
+    async def _run_step(self, name: str, fn: Callable) -> None:
+        result = self.results[name]
+        result["status"] = "running"
+        started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(fn):
+                await fn()
+            else:
+                await asyncio.to_thread(fn)
+            result["status"] = "ok"
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["seconds"] = round(time.perf_counter() - started, 3)
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {result['status']} ({result['seconds']}s)" for name, result in self.results.items())
+
+    def snapshot(self) -> Dict[str, object]:
+        return {"ready": self.ready, "ready_seconds": self.ready_seconds, "steps": self.results}
+
+    def install(self, app: FastAPI) -> None:
+        """Run the warmup once the app starts and add the /ready route."""
+        inner = app.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan(app: FastAPI):
+            task = asyncio.create_task(self.run())
+            try:
+                async with inner(app) as state:
+                    yield state
+            finally:
+                task.cancel()
+                for hook in self.shutdown_hooks:
+                    if inspect.iscoroutinefunction(hook):
+                        await hook()
+                    else:
+                        await asyncio.to_thread(hook)
+
+        app.router.lifespan_context = lifespan
+
+        @app.get("/ready")
+        async def read_ready():
+            return JSONResponse(status_code=200 if self.ready else 503, content=self.snapshot())
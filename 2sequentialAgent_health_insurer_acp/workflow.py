@@ -0,0 +1,270 @@
+import asyncio
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from colorama import Fore
+
+from compression import ContextCompressor, content_words
+
+# === Declarative DAG runner for multi-agent ACP workflows ===
+#
+# A workflow is a list of steps. Each step calls one agent on one client with a
+# prompt template that can reference the outputs of upstream steps ("{health}")
+# and run variables. Steps start as soon as their dependencies finish, so
+# independent branches run concurrently on the shared clients.
+#
+# In speculative mode a step with a `speculate` prompt (one that needs no
+# upstream output) starts immediately alongside its dependencies. When they
+# finish, the speculative answer is kept if `sufficient` accepts it, otherwise
+# a short `refine` follow-up folds the upstream context in. The default check,
+# looks_definitive, is a heuristic: a concrete, unhedged answer that mentions
+# what the upstream context is mostly about. It can't tell whether the context
+# changes the answer; pass a stricter `sufficient` where that matters.
+#
+# A step with a `compressor` receives upstream outputs cut down to the
+# sentences relevant to its own prompt, under the compressor's token budget.
+
+
+def run_output_text(run: Any) -> str:
+    """Extract the text of an ACP run, tolerating the different response shapes."""
+    if hasattr(run, 'output') and run.output:
+        return run.output[0].parts[0].content
+    elif hasattr(run, 'messages') and run.messages:
+        return run.messages[0].parts[0].content
+    return str(run)
+
+
+def render(template: str, variables: Dict[str, Any]) -> str:
+    """Replace {name} placeholders; unlike str.format, literal braces elsewhere are left alone."""
+    result = template
+    for key, value in variables.items():
+        result = result.replace("{" + key + "}", str(value))
+    return result
+
+
+UNCERTAIN_PHRASES = (
+    "i don't know", "i do not know", "not specified", "not mentioned", "unable to", "cannot determine",
+    "can't determine", "depends on", "more information", "please provide", "not sure",
+)
+
+
+# The upstream context's most frequent terms, and the share of them a speculative answer must mention
+KEY_TERMS = 6
+MIN_KEY_TERM_COVERAGE = 0.34
+
+
+def key_terms(text: str, limit: int = KEY_TERMS) -> List[str]:
+    """The most frequent content words of a text, cut to a common prefix ("physiotherapy" -> "physi")."""
+    counts = Counter(word[:5] for word in content_words(text) if len(word) > 3 and not word.isdigit())
+    return [term for term, _ in counts.most_common(limit)]
+
+
+def looks_definitive(answer: str, upstream: Dict[str, Optional[str]]) -> bool:
+    """
+    Default sufficiency check for speculative answers, a heuristic: no hedging, a
+    concrete figure such as a duration, amount or percentage, and at least a
+    third of the upstream context's key terms mentioned, so an answer about
+    something other than what the context turned out to be about is refined.
+    """
+    lowered = answer.lower()
+    if any(phrase in lowered for phrase in UNCERTAIN_PHRASES):
+        return False
+    if not re.search(r"\b\d+\s*(day|week|month|year)s?\b|\$\s*\d|\d+\s*%", lowered):
+        return False
+    terms = key_terms(" ".join(output for output in upstream.values() if output))
+    if not terms:
+        return True
+    mentioned = {word[:5] for word in content_words(lowered)}
+    return sum(term in mentioned for term in terms) / len(terms) >= MIN_KEY_TERM_COVERAGE
+
+
+@dataclass
+class Step:
+    """
+    One agent call in a workflow.
+
+    `speculate`, `refine` and `sufficient` only apply when the workflow runs in
+    speculative mode: `speculate` is the prompt used before dependencies finish,
+    `refine` the follow-up template ({speculative} plus upstream outputs) used
+    when `sufficient(answer, upstream)` rejects the speculative answer. The
+    default, `looks_definitive`, only checks that the answer is concrete and
+    on the context's key terms; it doesn't verify the context leaves it correct.
+    `compressor` shrinks upstream outputs before they are substituted.
+    """
+    name: str
+    client: str
+    agent: str
+    prompt: str
+    depends_on: List[str] = field(default_factory=list)
+    speculate: Optional[str] = None
+    refine: Optional[str] = None
+    sufficient: Callable[[str, Dict[str, Optional[str]]], bool] = looks_definitive
+    compressor: Optional[ContextCompressor] = None
+
+
+@dataclass
+class StepResult:
+    """Outcome and timing of one step, times relative to the workflow start."""
+    name: str
+    agent: str
+    output: Optional[str] = None
+    error: Optional[str] = None
+    started: float = 0.0
+    finished: float = 0.0
+    speculation: Optional[str] = None  # "used", "refined" or "failed" in speculative mode
+    tokens_saved: int = 0  # upstream context tokens removed by the step's compressor
+
+    @property
+    def seconds(self) -> float:
+        return self.finished - self.started
+
+
+@dataclass
+class WorkflowResult:
+    steps: Dict[str, StepResult]
+    seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return all(step.error is None for step in self.steps.values())
+
+    @property
+    def outputs(self) -> Dict[str, Optional[str]]:
+        return {name: step.output for name, step in self.steps.items()}
+
+    def timings(self) -> str:
+        lines = [f"{'step':<20}{'agent':<24}{'start':>8}{'end':>8}{'secs':>8}"]
+        for step in sorted(self.steps.values(), key=lambda s: s.started):
+            status = "" if step.error is None else f"  FAILED: {step.error}"
+            if step.speculation:
+                status += f"  speculative answer {step.speculation}"
+            if step.tokens_saved:
+                status += f"  context -{step.tokens_saved} tokens"
+            lines.append(
+                f"{step.name:<20}{step.agent:<24}{step.started:>8.2f}{step.finished:>8.2f}{step.seconds:>8.2f}{status}"
+            )
+        lines.append(f"total {self.seconds:.2f}s")
+        return "\n".join(lines)
+
+
+class WorkflowError(Exception):
+    """Raised for invalid workflow definitions."""
+    pass
+
+
+class Workflow:
+    """
+    A DAG of agent calls.
+
+    Args:
+        steps (list[Step]): Steps in any order; dependencies are resolved by name.
+    """
+
+    def __init__(self, steps: List[Step]):
+        self.steps = {step.name: step for step in steps}
+        if len(self.steps) != len(steps):
+            raise WorkflowError("Step names must be unique")
+        for step in steps:
+            for dependency in step.depends_on:
+                if dependency not in self.steps:
+                    raise WorkflowError(f"Step '{step.name}' depends on unknown step '{dependency}'")
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        visiting, done = set(), set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise WorkflowError(f"Workflow has a cycle through '{name}'")
+            visiting.add(name)
+            for dependency in self.steps[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.steps:
+            visit(name)
+
+    async def run(self, clients: Dict[str, Any], speculative: bool = False, **variables: Any) -> WorkflowResult:
+        """
+        Execute the workflow.
+
+        Args:
+            clients (dict[str, Client]): ACP clients by the names used in `Step.client`.
+            speculative (bool): Start steps that define `speculate` before their dependencies finish.
+            **variables: Values available to every prompt template.
+
+        Returns:
+            WorkflowResult: Per-step outputs, errors and timings.
+        """
+        start = time.perf_counter()
+        results: Dict[str, StepResult] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def call(step: Step, prompt: str) -> str:
+            run = await clients[step.client].run_sync(agent=step.agent, input=prompt)
+            return run_output_text(run)
+
+        async def execute(step: Step) -> None:
+            result = StepResult(name=step.name, agent=step.agent)
+            speculation = None
+            if speculative and step.speculate and step.depends_on:
+                result.started = time.perf_counter() - start
+                speculation = asyncio.create_task(call(step, render(step.speculate, variables)))
+            if step.depends_on:
+                await asyncio.gather(*(tasks[name] for name in step.depends_on))
+            results[step.name] = result
+            if speculation is None:
+                result.started = time.perf_counter() - start
+            failed = [name for name in step.depends_on if results[name].error is not None]
+            if failed:
+                if speculation is not None:
+                    speculation.cancel()
+                result.error = f"skipped, upstream failed: {', '.join(failed)}"
+            else:
+                upstream = self._compress(step, result, {name: results[name].output for name in step.depends_on}, variables)
+                try:
+                    result.output = await self._resolve(step, speculation, result, upstream, variables, call)
+                except Exception as e:
+                    result.error = f"{type(e).__name__}: {e}"
+            result.finished = time.perf_counter() - start
+            color = Fore.GREEN if result.error is None else Fore.RED
+            print(f"{color}{step.name} ({step.agent}) finished in {result.seconds:.2f}s{Fore.RESET}")
+
+        for step in self.steps.values():
+            tasks[step.name] = asyncio.create_task(execute(step))
+        await asyncio.gather(*tasks.values())
+        return WorkflowResult(steps=results, seconds=time.perf_counter() - start)
+
+    def _compress(self, step: Step, result: StepResult, upstream: Dict[str, Optional[str]], variables: Dict[str, Any]):
+        """Compress upstream outputs against the step's prompt with the upstream placeholders left out."""
+        if step.compressor is None:
+            return upstream
+        question = render(step.prompt, {**variables, **{name: "" for name in upstream}})
+        compressed = {}
+        for name, output in upstream.items():
+            compressed[name] = step.compressor.compress(output or "", question)
+            result.tokens_saved += step.compressor.reports[-1].tokens_saved
+        return compressed
+
+    async def _resolve(self, step, speculation, result, upstream, variables, call) -> str:
+        """Produce a step's output, reusing or refining a speculative answer when there is one."""
+        if speculation is not None:
+            try:
+                answer = await speculation
+            except Exception as e:
+                print(f"{Fore.YELLOW}Speculative {step.agent} call failed, running it normally: {e}{Fore.RESET}")
+                result.speculation = "failed"
+            else:
+                if step.sufficient(answer, upstream):
+                    result.speculation = "used"
+                    return answer
+                result.speculation = "refined"
+                template = step.refine or step.prompt
+                return await call(step, render(template, {**variables, **upstream, "speculative": answer}))
+        return await call(step, render(step.prompt, {**variables, **upstream}))
@@ -0,0 +1,467 @@
+import asyncio
+import functools
+import json
+import math
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from acp_sdk.models import ACPError, Error, ErrorCode
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+# === Admission control for ACP agent servers ===
+
+
+class AdmissionRejected(ACPError):
+    """Raised when a run can't be admitted because the agent is saturated."""
+
+    def __init__(self, agent_name: str, reason: str, retry_after: float):
+        super().__init__(
+            Error(
+                code=ErrorCode.SERVER_ERROR,
+                message=f"Agent '{agent_name}' is overloaded ({reason}), retry after {retry_after:.0f}s",
+            )
+        )
+        self.agent_name = agent_name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class PriorityClass:
+    """
+    A class of runs sharing an agent's slots with the other classes.
+
+    Args:
+        name (str): Class name clients send in the ACP-Priority header.
+        weight (float): Share of the slots this class gets while other classes also wait.
+        max_concurrency (int, optional): Cap on this class's running runs, e.g. to keep a slot free for interactive runs.
+        max_queue (int, optional): Runs of this class allowed to wait; defaults to the limiter's max_queue.
+    """
+    name: str
+    weight: float = 1.0
+    max_concurrency: Optional[int] = None
+    max_queue: Optional[int] = None
+
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+DEFAULT_CLASSES = [PriorityClass(INTERACTIVE, weight=8.0), PriorityClass(BATCH, weight=1.0)]
+PRIORITY_HEADER = "ACP-Priority"
+
+# Priority class of the current request, set by AdmissionMiddleware from the ACP-Priority header.
+# Runs execute in tasks created while handling POST /runs, so they inherit it.
+current_priority: ContextVar[Optional[str]] = ContextVar("current_priority", default=None)
+
+
+class _ClassQueue:
+    """Waiters and counters of one priority class on one agent."""
+
+    def __init__(self, spec: PriorityClass, max_queue: int):
+        self.spec = spec
+        self.max_queue = max_queue if spec.max_queue is None else spec.max_queue
+        self.waiters = deque()
+        self.last_finish = 0.0
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.avg_wait_seconds: Optional[float] = None
+        self.waits = deque(maxlen=256)
+
+    def can_run(self) -> bool:
+        return self.spec.max_concurrency is None or self.running < self.spec.max_concurrency
+
+    def head(self):
+        """The oldest waiter still waiting, dropping ones that were cancelled or timed out."""
+        while self.waiters and self.waiters[0][2].done():
+            self.waiters.popleft()
+        return self.waiters[0] if self.waiters else None
+
+    def record_wait(self, seconds: float) -> None:
+        self.waits.append(seconds)
+        self.avg_wait_seconds = _ewma(self.avg_wait_seconds, seconds)
+
+    def snapshot(self) -> Dict[str, object]:
+        waits = sorted(self.waits)
+        return {
+            "weight": self.spec.weight,
+            "max_concurrency": self.spec.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queue_depth": sum(1 for _, _, waiter in self.waiters if not waiter.done()),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": self.avg_wait_seconds,
+            "p95_wait_seconds": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else None,
+        }
+
+
+class AgentLimiter:
+    """
+    Concurrency limit plus bounded, priority-aware wait queues for a single agent.
+
+    At most `max_concurrency` runs execute at once, at most `max_queue` runs of
+    each priority class wait for a slot, and no run waits longer than
+    `max_queue_time` seconds. Anything beyond that is rejected straight away so
+    admitted runs keep a stable latency.
+
+    Freed slots go to waiting runs by weighted fair queuing: each waiter gets a
+    virtual finish tag of 1/weight past its class's previous one, and the
+    smallest tag runs next. With interactive at weight 8 and batch at 1, a
+    backlog of batch runs gets one slot in nine while interactive runs wait,
+    and every slot when they don't. FIFO order holds within a class.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int,
+        max_queue_time: float,
+        classes: Optional[List[PriorityClass]] = None,
+        default_class: str = INTERACTIVE,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+        self.classes = {spec.name: _ClassQueue(spec, max_queue) for spec in (classes or DEFAULT_CLASSES)}
+        self.default_class = default_class if default_class in self.classes else next(iter(self.classes))
+        self.running = 0
+        self._virtual_time = 0.0
+        self._sequence = 0
+        # Counters and moving averages exposed through /admission
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.avg_run_seconds: Optional[float] = None
+        self.avg_wait_seconds: Optional[float] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for queue in self.classes.values() for _, _, waiter in queue.waiters if not waiter.done())
+
+    def priority_of(self, priority: Optional[str] = None) -> str:
+        """The class a run belongs to: the requested one if known, else the agent's default."""
+        return priority if priority in self.classes else self.default_class
+
+    def is_full(self, priority: Optional[str] = None) -> bool:
+        """True when a new run of the class would be rejected without waiting."""
+        queue = self.classes[self.priority_of(priority)]
+        if self.running < self.max_concurrency and queue.can_run():
+            return False
+        return sum(1 for _, _, waiter in queue.waiters if not waiter.done()) >= queue.max_queue
+
+    def reject(self, priority: Optional[str] = None) -> None:
+        self.rejected += 1
+        self.classes[self.priority_of(priority)].rejected += 1
+
+    def retry_after(self) -> float:
+        """Estimate how long until a slot frees up for a newly arriving run."""
+        run_seconds = self.avg_run_seconds or 1.0
+        ahead = self.queue_depth + 1
+        return max(1.0, math.ceil(run_seconds * ahead / self.max_concurrency))
+
+    def _has_free_slot(self, queue: _ClassQueue) -> bool:
+        # Waiters held back by their own class's cap don't compete for the free slots
+        blocked = any(other.can_run() and other.head() is not None for other in self.classes.values())
+        return self.running < self.max_concurrency and queue.can_run() and not blocked
+
+    async def acquire(self, priority: Optional[str] = None) -> str:
+        """
+        Wait for a run slot or raise AdmissionRejected.
+
+        Returns:
+            str: The priority class the slot was taken in; pass it to `release`.
+        """
+        priority = self.priority_of(priority)
+        queue = self.classes[priority]
+        if self._has_free_slot(queue):
+            self._start(queue)
+            self._record_wait(queue, 0.0)
+            return priority
+
+        if sum(1 for _, _, waiter in queue.waiters if not waiter.done()) >= queue.max_queue:
+            self.reject(priority)
+            raise AdmissionRejected(self.name, "queue full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        finish = max(self._virtual_time, queue.last_finish) + 1.0 / queue.spec.weight
+        queue.last_finish = finish
+        self._sequence += 1
+        queue.waiters.append((finish, self._sequence, waiter))
+        self._dispatch()
+        started = time.monotonic()
+        try:
+            done, _ = await asyncio.wait({waiter}, timeout=self.max_queue_time)
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before we got cancelled
+            if waiter.done() and not waiter.cancelled():
+                self.release(priority)
+            else:
+                self._discard(queue, waiter)
+            raise
+
+        if not done:
+            self._discard(queue, waiter)
+            self.timed_out += 1
+            queue.timed_out += 1
+            raise AdmissionRejected(self.name, "queue timeout", self.retry_after())
+
+        self._record_wait(queue, time.monotonic() - started)
+        return priority
+
+    def release(self, priority: Optional[str] = None) -> None:
+        """Free the slot and hand free slots to waiters by weighted fair queuing."""
+        self.running -= 1
+        self.classes[self.priority_of(priority)].running -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_concurrency:
+            heads = [(queue.head(), queue) for queue in self.classes.values() if queue.can_run()]
+            heads = [(head, queue) for head, queue in heads if head is not None]
+            if not heads:
+                return
+            (finish, _, waiter), queue = min(heads, key=lambda item: item[0][:2])
+            queue.waiters.popleft()
+            self._virtual_time = finish
+            self._start(queue)
+            waiter.set_result(None)
+
+    def _start(self, queue: _ClassQueue) -> None:
+        self.running += 1
+        self.admitted += 1
+        queue.running += 1
+        queue.admitted += 1
+
+    def record_run(self, seconds: float) -> None:
+        self.avg_run_seconds = _ewma(self.avg_run_seconds, seconds)
+
+    def _record_wait(self, queue: _ClassQueue, seconds: float) -> None:
+        self.avg_wait_seconds = _ewma(self.avg_wait_seconds, seconds)
+        queue.record_wait(seconds)
+
+    def _discard(self, queue: _ClassQueue, waiter: asyncio.Future) -> None:
+        waiter.cancel()
+        for entry in queue.waiters:
+            if entry[2] is waiter:
+                queue.waiters.remove(entry)
+                break
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "running": self.running,
+            "queue_depth": self.queue_depth,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "max_queue_time": self.max_queue_time,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_run_seconds": self.avg_run_seconds,
+            "avg_wait_seconds": self.avg_wait_seconds,
+            "retry_after": self.retry_after(),
+            "default_class": self.default_class,
+            "classes": {name: queue.snapshot() for name, queue in self.classes.items()},
+        }
+
+
+def _ewma(previous: Optional[float], value: float, alpha: float = 0.2) -> float:
+    return value if previous is None else (1 - alpha) * previous + alpha * value
+
+
+class AdmissionController:
+    """
+    Per-agent admission control for an ACP server.
+
+    Decorate agent functions with `limit()` (below `@server.agent()`) and pass the
+    controller to `serving.serve` so overloaded agents are rejected with HTTP 429
+    and a Retry-After header before a run is even created. Queue depth and
+    counters are served on GET /admission.
+
+    Runs are tagged with a priority class through the ACP-Priority request
+    header ("interactive" or "batch" by default); untagged runs take the
+    agent's default class. Classes share an agent's slots by weight, so
+    interactive latency holds while batch work soaks up spare capacity.
+
+    Args:
+        max_concurrency (int): Default number of runs executing at once per agent.
+        max_queue (int): Default number of runs allowed to wait for a slot.
+        max_queue_time (float): Default seconds a run may wait before being rejected.
+        classes (List[PriorityClass], optional): Priority classes of every agent; interactive and batch by default.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_queue: int = 16,
+        max_queue_time: float = 30.0,
+        classes: Optional[List[PriorityClass]] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+        self.classes = classes or DEFAULT_CLASSES
+        self.limiters: Dict[str, AgentLimiter] = {}
+        self.exemptions: List[Callable[[str, Dict[str, Any]], bool]] = []
+
+    def limiter(
+        self,
+        name: str,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_queue_time: Optional[float] = None,
+        priority: str = INTERACTIVE,
+    ) -> AgentLimiter:
+        if name not in self.limiters:
+            self.limiters[name] = AgentLimiter(
+                name,
+                max_concurrency=max_concurrency or self.max_concurrency,
+                max_queue=self.max_queue if max_queue is None else max_queue,
+                max_queue_time=max_queue_time or self.max_queue_time,
+                classes=self.classes,
+                default_class=priority,
+            )
+        return self.limiters[name]
+
+    def limit(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_queue_time: Optional[float] = None,
+        name: Optional[str] = None,
+        priority: str = INTERACTIVE,
+    ) -> Callable:
+        """
+        Decorator limiting an async generator agent function.
+
+        The agent name defaults to the function name, matching `@server.agent()`.
+        `priority` is the class of runs that don't send an ACP-Priority header.
+        """
+
+        def decorator(fn: Callable) -> Callable:
+            limiter = self.limiter(name or fn.__name__, max_concurrency, max_queue, max_queue_time, priority)
+
+            @functools.wraps(fn)
+            async def wrapper(*args):
+                priority = await limiter.acquire(current_priority.get())
+                started = time.monotonic()
+                try:
+                    async for item in fn(*args):
+                        yield item
+                finally:
+                    limiter.record_run(time.monotonic() - started)
+                    limiter.release(priority)
+
+            return wrapper
+
+        return decorator
+
+    def exempt(self, predicate: Callable[[str, Dict[str, Any]], bool]) -> None:
+        """
+        Let POST /runs through the fast-reject middleware when `predicate(agent_name, payload)`
+        is true, e.g. for runs that will join an in-flight one instead of taking a slot.
+        """
+        self.exemptions.append(predicate)
+
+    def is_exempt(self, agent_name: str, payload: Dict[str, Any]) -> bool:
+        return any(predicate(agent_name, payload) for predicate in self.exemptions)
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        return {name: limiter.snapshot() for name, limiter in self.limiters.items()}
+
+    def install(self, app: FastAPI) -> None:
+        """Add fast-reject middleware and the /admission metrics route to an ACP app."""
+        app.add_middleware(AdmissionMiddleware, controller=self)
+
+        @app.get("/admission")
+        async def read_admission() -> Dict[str, Dict[str, object]]:
+            return self.snapshot()
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware rejecting POST /runs for saturated agents before the run is created.
+
+    It also reads the run's priority class from the ACP-Priority header.
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"].rstrip("/") != "/runs":
+            await self.app(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        payload = _payload(body)
+        agent_name = payload.get("agent_name")
+        priority = _header(scope, PRIORITY_HEADER)
+        current_priority.set(priority.strip().lower() if priority else None)
+        limiter = self.controller.limiters.get(agent_name)
+        if (
+            limiter is not None
+            and limiter.is_full(current_priority.get())
+            and not self.controller.is_exempt(agent_name, payload)
+        ):
+            limiter.reject(current_priority.get())
+            retry_after = limiter.retry_after()
+            error = Error(
+                code=ErrorCode.SERVER_ERROR,
+                message=f"Agent '{limiter.name}' is overloaded (queue full), retry after {retry_after:.0f}s",
+            )
+            response = JSONResponse(
+                status_code=429,
+                content=error.model_dump(mode="json"),
+                headers={"Retry-After": str(int(retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, _replay_body(body, receive), send)
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+def _replay_body(body: bytes, receive):
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+
+def _header(scope, name: str) -> Optional[str]:
+    name = name.lower().encode()
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _payload(body: bytes) -> Dict[str, Any]:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
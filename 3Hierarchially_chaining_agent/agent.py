@@ -1,25 +1,51 @@
 import asyncio 
+from contextlib import AsyncExitStack
 import nest_asyncio
 from acp_sdk.client import Client
-from smolagents import LiteLLMModel
 from fastacp import AgentCollection, ACPCallingAgent
+from compression import ContextCompressor
+from workflow import Step, Workflow
+from circuit import GuardedClient
+from replicas import ReplicaSet
+from run_store import DetachedClient
+from wire_compression import CompressingTransport
 from colorama import Fore
+from warmup import lazy_import
 from dotenv import load_dotenv
 load_dotenv()
 import os
 os.environ['OPENAI_API_KEY']=os.getenv('OPENAI_API_KEY')
-model = LiteLLMModel(
-    model_id="openai/gpt-4"
-)
+# Comma-separated base URLs of the server replicas; calls are balanced across them
+INSURER_URLS = os.getenv("INSURER_URLS", "http://localhost:8001").split(",")
+HOSPITAL_URLS = os.getenv("HOSPITAL_URLS", "http://localhost:8000").split(",")
+# Only the (commented out) FastACP orchestration needs smolagents; don't pay for its import otherwise
+smolagents = lazy_import("smolagents")
+
+def get_model():
+    return smolagents.LiteLLMModel(
+        model_id="openai/gpt-4"
+    )
+
+async def connect(stack: AsyncExitStack, url: str) -> GuardedClient:
+    """
+    Client for one server replica. Runs are submitted asynchronously and long-polled instead of
+    holding a connection for a minute, and a health-probed circuit breaker fails calls fast while
+    the server is down or overloaded.
+    """
+    # Large contexts are gzipped for servers that run with WIRE_COMPRESSION_MIN_BYTES set
+    client = await stack.enter_async_context(Client(base_url=url, transport=CompressingTransport()))
+    return await stack.enter_async_context(GuardedClient(DetachedClient(client)))
 
 async def run_hospital_workflow() -> None:
     try:
-        async with Client(base_url="http://localhost:8001") as insurer, Client(base_url="http://localhost:8000") as hospital:
+        async with AsyncExitStack() as stack:
+            insurers = [await connect(stack, url) for url in INSURER_URLS]
+            hospitals = [await connect(stack, url) for url in HOSPITAL_URLS]
             print(f"{Fore.CYAN}🔍 Discovering agents...{Fore.RESET}")
             
-            # agents discovery
-            agent_collection = await AgentCollection.from_acp(insurer, hospital)  
-            acp_agents = {agent.name: {'agent':agent, 'client':client} for client, agent in agent_collection.agents}
+            # agents discovery; agents served by several replicas are grouped, not overwritten
+            agent_collection = await AgentCollection.from_acp(*insurers, *hospitals)  
+            acp_agents = agent_collection.replica_sets()
             
             print(f"{Fore.GREEN}✅ Found agents: {list(acp_agents.keys())}{Fore.RESET}")
             print(f"Agent details: {acp_agents}")
@@ -27,7 +53,7 @@ async def run_hospital_workflow() -> None:
             # Skip FastACP orchestration due to compatibility issues with LiteLLM
             # Fallback to direct sequential agent calls which work reliably
             
-            result = await run_direct_agent_calls(insurer, hospital)
+            result = await run_direct_agent_calls(insurers, hospitals)
             print(f"{Fore.YELLOW}✨ Direct Call Result: {result}{Fore.RESET}")
             
             # Uncomment below to try FastACP orchestration if issues are resolved
@@ -35,7 +61,12 @@ async def run_hospital_workflow() -> None:
             #     print(f"{Fore.CYAN}🤖 Attempting FastACP orchestration...{Fore.RESET}")
             #     
             #     # passing the agents as tools to ACPCallingAgent
-            #     acpagent = ACPCallingAgent(acp_agents=acp_agents, model=model)
+            #     # single-agent queries skip LLM planning (from routing import AgentRouter), recurring
+            #     # multi-agent ones follow a cached plan (from plan_cache import PlanCache)
+            #     acpagent = ACPCallingAgent(
+            #         acp_agents=acp_agents, model=get_model(), router=AgentRouter(),
+            #         plan_cache=PlanCache(path=".cache/plans.json"),
+            #     )
             #     print("acp agent created---")
             #     # running the agent with a user query
             #     result = await acpagent.run("do i need rehabilitation after a shoulder reconstruction and what is the waiting period from my insurance?")
@@ -46,7 +77,7 @@ async def run_hospital_workflow() -> None:
             #     print(f"{Fore.CYAN}🔄 Falling back to direct agent calls...{Fore.RESET}")
             #     
             #     # Fallback to direct sequential agent calls
-            #     result = await run_direct_agent_calls(insurer, hospital)
+            #     result = await run_direct_agent_calls(insurers, hospitals)
             #     print(f"{Fore.YELLOW}✨ Direct Call Result: {result}{Fore.RESET}")
                 
     except Exception as e:
@@ -54,53 +85,66 @@ async def run_hospital_workflow() -> None:
         import traceback
         traceback.print_exc()
 
-async def run_direct_agent_calls(insurer, hospital):
-    """Fallback method using direct agent calls"""
-    try:
-        # Step 1: Get health information
-        print(f"{Fore.CYAN}🏥 Step 1: Consulting health agent...{Fore.RESET}")
-        
-        health_query = "Do I need rehabilitation after a shoulder reconstruction? What does the rehabilitation process involve and how long does it typically take?"
-        
-        health_response = await hospital.run_sync(
-            agent="health_agent",
-            input=health_query
-        )
-        
-        # Extract health content safely
-        if hasattr(health_response, 'output') and health_response.output:
-            health_content = health_response.output[0].parts[0].content
-        elif hasattr(health_response, 'messages') and health_response.messages:
-            health_content = health_response.messages[0].parts[0].content
-        else:
-            health_content = str(health_response)
+# Health consultation feeds the insurance question; add independent steps here
+# and they run concurrently with this chain. The insurance step is prefetched
+# speculatively with the raw question and refined only if the answer is vague.
+# The health answer is compressed to what matters for the insurance question.
+context_compressor = ContextCompressor(max_tokens=300)
+
+consultation_workflow = Workflow([
+    Step(
+        name="health",
+        client="hospital",
+        agent="health_agent",
+        prompt="{health_query}",
+    ),
+    Step(
+        name="insurance",
+        client="insurer",
+        agent="policy_agent",
+        prompt="""
+        Context: {health}
         
-        print(f"{Fore.GREEN}✅ Health consultation completed{Fore.RESET}")
+        Based on the above medical information about shoulder reconstruction rehabilitation, 
+        what is the waiting period for my insurance coverage? What are the coverage details?
+        """,
+        depends_on=["health"],
+        speculate="What is the waiting period and coverage for rehabilitation after a shoulder reconstruction?",
+        refine="""
+        Your earlier answer: {speculative}
         
-        # Step 2: Get insurance information with health context
-        print(f"{Fore.CYAN}🏛️ Step 2: Consulting insurance agent...{Fore.RESET}")
+        Medical context: {health}
         
-        insurance_query = f"""
-        Context: {health_content}
+        Correct the waiting period and coverage details if this context changes them.
+        """,
+        compressor=context_compressor,
+    ),
+])
+
+async def run_direct_agent_calls(insurers, hospitals):
+    """Fallback method using direct agent calls"""
+    try:
+        print(f"{Fore.CYAN}🏥 Consulting health agent, then insurance agent...{Fore.RESET}")
         
-        Based on the above medical information about shoulder reconstruction rehabilitation, 
-        what is the waiting period for my insurance coverage? What are the coverage details?
-        """
+        health_query = "Do I need rehabilitation after a shoulder reconstruction? What does the rehabilitation process involve and how long does it typically take?"
         
-        insurance_response = await insurer.run_sync(
-            agent="policy_agent",
-            input=insurance_query
+        # Each run goes to the available replica with the fewest runs outstanding
+        insurer = ReplicaSet(insurers)
+        hospital = ReplicaSet(hospitals)
+        result = await consultation_workflow.run(
+            {"insurer": insurer, "hospital": hospital},
+            speculative=True,
+            health_query=health_query
         )
+        print(result.timings())
+        print(context_compressor.summary())
+        print(f"Replicas: insurer {insurer.snapshot()}, hospital {hospital.snapshot()}")
+        if not result.ok:
+            failed = {name: step.error for name, step in result.steps.items() if step.error}
+            return f"Error in direct agent calls: {failed}"
         
-        # Extract insurance content safely
-        if hasattr(insurance_response, 'output') and insurance_response.output:
-            insurance_content = insurance_response.output[0].parts[0].content
-        elif hasattr(insurance_response, 'messages') and insurance_response.messages:
-            insurance_content = insurance_response.messages[0].parts[0].content
-        else:
-            insurance_content = str(insurance_response)
-        
-        print(f"{Fore.GREEN}✅ Insurance consultation completed{Fore.RESET}")
+        health_content = result.outputs["health"]
+        insurance_content = result.outputs["insurance"]
         
         # Combine results
         combined_result = f"""
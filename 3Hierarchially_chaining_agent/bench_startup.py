@@ -0,0 +1,100 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+# === Startup-time benchmark for ACP server entry points ===
+#
+# For each entry point this measures, over several cold starts:
+#   import  - importing the module (module-level code, no server)
+#   listen  - process start until GET /agents answers
+#   ready   - process start until GET /ready answers 200 (same as listen for
+#             servers without a readiness endpoint)
+#
+#   python bench_startup.py
+#   python bench_startup.py ../4Acp_with_MCP_Project/smol_agent_server.py:8000 --runs 5
+
+DEFAULT_ENTRY_POINTS = [
+    "crewaiInsurance_agent.py:8001",
+    "smol_health_agent.py:8000",
+    "../2sequentialAgent_health_insurer_acp/crewAiInsurerservice_server.py:8001",
+    "../2sequentialAgent_health_insurer_acp/langgraph_hospital_server.py:8002",
+]
+
+
+def measure_import(path: str) -> float:
+    module = os.path.splitext(os.path.basename(path))[0]
+    code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=os.path.dirname(path) or ".", capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_start(path: str, port: int, timeout: float) -> Dict[str, Optional[float]]:
+    """Start the server, poll until it listens and until it is ready, then stop it."""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.basename(path)],
+        cwd=os.path.dirname(path) or ".",
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    listen = ready = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while time.perf_counter() - started < timeout and process.poll() is None:
+                try:
+                    if listen is None and client.get("/agents").status_code == 200:
+                        listen = time.perf_counter() - started
+                    if listen is not None:
+                        status = client.get("/ready").status_code
+                        if status in (200, 404):
+                            ready = time.perf_counter() - started if status == 200 else listen
+                            break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.05)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {"listen": listen, "ready": ready}
+
+
+def _median(values: List[Optional[float]]) -> str:
+    values = [value for value in values if value is not None]
+    return f"{statistics.median(values):.2f}" if values else "-"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure cold-start time of ACP server entry points")
+    parser.add_argument("entry_points", nargs="*", default=DEFAULT_ENTRY_POINTS, help="path/to/server.py:port")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds to wait for readiness")
+    args = parser.parse_args()
+
+    print(f"{'entry point':<50}{'import':>9}{'listen':>9}{'ready':>9}   (median seconds of {args.runs} runs)")
+    for entry_point in args.entry_points:
+        path, port = entry_point.rsplit(":", 1)
+        imports, listens, readies = [], [], []
+        for _ in range(args.runs):
+            try:
+                imports.append(measure_import(path))
+            except subprocess.CalledProcessError:
+                imports.append(None)
+            timings = measure_start(path, int(port), args.timeout)
+            listens.append(timings["listen"])
+            readies.append(timings["ready"])
+        print(f"{entry_point:<50}{_median(imports):>9}{_median(listens):>9}{_median(readies):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import random
+import socket
+import statistics
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+from acp_sdk.client import Client
+from acp_sdk.models import Message, MessagePart
+from acp_sdk.server import Server
+
+from serving import build_app
+from wire_compression import CompressingTransport, WireCompression
+
+# === Wire compression benchmark ===
+#
+# Starts an in-process ACP server whose agent answers with the context it was
+# given (like policy_agent receiving the health answer and a sub-agent's long
+# output returning to the orchestrator) and, for each context size and link,
+# compares plain and compressed transport: bytes on the wire each way and
+# median run_sync latency. Slow links are simulated on the client by delaying
+# every request and response by half the round trip plus its bytes over the
+# bandwidth.
+#
+#   python bench_wire.py
+#   python bench_wire.py --sizes 4000 64000 --links loopback 10mbit --repeat 20
+
+# name -> (bandwidth in bytes per second, round trip in seconds); None is unthrottled loopback
+LINKS = {
+    "loopback": None,
+    "100mbit": (100e6 / 8, 0.005),
+    "10mbit": (10e6 / 8, 0.02),
+    "2mbit": (2e6 / 8, 0.06),
+}
+
+WORDS = (
+    "rehabilitation shoulder reconstruction physiotherapy surgeon recovery weeks months patient hospital "
+    "policy coverage waiting period benefit claim exclusion premium member extras hospital cover limit "
+    "the a of to and in is for with on that your you may after before during each per under will be "
+    "exercises range motion strength sling pain swelling appointment specialist referral outpatient "
+    "inpatient procedure item number schedule fee rebate gap amount approved provider network"
+).split()
+
+
+def synthetic_context(size: int, seed: int = 3) -> str:
+    """Prose-like text of about `size` characters with a realistic word distribution."""
+    rng = random.Random(seed)
+    sentences = []
+    length = 0
+    while length < size:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 24))]
+        sentence = " ".join(words).capitalize() + ". "
+        sentences.append(sentence)
+        length += len(sentence)
+    return "".join(sentences)[:size]
+
+
+class SlowLink(httpx.AsyncBaseTransport):
+    """Client-side link simulation that also counts the raw bytes sent and received."""
+
+    def __init__(self, link: Optional[tuple]):
+        self.transport = httpx.AsyncHTTPTransport()
+        self.link = link
+        self.sent = 0
+        self.received = 0
+
+    async def _delay(self, size: int) -> None:
+        if self.link:
+            bandwidth, rtt = self.link
+            await asyncio.sleep(rtt / 2 + size / bandwidth)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        self.sent += len(body)
+        await self._delay(len(body))
+        response = await self.transport.handle_async_request(request)
+        # Raw bytes as they came over the wire, still compressed
+        raw = b"".join([chunk async for chunk in response.aiter_raw()])
+        await response.aclose()
+        self.received += len(raw)
+        await self._delay(len(raw))
+        return httpx.Response(
+            response.status_code, headers=response.headers, content=raw, extensions=response.extensions
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def echo_server() -> Server:
+    server = Server()
+
+    @server.agent()
+    async def echo_agent(input: List[Message]):
+        "Answers with the context it was given."
+        yield Message(parts=[MessagePart(content=str(input[0].parts[0].content))])
+
+    return server
+
+
+def start_server(port: int, minimum_size: int, level: int) -> uvicorn.Server:
+    app = build_app(echo_server(), WireCompression(minimum_size=minimum_size, level=level))
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def measure(
+    url: str, text: str, link: Optional[tuple], compress: bool, repeat: int, minimum_size: int, level: int
+) -> Dict[str, float]:
+    wire = SlowLink(link)
+    transport = CompressingTransport(wire, minimum_size=minimum_size, level=level) if compress else wire
+    headers = None if compress else {"Accept-Encoding": "identity"}
+    async with Client(base_url=url, transport=transport, headers=headers, timeout=120) as client:
+        # Discovery first, so the client learns whether the server takes compressed bodies
+        [agent async for agent in client.agents()]
+        timings = []
+        sent = received = 0
+        for _ in range(repeat + 1):
+            wire.sent = wire.received = 0
+            started = time.perf_counter()
+            run = await client.run_sync(text, agent="echo_agent")
+            timings.append(time.perf_counter() - started)
+            assert run.output[0].parts[0].content == text
+            sent, received = wire.sent, wire.received
+    # The first run warms up connections and is left out
+    return {"sent": sent, "received": received, "ms": statistics.median(timings[1:]) * 1000}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark compressed ACP transport on large contexts")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2_000, 16_000, 128_000], help="Context characters")
+    parser.add_argument("--links", nargs="+", default=list(LINKS), choices=list(LINKS))
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per case (median is reported)")
+    parser.add_argument("--minimum-size", type=int, default=1024, help="Compression threshold in bytes")
+    parser.add_argument("--level", type=int, default=1, help="gzip level on both ends")
+    args = parser.parse_args()
+
+    port = free_port()
+    start_server(port, args.minimum_size, args.level)
+    url = f"http://127.0.0.1:{port}"
+
+    print(f"{'context':>8} {'link':>9} {'plain up':>10} {'gzip up':>10} {'plain down':>11} {'gzip down':>10}"
+          f" {'plain ms':>9} {'gzip ms':>9}")
+    for size in args.sizes:
+        text = synthetic_context(size)
+        for name in args.links:
+            results: Dict[bool, Dict[str, float]] = {
+                compress: asyncio.run(
+                    measure(url, text, LINKS[name], compress, args.repeat, args.minimum_size, args.level)
+                )
+                for compress in (False, True)
+            }
+            plain, packed = results[False], results[True]
+            print(f"{size:>8} {name:>9} {plain['sent']:>10} {packed['sent']:>10} {plain['received']:>11}"
+                  f" {packed['received']:>10} {plain['ms']:>9.1f} {packed['ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
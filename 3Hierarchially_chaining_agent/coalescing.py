@@ -0,0 +1,162 @@
+import asyncio
+import functools
+import hashlib
+from typing import Any, Callable, Dict, List, Optional
+
+from acp_sdk.models import Message
+from fastapi import FastAPI
+
+from admission import AdmissionController
+
+# === Single-flight coalescing of identical runs ===
+#
+# When the same question arrives many times at once, only the first run (the
+# leader) executes the agent. Runs with the same agent and normalised input
+# that arrive while it is in flight subscribe to it and receive every message
+# it yields. Nothing is kept once the leader finishes: this is not a cache.
+
+
+def normalize_input(texts: List[str]) -> str:
+    """Collapse whitespace and case so trivially different inputs coalesce."""
+    return "\n".join(" ".join(text.split()).casefold() for text in texts)
+
+
+def flight_key(agent_name: str, texts: List[str]) -> str:
+    return hashlib.sha256(f"{agent_name}\0{normalize_input(texts)}".encode("utf-8")).hexdigest()
+
+
+def message_texts(messages: List[Message]) -> List[str]:
+    return [str(part.content or "") for message in messages for part in message.parts]
+
+
+def payload_texts(payload: Dict[str, Any]) -> List[str]:
+    """The same texts as message_texts, read from a raw POST /runs body."""
+    return [
+        str(part.get("content") or "")
+        for message in payload.get("input") or []
+        for part in message.get("parts") or []
+    ]
+
+
+class _Flight:
+    """One in-flight execution and the messages it has yielded so far."""
+
+    def __init__(self, agent_name: str):
+        self.agent_name = agent_name
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def publish(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def follow(self):
+        position = 0
+        while True:
+            changed = self.changed
+            while position < len(self.items):
+                yield self.items[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical runs of ACP agents.
+
+    Decorate agent functions with `coalesce()` directly below `@server.agent()`
+    (above `admission.limit`, so followers don't take run slots) and pass the
+    instance to `serving.serve` to expose counters on GET /coalescing. Agents
+    that ask the client for input mid-run must not be coalesced.
+
+    Args:
+        admission (AdmissionController, optional): Controller whose fast-reject
+            middleware should let through runs that would join an in-flight one.
+    """
+
+    def __init__(self, admission: Optional[AdmissionController] = None):
+        self.flights: Dict[str, _Flight] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        if admission is not None:
+            admission.exempt(self.is_in_flight)
+
+    def is_in_flight(self, agent_name: str, payload: Dict[str, Any]) -> bool:
+        return flight_key(agent_name, payload_texts(payload)) in self.flights
+
+    def coalesce(self, name: Optional[str] = None) -> Callable:
+        """
+        Decorator coalescing an async generator agent function.
+
+        The agent name defaults to the function name, matching `@server.agent()`.
+        """
+
+        def decorator(fn: Callable) -> Callable:
+            agent_name = name or fn.__name__
+            stats = self.stats.setdefault(agent_name, {"executions": 0, "collapsed": 0})
+
+            @functools.wraps(fn)
+            async def wrapper(input: List[Message], *args):
+                key = flight_key(agent_name, message_texts(input))
+                flight = self.flights.get(key)
+                if flight is None:
+                    flight = self.flights[key] = _Flight(agent_name)
+                    flight.task = asyncio.create_task(self._drive(key, flight, fn(input, *args)))
+                    stats["executions"] += 1
+                else:
+                    stats["collapsed"] += 1
+                flight.subscribers += 1
+                try:
+                    async for item in flight.follow():
+                        yield item
+                finally:
+                    flight.subscribers -= 1
+                    if not flight.subscribers and not flight.done:
+                        # Every caller went away: stop paying for the run
+                        flight.task.cancel()
+                        if self.flights.get(key) is flight:
+                            del self.flights[key]
+
+            return wrapper
+
+        return decorator
+
+    async def _drive(self, key: str, flight: _Flight, generator) -> None:
+        """Run the leader's generator, publishing each yielded item to all subscribers."""
+        try:
+            async for item in generator:
+                flight.items.append(item)
+                flight.publish()
+        except Exception as e:
+            # Re-raised in every subscriber rather than left on the task
+            flight.error = e
+        finally:
+            flight.done = True
+            self.flights.pop(key, None)
+            flight.publish()
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """Per agent: executions started, runs collapsed onto one, and what is in flight now."""
+        snapshot = {}
+        for name, counts in self.stats.items():
+            flights = [flight for flight in self.flights.values() if flight.agent_name == name]
+            snapshot[name] = {
+                **counts,
+                "in_flight": len(flights),
+                "subscribers": sum(flight.subscribers for flight in flights),
+            }
+        return snapshot
+
+    def install(self, app: FastAPI) -> None:
+        """Add the /coalescing metrics route to an ACP app."""
+
+        @app.get("/coalescing")
+        async def read_coalescing() -> Dict[str, Dict[str, int]]:
+            return self.snapshot()
@@ -0,0 +1,199 @@
+import functools
+import re
+import statistics
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+
+# === Context compression between chained agents ===
+#
+# Forwarding a whole upstream answer as "Context: ..." makes every downstream
+# prompt as long as the longest answer. The compressor keeps only the sentences
+# most relevant to the downstream question, in their original order, under a
+# hard token budget. Selection is extractive and local: no model call.
+
+STOPWORDS = {
+    "a", "about", "after", "all", "also", "am", "an", "and", "any", "are", "as", "at", "be", "been", "but", "by",
+    "can", "could", "do", "does", "for", "from", "had", "has", "have", "how", "i", "if", "in", "into", "is", "it",
+    "its", "may", "me", "my", "of", "on", "or", "should", "so", "that", "the", "their", "them", "there", "these",
+    "they", "this", "to", "was", "we", "were", "what", "when", "which", "will", "with", "would", "you", "your",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _encoder() -> Optional[Any]:
+    """The cl100k tokenizer, loaded on first use: importing tiktoken is slow and it may download the encoding."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken missing or its encoding file can't be fetched: estimate instead
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with the OpenAI cl100k tokenizer, or a ~4 characters per token estimate without it."""
+    encoder = _encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return (len(text) + 3) // 4
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split on sentence punctuation and line breaks; bullet and numbered lines count as sentences."""
+    pieces = re.split(r"(?<=[.!?])\s+|\n+", text)
+    return [piece.strip() for piece in pieces if piece.strip()]
+
+
+def content_words(text: str) -> List[str]:
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS and len(word) > 1]
+
+
+@dataclass
+class CompressionReport:
+    """What one compression did."""
+    original_tokens: int
+    compressed_tokens: int
+    sentences_kept: int
+    sentences_total: int
+    seconds: float
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.original_tokens - self.compressed_tokens
+
+
+class ContextCompressor:
+    """
+    Extractive, query-aware compression of an upstream agent's output.
+
+    Sentences are scored by the (idf-weighted) downstream-question words they
+    contain, with a small bonus for sentences containing figures (durations,
+    amounts) and for the opening sentence, which usually states the answer.
+    The best sentences are kept in document order until the budget is reached.
+
+    Args:
+        max_tokens (int): Hard token budget for the compressed context.
+        min_tokens (int): Texts at or under this size are passed through untouched.
+    """
+
+    def __init__(self, max_tokens: int = 300, min_tokens: int = 0):
+        self.max_tokens = max_tokens
+        self.min_tokens = max(min_tokens, 0)
+        self.reports: List[CompressionReport] = []
+
+    def compress(self, text: str, question: str) -> str:
+        """
+        Compress `text` for a downstream prompt about `question`.
+
+        Args:
+            text (str): Upstream agent output.
+            question (str): The downstream question or prompt the context is for.
+
+        Returns:
+            str: The selected sentences, never more than max_tokens tokens.
+        """
+        started = time.perf_counter()
+        original_tokens = count_tokens(text)
+        sentences = split_sentences(text)
+        if original_tokens <= max(self.max_tokens, self.min_tokens):
+            compressed, kept = text, len(sentences)
+        else:
+            compressed, kept = self._select(sentences, question)
+        report = CompressionReport(
+            original_tokens=original_tokens,
+            compressed_tokens=count_tokens(compressed),
+            sentences_kept=kept,
+            sentences_total=len(sentences),
+            seconds=time.perf_counter() - started,
+        )
+        self.reports.append(report)
+        return compressed
+
+    def _select(self, sentences: List[str], question: str):
+        words = [set(content_words(sentence)) for sentence in sentences]
+        document_frequency = Counter(word for sentence_words in words for word in sentence_words)
+        query = set(content_words(question))
+        total = len(sentences)
+
+        def score(i: int) -> float:
+            overlap = sum(
+                1.0 + (total / document_frequency[word]) ** 0.5 for word in words[i] & query
+            )
+            figures = 0.5 if re.search(r"\d", sentences[i]) else 0.0
+            opening = 0.5 if i == 0 else 0.0
+            return overlap + figures + opening
+
+        ranked = sorted(range(total), key=lambda i: (-score(i), i))
+        chosen, used, seen = [], 0, set()
+        for i in ranked:
+            if sentences[i] in seen:
+                continue
+            cost = count_tokens(sentences[i]) + 1
+            if used + cost > self.max_tokens:
+                continue
+            chosen.append(i)
+            seen.add(sentences[i])
+            used += cost
+        if not chosen and sentences:
+            # Even the best sentence is over budget: hard-truncate it
+            best = sentences[ranked[0]]
+            return self._truncate(best), 1
+        return " ".join(sentences[i] for i in sorted(chosen)), len(chosen)
+
+    def _truncate(self, text: str) -> str:
+        encoder = _encoder()
+        if encoder is not None:
+            return encoder.decode(encoder.encode(text)[:self.max_tokens])
+        return text[:self.max_tokens * 4]
+
+    def summary(self) -> str:
+        """Totals over every compression done by this compressor."""
+        original = sum(report.original_tokens for report in self.reports)
+        saved = sum(report.tokens_saved for report in self.reports)
+        seconds = sum(report.seconds for report in self.reports)
+        ratio = saved / original if original else 0.0
+        return (
+            f"{len(self.reports)} contexts compressed: {original} -> {original - saved} tokens "
+            f"({saved} saved, {ratio:.0%}) in {seconds * 1000:.1f}ms"
+        )
+
+
+async def measure_latency_delta(
+    call: Callable[[str], Any],
+    template: str,
+    context: str,
+    question: str,
+    compressor: ContextCompressor,
+    runs: int = 3,
+) -> dict:
+    """
+    Time a downstream agent call with the full and with the compressed context.
+
+    Args:
+        call (callable): Async function sending a prompt to the downstream agent.
+        template (str): Prompt template with a {context} placeholder.
+        context (str): Upstream output to forward.
+        question (str): Downstream question used for compression.
+        compressor (ContextCompressor): Compressor under test.
+        runs (int): Calls per variant; medians are reported.
+
+    Returns:
+        dict: Token counts and median latencies of both variants, and their difference.
+    """
+    compressed = compressor.compress(context, question)
+    latencies = {"full": [], "compressed": []}
+    for _ in range(runs):
+        for variant, text in (("full", context), ("compressed", compressed)):
+            started = time.perf_counter()
+            await call(template.replace("{context}", text))
+            latencies[variant].append(time.perf_counter() - started)
+    full, short = statistics.median(latencies["full"]), statistics.median(latencies["compressed"])
+    return {
+        "full_tokens": count_tokens(context),
+        "compressed_tokens": count_tokens(compressed),
+        "full_seconds": full,
+        "compressed_seconds": short,
+        "latency_delta_seconds": full - short,
+    }
@@ -1,10 +1,24 @@
+import asyncio
+import functools
 from collections.abc import AsyncGenerator
 from acp_sdk.models import Message, MessagePart
 from acp_sdk.server import RunYield, RunYieldResume, Server
 
-from crewai import Crew, Task, Agent, LLM
-from crewai_tools import RagTool
 import nest_asyncio
+from pydantic import BaseModel
+from admission import BATCH, AdmissionController
+from coalescing import SingleFlight
+from embedding_cache import EmbeddingCache
+from ingestion import IngestionPipeline
+from policy_index import ContextGroup, PolicyIndex
+from run_store import SqliteStore
+from serving import build_app, serve, serve_workers
+from wire_compression import WireCompression
+from warmup import Warmup, force_import, lazy_import
+
+# Imported on first use (or during warmup) so the server binds its port at once
+crewai = lazy_import("crewai")
+litellm = lazy_import("litellm")
 
 nest_asyncio.apply()
 from dotenv import load_dotenv
@@ -12,54 +26,177 @@ load_dotenv()
 import os
 os.environ['OPENAI_API_KEY'] = os.getenv('OPENAI_API_KEY')
 server = Server()
-llm = LLM(model="openai/gpt-4", max_tokens=1024)
-
-config = {
-    "llm": {
-        "provider": "openai",
-        "config": {
-            "model": "gpt-4",
-        }
-    },
-    "embedding_model": {
-        "provider": "openai",
-        "config": {
-            "model": "text-embedding-ada-002"
-        }
-    }
-}
-rag_tool = RagTool(config=config,  
-                   chunk_size=1200,       
-                   chunk_overlap=200,     
-                  )
-rag_tool.add("data/gold-hospital-and-premium-extras.pdf", data_type="pdf_file")
+admission = AdmissionController()
+single_flight = SingleFlight(admission)
+LLM_MODEL = "openai/gpt-4"
+
+
+@functools.lru_cache(maxsize=None)
+def get_llm():
+    return crewai.LLM(model=LLM_MODEL, max_tokens=1024)
+
+# Chunks are indexed for BM25 and embedded once; lookups with confident
+# lexical matches skip the remote embedding call entirely, and repeated
+# queries are served from the embedding cache
+embedding_cache = EmbeddingCache(max_entries=10000, path=".cache/embeddings.sqlite")
+policy_index = PolicyIndex(
+    embedding_model="text-embedding-ada-002", chunk_size=1200, chunk_overlap=200, cache=embedding_cache
+)
+# Every PDF under data/ is indexed during warmup and re-synced while the server
+# runs; only new or changed documents are parsed and embedded
+ingestion = IngestionPipeline(policy_index, data_dir="data", cache_dir=".cache/ingest", sync_on_start=False)
+BATCH_TOP_K = 4
+BATCH_PARALLELISM = 4
+# Questions sharing retrieved chunks are answered by one crew from one copy of them
+BATCH_GROUP_QUESTIONS = 4
+BATCH_GROUP_CHUNKS = 8
+# ACP_WORKERS > 1 serves from that many processes; the index is then ingested
+# once by the parent and memory-mapped read-only by every worker
+WORKERS = int(os.getenv("ACP_WORKERS", "1"))
+# Runs and their results persist here, so async submissions can be collected
+# later from any worker, even after a restart
+run_store = SqliteStore(".cache/runs/insurer.sqlite")
+
+
+@functools.lru_cache(maxsize=None)
+def get_policy_search_tool():
+    # policy_tool subclasses a crewai class, so importing it imports crewai
+    from policy_tool import PolicySearchTool
+    return PolicySearchTool(index=policy_index)
+
+
+def sync_policy_documents() -> None:
+    print(f"Policy documents indexed: {ingestion.sync()}")
+
+
+def prime_llm() -> None:
+    """Open the connection to the LLM provider with a one-token completion."""
+    litellm.completion(model=LLM_MODEL, messages=[{"role": "user", "content": "ping"}], max_tokens=1)
+
+
+def build_warmup(sync_index: bool) -> Warmup:
+    warmup = Warmup("Crew AI Insurance agent server")
+    warmup.add("imports", lambda: force_import(crewai) or get_policy_search_tool())
+    if sync_index:
+        warmup.add("policy index", sync_policy_documents)
+    warmup.add("llm connection", prime_llm, required=False)
+    return warmup
 
 
 @server.agent()
+@single_flight.coalesce()
+@admission.limit(max_concurrency=4, max_queue=16, max_queue_time=60)
 async def policy_agent(input: list[Message]) -> AsyncGenerator[RunYield, RunYieldResume]:
     "This is an agent for questions around policy coverage, it uses a RAG pattern to find answers based on policy documentation. Use it to help answer questions on coverage and waiting periods."
 
-    insurance_agent = Agent(
+    insurance_agent = crewai.Agent(
         role="Senior Insurance Coverage Assistant", 
         goal="Determine whether something is covered or not",
         backstory="You are an expert insurance agent designed to assist with coverage queries",
         verbose=True,
         allow_delegation=False,
-        llm=llm,
-        tools=[rag_tool], 
+        llm=get_llm(),
+        tools=[get_policy_search_tool()], 
         max_retry_limit=5
     )
     
-    task1 = Task(
+    task1 = crewai.Task(
          description=input[0].parts[0].content,
          expected_output = "A comprehensive response as to the users question",
          agent=insurance_agent
     )
-    crew = Crew(agents=[insurance_agent], tasks=[task1], verbose=True)
+    crew = crewai.Crew(agents=[insurance_agent], tasks=[task1], verbose=True)
     
     task_output = await crew.kickoff_async()
     yield Message(parts=[MessagePart(content=str(task_output))])
 
+@server.agent()
+@admission.limit(max_concurrency=2, max_queue=4, max_queue_time=60, priority=BATCH)
+async def policy_batch_agent(input: list[Message]) -> AsyncGenerator[RunYield, RunYieldResume]:
+    "This is an agent for answering many policy coverage questions at once. Send each question as its own message part; an answer message is streamed back for each question as soon as it is ready."
+
+    questions = [part.content for message in input for part in message.parts if part.content]
+
+    # One embedding call and one pass over the index for the whole batch
+    hits = await asyncio.to_thread(policy_index.search_batch, questions, BATCH_TOP_K)
+    groups = policy_index.group_by_context(hits, BATCH_GROUP_QUESTIONS, BATCH_GROUP_CHUNKS)
+    print(
+        f"Batch of {len(questions)} questions retrieved {sum(map(len, hits))} chunks, "
+        f"{sum(len(group.chunks) for group in groups)} sent to {len(groups)} crews"
+    )
+
+    semaphore = asyncio.Semaphore(BATCH_PARALLELISM)
+
+    async def answer(group: ContextGroup) -> list[tuple[int, str]]:
+        try:
+            async with semaphore:
+                answers = await answer_from_context(group.chunks, [questions[i] for i in group.questions])
+            return list(zip(group.questions, answers))
+        except Exception as e:
+            if len(group.questions) == 1:
+                # One failed question must not take the rest of the batch down with it
+                return [(group.questions[0], f"Error answering this question: {e}")]
+            print(f"Grouped answer failed, answering its {len(group.questions)} questions separately: {e}")
+            results = []
+            for i in group.questions:
+                results += await answer(ContextGroup(questions=[i], chunks=[chunk for chunk, _ in hits[i]]))
+            return results
+
+    for finished in asyncio.as_completed([answer(group) for group in groups]):
+        for index, content in await finished:
+            yield Message(parts=[MessagePart(name=f"answer-{index}", content=content)])
+
+
+class BatchAnswers(BaseModel):
+    answers: list[str]
+
+
+async def answer_from_context(chunks: list, questions: list[str]) -> list[str]:
+    """Answer questions from the policy documentation they retrieved, with a single crew."""
+    context = "\n\n".join(chunk.text for chunk in chunks)
+    coverage_agent = crewai.Agent(
+        role="Senior Insurance Coverage Assistant",
+        goal="Determine whether something is covered or not",
+        backstory="You are an expert insurance agent designed to assist with coverage queries",
+        verbose=False,
+        allow_delegation=False,
+        llm=get_llm(),
+        max_retry_limit=5
+    )
+    if len(questions) == 1:
+        task = crewai.Task(
+            description=f"Policy documentation:\n{context}\n\nQuestion: {questions[0]}",
+            expected_output="A comprehensive response as to the users question, based on the policy documentation",
+            agent=coverage_agent
+        )
+        output = await crewai.Crew(agents=[coverage_agent], tasks=[task], verbose=False).kickoff_async()
+        return [str(output)]
+
+    numbered = "\n".join(f"{i + 1}. {question}" for i, question in enumerate(questions))
+    task = crewai.Task(
+        description=f"Policy documentation:\n{context}\n\nAnswer each of these questions separately:\n{numbered}",
+        expected_output=(
+            f"{len(questions)} answers, one per question in the order asked, each a comprehensive response "
+            "to that question based on the policy documentation"
+        ),
+        agent=coverage_agent,
+        output_pydantic=BatchAnswers
+    )
+    output = await crewai.Crew(agents=[coverage_agent], tasks=[task], verbose=False).kickoff_async()
+    answers = output.pydantic.answers if output.pydantic is not None else []
+    if len(answers) != len(questions):
+        raise ValueError(f"expected {len(questions)} answers, got {len(answers)}")
+    return answers
+
+def create_app():
+    """App factory for worker processes."""
+    return build_app(server, admission, single_flight, ingestion.shared(), build_warmup(sync_index=False), WireCompression.from_env(), store=run_store)
+
 if __name__ == "__main__":
     print(f"Crew AI Insurance agent server running....")
-    server.run(port=8001)
\ No newline at end of file
+    print(f"Unfinished runs from the last start marked failed: {run_store.recover()}")
+    if WORKERS > 1:
+        ingestion.start_publisher()
+        serve_workers("crewaiInsurance_agent:create_app", workers=WORKERS, port=8001)
+    else:
+        serve(server, admission, single_flight, ingestion, build_warmup(sync_index=True), WireCompression.from_env(), store=run_store, port=8001)
\ No newline at end of file
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# === Two-tier embedding cache ===
+#
+# Retrieval queries repeat constantly inside CrewAI's tool loop. Caching their
+# embeddings by model + normalised text turns a repeat into a dict lookup
+# (memory tier) or a single-row sqlite read (disk tier, shared across restarts).
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and case so trivially different queries share an entry."""
+    return " ".join(text.split()).casefold()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    In-process LRU in front of an on-disk sqlite store of embeddings.
+
+    Args:
+        max_entries (int): Embeddings kept in memory.
+        path (str, optional): sqlite file for the disk tier, None to keep the cache in memory only.
+    """
+
+    def __init__(self, max_entries: int = 10000, path: Optional[str] = ".cache/embeddings.sqlite"):
+        self.max_entries = max_entries
+        self.path = path
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self._db.commit()
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        """Return cached vectors by position in `texts`; missing positions are left out."""
+        found = {}
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = cache_key(model, text)
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                elif self._db is not None:
+                    row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                    if row is None:
+                        self.stats["misses"] += 1
+                        continue
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.stats["disk_hits"] += 1
+                else:
+                    self.stats["misses"] += 1
+                    continue
+                found[i] = vector
+        return found
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray) -> None:
+        with self._lock:
+            rows = []
+            for text, vector in zip(texts, vectors):
+                key = cache_key(model, text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, vector.tobytes()))
+            if self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self._db.commit()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
@@ -1,13 +1,20 @@
-from typing import List, Dict, Callable, Optional, Union, Any, AsyncGenerator
+from typing import List, Dict, Callable, Optional, Union, Any, AsyncGenerator, Tuple
+import asyncio
 import json
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
 from enum import Enum
+import httpx
 from colorama import Fore
 from acp_sdk.client import Client
 from acp_sdk.models import (
     Message,
     MessagePart,
 )
+from compression import count_tokens
+from plan_cache import Plan, PlanCache
+from replicas import LEAST_OUTSTANDING, Replica, ReplicaSet
+from routing import AgentRouter
 
 # === AgentCollection Implementation ===
 
@@ -27,6 +34,7 @@ class AgentCollection:
     """
     A collection of agents available on ACP servers.
     Allows users to discover available agents on ACP servers.
+    Servers may be replicas of each other; `replica_sets` groups their agents by name.
     """
     
     def __init__(self):
@@ -36,6 +44,7 @@ class AgentCollection:
     async def from_acp(cls, *servers) -> 'AgentCollection':
         """
         Creates an AgentCollection by fetching agents from the provided ACP servers.
+        Servers that are down are skipped, so one dead replica doesn't stop discovery.
         
         Args:
             *servers: ACP server client instances to fetch agents from
@@ -46,8 +55,13 @@ class AgentCollection:
         collection = cls()
         
         for server in servers:
-            async for agent in server.agents():
-                collection.agents.append((server,agent))
+            if not getattr(server, "available", True):
+                continue
+            try:
+                async for agent in server.agents():
+                    collection.agents.append((server,agent))
+            except httpx.TransportError as e:
+                print(f"{Fore.RED}Skipping unreachable server: {e}{Fore.RESET}")
         
         return collection
     
@@ -61,10 +75,31 @@ class AgentCollection:
         Returns:
             Agent or None: The found agent or None if not found
         """
-        for agent in self.agents:
+        for _, agent in self.agents:
             if agent.name == name:
                 return agent
         return None
+
+    def replica_sets(self, balancing: str = LEAST_OUTSTANDING) -> Dict[str, Dict[str, Any]]:
+        """
+        Group agents with the same name across servers into load-balanced replica sets.
+        
+        Args:
+            balancing: "least_outstanding" or "power_of_two"
+            
+        Returns:
+            dict: {name: {'agent': agent, 'client': ReplicaSet}}, as ACPCallingAgent takes them
+        """
+        # One Replica per server, shared by its agents' sets so their load adds up
+        replicas = {}
+        grouped = {}
+        for server, agent in self.agents:
+            replica = replicas.setdefault(id(server), Replica(server))
+            if agent.name in grouped:
+                grouped[agent.name]['client'].add(replica)
+            else:
+                grouped[agent.name] = {'agent': agent, 'client': ReplicaSet([replica], balancing)}
+        return grouped
     
     def __iter__(self):
         """Allows iteration over all agents in the collection."""
@@ -213,6 +248,74 @@ class MultiStepAgent:
         raise NotImplementedError
 
 
+# === Run budgets ===
+#
+# A run may be given a deadline (seconds) and a token budget. Before each
+# planning round the agent checks whether the remaining budget still fits a
+# round the size of the previous ones; when it doesn't, or a round overruns
+# the deadline, or the planner keeps failing, the run stops and answers with
+# the observations collected so far instead of another LLM call.
+
+STOP_FINAL_ANSWER = "final_answer"
+STOP_DEADLINE = "deadline"
+STOP_TOKEN_BUDGET = "token_budget"
+STOP_MAX_STEPS = "max_steps"
+STOP_ERRORS = "errors"
+
+
+@dataclass
+class RunReport:
+    """How an ACPCallingAgent run went and why it stopped."""
+    answer: Any = None
+    stop_reason: Optional[str] = None
+    steps: int = 0
+    llm_calls: int = 0
+    tokens: int = 0
+    elapsed: float = 0.0
+    errors: List[str] = field(default_factory=list)
+    calls: List[Tuple[str, str, str]] = field(default_factory=list)
+    routed: Optional[str] = None
+    cached_plan: bool = False
+
+    @property
+    def agents_called(self) -> List[str]:
+        return [agent for agent, _, _ in self.calls]
+
+    @property
+    def best_effort(self) -> bool:
+        """True when the answer was assembled from partial observations rather than given by the planner."""
+        return self.stop_reason not in (None, STOP_FINAL_ANSWER)
+
+    def summary(self) -> str:
+        return (
+            f"stopped by {self.stop_reason} after {self.steps} steps, {self.llm_calls} LLM calls, "
+            f"{self.tokens} tokens, {self.elapsed:.1f}s"
+            + (f", routed to {self.routed}" if self.routed else "")
+            + (", from a cached plan" if self.cached_plan else "")
+            + (f", {len(self.errors)} errors" if self.errors else "")
+        )
+
+
+def _usage_tokens(response: Any, messages: List[Dict[str, str]]) -> int:
+    """Tokens an LLM call used: from the response's usage when reported, else estimated from the text."""
+    usage = getattr(response, "usage", None)
+    total = getattr(usage, "total_tokens", None) if usage is not None else None
+    if total:
+        return int(total)
+    prompt = sum(count_tokens(str(message.get("content", ""))) for message in messages)
+    return prompt + count_tokens(str(getattr(response, "content", "") or response))
+
+
+def _prompt_text(arguments: Union[Dict[str, Any], str]) -> str:
+    """The prompt an agent call passes on, mirroring how Tool picks it from the arguments."""
+    if isinstance(arguments, dict):
+        for key in ("input", "prompt"):
+            if key in arguments:
+                return str(arguments[key])
+        return str(next(iter(arguments.values()), ""))
+    return str(arguments)
+
+
 def populate_template(template: str, variables: Dict[str, Any]) -> str:
     """Helper function to populate a template with variables."""
     result = template
@@ -232,6 +335,10 @@ class ACPCallingAgent(MultiStepAgent):
         model (`Callable[[list[dict[str, str]]], ChatMessage]`): Model that will generate the agent's actions.
         prompt_templates ([`Dict[str, str]`], *optional*): Prompt templates.
         planning_interval (`int`, *optional*): Interval at which the agent will run a planning step.
+        router (`AgentRouter`, *optional*): Local router sending single-agent queries straight to their agent
+            and answering with its response, without LLM planning.
+        plan_cache (`PlanCache`, *optional*): Plans learned from earlier runs, followed without LLM planning
+            for queries with a similar intent.
         **kwargs: Additional keyword arguments.
     """
     
@@ -241,6 +348,8 @@ class ACPCallingAgent(MultiStepAgent):
         model: Callable[[List[Dict[str, str]]], ChatMessage],
         prompt_templates: Optional[Dict[str, str]] = None,
         planning_interval: Optional[int] = None,
+        router: Optional[AgentRouter] = None,
+        plan_cache: Optional[PlanCache] = None,
         **kwargs,
     ):
         # Default prompt templates if none provided
@@ -312,11 +421,21 @@ class ACPCallingAgent(MultiStepAgent):
         )
         
         self.acp_agents = acp_agents
+        self.report = RunReport()
+        self.router = router
+        if router is not None:
+            router.fit({name: agent['agent'].description for name, agent in acp_agents.items()})
+        self.plan_cache = plan_cache
     
+    def available_agents(self) -> List[str]:
+        """Agents whose servers are reachable; ones behind an open circuit are not offered to the planner."""
+        return [name for name, agent in self.acp_agents.items() if getattr(agent['client'], "available", True)]
+
     def initialize_system_prompt(self) -> str:
         """Generate the system prompt for the agent with ACP agent information."""
+        available = self.available_agents()
         agent_descriptions = "\n".join(
-            [f"- {name}: {agent['agent'].description}" for name, agent in self.acp_agents.items()]
+            [f"- {name}: {agent['agent'].description}" for name, agent in self.acp_agents.items() if name in available]
         )
         
         system_prompt = populate_template(
@@ -416,7 +535,10 @@ class ACPCallingAgent(MultiStepAgent):
             
             # LiteLLMModel expects tools in a specific format - convert our tools
             tools_for_model = []
+            available = self.available_agents()
             for tool in list(self.tools.values())[:-1]:  # Exclude final_answer
+                if tool.name not in available:
+                    continue
                 tool_spec = {
                     "type": "function",
                     "function": {
@@ -435,11 +557,18 @@ class ACPCallingAgent(MultiStepAgent):
             
             # Call the LiteLLM model with proper format
             print("DEBUG: About to call self.model...")
-            response = self.model(
+            model_started = time.monotonic()
+            # In a thread, so a run deadline can interrupt the wait for the model
+            response = await asyncio.to_thread(
+                self.model,
                 messages=litellm_messages,
                 tools=tools_for_model if tools_for_model else None,
                 stop=["Observation:", "Calling agents:"],
             )
+            if self.router is not None:
+                self.router.record_planner_call(time.monotonic() - model_started)
+            self.report.llm_calls += 1
+            self.report.tokens += _usage_tokens(response, litellm_messages)
             print(f"DEBUG: Model response type: {type(response)}")
             print(f"DEBUG: Model response: {response}")
             
@@ -599,6 +728,9 @@ class ACPCallingAgent(MultiStepAgent):
             updated_information = str(observation).strip()
 
             self.save_to_memory(f"{agent_name}_response", updated_information)
+            self.report.calls.append(
+                (agent_name, _prompt_text(self._substitute_state_variables(agent_arguments)), updated_information)
+            )
             
             self.logger.log(
                 f"Observations: {updated_information}",
@@ -665,26 +797,178 @@ class ACPCallingAgent(MultiStepAgent):
             )
             raise AgentToolExecutionError(error_msg, self.logger) from e
 
-    async def run(self, query: str, max_steps: int = 10) -> str:
+    def _best_effort_answer(self, reason: str) -> str:
+        """Answer from the agent responses collected so far, for runs stopped before a final answer."""
+        observations = [
+            (key[: -len("_response")], value) for key, value in self.state.items() if key.endswith("_response")
+        ]
+        if not observations:
+            return "I wasn't able to complete this task " + {
+                STOP_MAX_STEPS: "within the maximum number of steps.",
+                STOP_ERRORS: "because agent calls kept failing.",
+            }.get(reason, f"before running out of budget ({reason}).")
+        answers = "\n\n".join(f"{agent_name}: {value}" for agent_name, value in observations)
+        return f"Partial answer ({reason}), based on the agents consulted so far:\n\n{answers}"
+
+    def _out_of_budget(
+        self, started: float, step_seconds: List[float], step_tokens: List[int],
+        deadline: Optional[float], max_tokens: Optional[int],
+    ) -> Optional[str]:
+        """The stop reason if another round like the previous ones won't fit the remaining budget."""
+        if deadline is not None:
+            expected = max(step_seconds) if step_seconds else 0.0
+            if time.monotonic() - started + expected > deadline:
+                return STOP_DEADLINE
+        if max_tokens is not None:
+            # Prompts grow every round, so the last round is the best guess for the next one
+            expected = step_tokens[-1] if step_tokens else 0
+            if self.report.tokens + expected > max_tokens:
+                return STOP_TOKEN_BUDGET
+        return None
+
+    async def _plan_answer(self, plan: Plan, query: str) -> str:
+        if plan.answer is not None:
+            return self.state.get(f"{plan.answer}_response", "")
+        return await self._synthesize_answer(query)
+
+    async def _synthesize_answer(self, query: str) -> str:
+        """
+        Write the final answer from the agents' responses with one LLM call, as the
+        planner would have; the planning calls before it are what a cached plan saves.
+        """
+        observations = "\n\n".join(f"{agent_name}: {response}" for agent_name, _, response in self.report.calls)
+        messages = [
+            {
+                "role": "system",
+                "content": "You answer the user's question using only the responses of the agents consulted for it. "
+                "Combine them into one complete answer; do not mention the agents.",
+            },
+            {"role": "user", "content": f"Question: {query}\n\nAgent responses:\n\n{observations}"},
+        ]
+        response = await asyncio.to_thread(self.model, messages=messages)
+        self.report.llm_calls += 1
+        self.report.tokens += _usage_tokens(response, messages)
+        if hasattr(response, "choices") and response.choices:
+            return getattr(response.choices[0].message, "content", None) or ""
+        return getattr(response, "content", None) or str(response)
+
+    async def _follow_plan(self, plan: Plan, query: str, started: float, deadline: Optional[float]) -> None:
+        """Make a cached plan's agent calls, adding each observation to the conversation for a fallback planner."""
+        for plan_step in plan.steps:
+            prompt = populate_template(plan_step.prompt, {"query": query, **self.state})
+            memory_step = ActionStep()
+            call = self._process_tool_call(memory_step, plan_step.agent, {"input": prompt})
+            if deadline is None:
+                await call
+            else:
+                await asyncio.wait_for(call, timeout=max(deadline - (time.monotonic() - started), 0.0))
+            self.input_messages.append({
+                "role": "user",
+                "content": [{"type": "text", "text": f"Observation: {memory_step.observations}"}]
+            })
+
+    def _finish(self, answer: Any, reason: str, started: float) -> Any:
+        self.report.answer = answer
+        self.report.stop_reason = reason
+        self.report.elapsed = time.monotonic() - started
+        self.logger.log(f"Run {self.report.summary()}", level=LogLevel.INFO)
+        return answer
+
+    async def run(
+        self,
+        query: str,
+        max_steps: int = 10,
+        deadline: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        max_errors: int = 3,
+    ) -> str:
         """
         Run the agent to completion with a user query.
         
         Args:
             query (str): The user's query or request
             max_steps (int): Maximum number of steps before giving up, default 10
+            deadline (float, optional): Seconds the whole run may take
+            max_tokens (int, optional): LLM tokens the whole run may use
+            max_errors (int): Consecutive failed steps before giving up, default 3
             
         Returns:
-            str: Final answer from the agent
+            str: Final answer from the agent, or a best-effort answer from the
+            observations so far when a budget ran out; `self.report` says which
         """
+        started = time.monotonic()
+        self.report = RunReport()
+        step_seconds: List[float] = []
+        step_tokens: List[int] = []
+        consecutive_errors = 0
+
         # Initialize memory with the user query in the correct format for LiteLLM
         user_message = {"role": "user", "content": [{"type": "text", "text": query}]}
         system_message = {"role": "system", "content": [{"type": "text", "text": self.initialize_system_prompt()}]}
         self.input_messages = [system_message, user_message]
+
+        # Single-agent queries skip planning: call the agent and answer with its response
+        route = self.router.route(query) if self.router is not None else None
+        if route is not None and route.agent not in self.available_agents():
+            route = None
+        if route is not None:
+            self.logger.log(f"Routing directly to {route.agent} (score {route.score:.2f})", level=LogLevel.INFO)
+            memory_step = ActionStep()
+            try:
+                call = self._process_tool_call(memory_step, route.agent, {"input": query})
+                await (call if deadline is None else asyncio.wait_for(call, timeout=deadline))
+                self.router.record_routed()
+                self.report.routed = route.agent
+                return self._finish(memory_step.observations, STOP_FINAL_ANSWER, started)
+            except asyncio.TimeoutError:
+                return self._finish(self._best_effort_answer(STOP_DEADLINE), STOP_DEADLINE, started)
+            except Exception as e:
+                self.logger.log(f"Routed call failed, planning instead: {e}", level=LogLevel.WARNING)
+                self.report.errors.append(str(e))
+                self.router.record_fallback()
+
+        # Recurring queries follow the plan the planner found for them before
+        plan = self.plan_cache.lookup(query, self.available_agents()) if self.plan_cache is not None else None
+        if plan is not None:
+            self.logger.log(f"Following cached plan: {' -> '.join(plan.agents)}", level=LogLevel.INFO)
+            try:
+                await self._follow_plan(plan, query, started, deadline)
+                self.plan_cache.record_success(plan)
+                self.report.cached_plan = True
+            except asyncio.TimeoutError:
+                return self._finish(self._best_effort_answer(STOP_DEADLINE), STOP_DEADLINE, started)
+            except Exception as e:
+                self.logger.log(f"Cached plan failed, planning instead: {e}", level=LogLevel.WARNING)
+                self.report.errors.append(str(e))
+                self.plan_cache.record_failure(plan)
+            else:
+                reason = self._out_of_budget(started, [], [], deadline, max_tokens)
+                if reason:
+                    return self._finish(self._best_effort_answer(reason), reason, started)
+                try:
+                    if deadline is None:
+                        answer = await self._plan_answer(plan, query)
+                    else:
+                        remaining = deadline - (time.monotonic() - started)
+                        answer = await asyncio.wait_for(self._plan_answer(plan, query), timeout=max(remaining, 0.0))
+                    return self._finish(answer, STOP_FINAL_ANSWER, started)
+                except asyncio.TimeoutError:
+                    return self._finish(self._best_effort_answer(STOP_DEADLINE), STOP_DEADLINE, started)
+                except Exception as e:
+                    # The plan itself worked; answer from its observations
+                    self.logger.log(f"Writing the final answer failed: {e}", level=LogLevel.ERROR)
+                    self.report.errors.append(str(e))
+                    return self._finish(self._best_effort_answer(STOP_ERRORS), STOP_ERRORS, started)
         
         # Run steps until we get a final answer or hit max steps
         result = None
         for step_num in range(max_steps):
+            reason = self._out_of_budget(started, step_seconds, step_tokens, deadline, max_tokens)
+            if reason:
+                return self._finish(self._best_effort_answer(reason), reason, started)
+
             self.logger.log(f"Step {step_num + 1}/{max_steps}", level=LogLevel.INFO)
+            self.report.steps += 1
 
             # Add memory context to the messages if we have any state
             if self.state and step_num > 0:
@@ -699,13 +983,26 @@ class ACPCallingAgent(MultiStepAgent):
             
             # Create a new action step and execute it
             memory_step = ActionStep()
+            step_started = time.monotonic()
+            tokens_before = self.report.tokens
             
             try:
-                result = await self.step(memory_step)
+                if deadline is None:
+                    result = await self.step(memory_step)
+                else:
+                    remaining = deadline - (time.monotonic() - started)
+                    result = await asyncio.wait_for(self.step(memory_step), timeout=max(remaining, 0.0))
+                consecutive_errors = 0
                 
                 # If we got a final result, return it
                 if result is not None:
-                    return result
+                    # Clean planner runs teach the router and the plan cache to skip planning next time
+                    if not self.report.errors and self.report.calls:
+                        if self.router is not None and len(set(self.report.agents_called)) == 1:
+                            self.router.learn(self.report.agents_called[0], query)
+                        if self.plan_cache is not None:
+                            self.plan_cache.learn(query, self.report.calls, result)
+                    return self._finish(result, STOP_FINAL_ANSWER, started)
                 
                 # Otherwise, add observation to input messages for next step
                 if hasattr(memory_step, 'observations') and memory_step.observations:
@@ -728,13 +1025,23 @@ class ACPCallingAgent(MultiStepAgent):
                         "role": "user", 
                         "content": [{"type": "text", "text": f"Observation: {memory_step.observations}"}]
                     })
+            except asyncio.TimeoutError:
+                self.logger.log(f"Step {step_num + 1} ran past the deadline", level=LogLevel.WARNING)
+                return self._finish(self._best_effort_answer(STOP_DEADLINE), STOP_DEADLINE, started)
             except Exception as e:
                 self.logger.log(f"Error in step {step_num + 1}: {str(e)}", level=LogLevel.ERROR)
+                self.report.errors.append(str(e))
+                consecutive_errors += 1
+                if consecutive_errors >= max_errors:
+                    return self._finish(self._best_effort_answer(STOP_ERRORS), STOP_ERRORS, started)
                 # Add error message to conversation
                 self.input_messages.append({
                     "role": "user",
                     "content": [{"type": "text", "text": f"Error occurred: {str(e)}. Please try a different approach or provide a final answer."}]
                 })
+            finally:
+                step_seconds.append(time.monotonic() - step_started)
+                step_tokens.append(self.report.tokens - tokens_before)
         
         # If we hit max steps without a final answer
-        return "I wasn't able to complete this task within the maximum number of steps."
\ No newline at end of file
+        return self._finish(self._best_effort_answer(STOP_MAX_STEPS), STOP_MAX_STEPS, started)
@@ -0,0 +1,407 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI
+from pypdf import PdfReader
+
+from policy_index import PolicyIndex, chunk_text
+
+# === Incremental ingestion of a directory of policy documents ===
+#
+# PDFs under `data_dir` are hashed and compared with a manifest. Unchanged
+# documents are loaded from their per-hash snapshot (chunks + vectors) without
+# parsing or embedding; new or changed ones are parsed and chunked in a process
+# pool, page range by page range so a huge PDF never sits in one worker, then
+# embedded in batches with bounded concurrency and snapshotted. A changed
+# document's old chunks keep answering queries until the new ones are swapped in.
+#
+# For multi-process serving, one process syncs and publishes the whole index as
+# a single snapshot; worker processes memory-map it read-only (SharedIndex) so
+# the embedding matrix is held once in the page cache, not once per worker.
+
+
+def file_digest(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunk_pages(path: str, start: int, end: int, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """Process pool worker: extract and chunk pages [start, end) of a PDF."""
+    reader = PdfReader(path)
+    text = "\n".join(reader.pages[i].extract_text() or "" for i in range(start, end))
+    return chunk_text(text, chunk_size, chunk_overlap)
+
+
+@dataclass
+class IngestReport:
+    """What a sync changed in the index."""
+    added: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    # Documents indexed without vectors on an earlier sync that were embedded now
+    reembedded: List[str] = field(default_factory=list)
+    chunks_embedded: int = 0
+    seconds: float = 0.0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.removed or self.reembedded)
+
+
+class IngestionPipeline:
+    """
+    Keeps a PolicyIndex in sync with the PDFs in a directory.
+
+    Args:
+        index (PolicyIndex): Index to load documents into.
+        data_dir (str): Directory scanned (recursively) for *.pdf files.
+        cache_dir (str): Where the hash manifest and per-document snapshots live.
+        workers (int, optional): Processes used for parsing and chunking.
+        pages_per_task (int): Pages handed to a worker at a time.
+        embed_batch_size (int): Chunks per embedding request.
+        max_concurrent_embeddings (int): Embedding requests in flight at once.
+        sync_on_start (bool): Sync before the app serves; disable when a warmup step does it.
+    """
+
+    def __init__(
+        self,
+        index: PolicyIndex,
+        data_dir: str = "data",
+        cache_dir: str = ".cache/ingest",
+        workers: Optional[int] = None,
+        pages_per_task: int = 25,
+        embed_batch_size: int = 64,
+        max_concurrent_embeddings: int = 4,
+        sync_on_start: bool = True,
+    ):
+        self.index = index
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.embed_batch_size = embed_batch_size
+        self.max_concurrent_embeddings = max_concurrent_embeddings
+        self.sync_on_start = sync_on_start
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        # path -> sha256 of the version currently in the index
+        self.loaded: Dict[str, str] = {}
+        # Warmup, the watcher and the publisher may all call sync
+        self._sync_lock = threading.Lock()
+
+    def scan(self) -> Dict[str, str]:
+        """Hash every PDF under data_dir."""
+        found = {}
+        for root, _, files in os.walk(self.data_dir):
+            for name in sorted(files):
+                if name.lower().endswith(".pdf"):
+                    path = os.path.join(root, name)
+                    found[path] = file_digest(path)
+        return found
+
+    def sync(self) -> IngestReport:
+        """Bring the index up to date with data_dir, touching only new, changed or removed documents."""
+        with self._sync_lock:
+            return self._sync()
+
+    def _sync(self) -> IngestReport:
+        started = time.perf_counter()
+        report = IngestReport()
+        current = self.scan()
+        # On the first sync the manifest tells which documents are unchanged since the last run
+        previous = {} if self.loaded else self._read_manifest()
+
+        for path in [path for path in self.loaded if path not in current]:
+            self.index.remove_source(path)
+            del self.loaded[path]
+            report.removed.append(path)
+        report.removed.extend(path for path in previous if path not in current)
+
+        stale = {}
+        for path, digest in current.items():
+            if self.loaded.get(path) == digest:
+                report.unchanged.append(path)
+                continue
+            if path in self.loaded:
+                # The old version keeps serving until the new one is ready to swap in
+                report.updated.append(path)
+            elif path in previous:
+                (report.unchanged if previous[path] == digest else report.updated).append(path)
+            else:
+                report.added.append(path)
+            if not self._load_snapshot(path, digest):
+                stale[path] = digest
+            self.loaded[path] = digest
+
+        if stale:
+            report.chunks_embedded = self._ingest(stale)
+        # Documents whose embedding failed on an earlier sync get their vectors now
+        for path, (texts, vectors) in self.index.embed_missing().items():
+            if path in self.loaded:
+                self._save_snapshot(self.loaded[path], texts, vectors)
+                report.reembedded.append(path)
+                report.chunks_embedded += len(texts)
+
+        self._write_manifest(current)
+        self._prune(set(current.values()))
+        report.seconds = time.perf_counter() - started
+        return report
+
+    async def watch(self, interval: float = 30.0) -> None:
+        """Re-sync every `interval` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                report = await asyncio.to_thread(self.sync)
+                if report.changed:
+                    print(f"Policy documents re-indexed: {report}")
+            except Exception as e:
+                print(f"Policy document sync failed: {e}")
+
+    def install(self, app: FastAPI, interval: float = 30.0) -> None:
+        """Sync before an ACP app starts serving, then keep watching data_dir while it runs."""
+        inner = app.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan(app: FastAPI):
+            if self.sync_on_start:
+                report = await asyncio.to_thread(self.sync)
+                print(f"Policy documents indexed: {report}")
+            task = asyncio.create_task(self.watch(interval))
+            try:
+                async with inner(app) as state:
+                    yield state
+            finally:
+                task.cancel()
+
+        app.router.lifespan_context = lifespan
+
+    def publish(self) -> str:
+        """
+        Write the whole index as one snapshot (chunk list + embedding matrix) for
+        SharedIndex readers, then point `published/current` at it.
+
+        Returns:
+            str: The generation name of the snapshot.
+        """
+        with self.index._lock:
+            chunks = [(chunk.source, chunk.text) for chunk in self.index.chunks]
+            embeddings = self.index.embeddings if self.index.embedding_model else None
+        directory = os.path.join(self.cache_dir, "published")
+        os.makedirs(directory, exist_ok=True)
+        generation = f"{time.time_ns():x}"
+        with open(os.path.join(directory, f"{generation}.json"), "w") as f:
+            json.dump(chunks, f)
+        if embeddings is not None and len(embeddings):
+            np.save(os.path.join(directory, f"{generation}.npy"), np.ascontiguousarray(embeddings, dtype=np.float32))
+        # Readers only ever see a fully written generation
+        pointer = os.path.join(directory, "current")
+        with open(pointer + ".tmp", "w") as f:
+            f.write(generation)
+        os.replace(pointer + ".tmp", pointer)
+        self._prune_published(directory, generation)
+        return generation
+
+    def start_publisher(self, interval: float = 30.0) -> threading.Thread:
+        """
+        Sync and publish now, then keep re-syncing from a daemon thread and publish
+        whenever something changed. Used by the parent of worker processes.
+        """
+        report = self.sync()
+        print(f"Policy documents indexed: {report}")
+        self.publish()
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    report = self.sync()
+                    if report.changed:
+                        print(f"Policy documents re-indexed, generation {self.publish()}: {report}")
+                except Exception as e:
+                    print(f"Policy document sync failed: {e}")
+
+        thread = threading.Thread(target=loop, name="policy-publisher", daemon=True)
+        thread.start()
+        return thread
+
+    def shared(self, interval: float = 5.0) -> "SharedIndex":
+        """Extension for worker processes: serve the published index instead of ingesting."""
+        return SharedIndex(self.index, self.cache_dir, interval)
+
+    def _prune_published(self, directory: str, keep: str) -> None:
+        """Delete all but the newest two generations; workers may still be switching from the previous one."""
+        generations = sorted({os.path.splitext(name)[0] for name in os.listdir(directory) if name.endswith(".json")})
+        for generation in generations[:-2]:
+            if generation == keep:
+                continue
+            for ext in (".json", ".npy"):
+                path = os.path.join(directory, generation + ext)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _ingest(self, documents: Dict[str, str]) -> int:
+        """
+        Parse, chunk and embed documents, then add them to the index and snapshot them.
+        Documents go through one at a time so only one document's chunks are held in memory.
+        """
+        embedded = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for path, digest in documents.items():
+                page_count = len(PdfReader(path).pages)
+                futures = [
+                    pool.submit(
+                        _chunk_pages, path, start, min(start + self.pages_per_task, page_count),
+                        self.index.chunk_size, self.index.chunk_overlap,
+                    )
+                    for start in range(0, page_count, self.pages_per_task)
+                ]
+                texts = [text for future in futures for text in future.result()]
+                # replace_source embeds again if a batch failed; snapshot whatever vectors it indexed
+                vectors = self.index.replace_source(texts, source=path, vectors=self._embed(texts))
+                self._save_snapshot(digest, texts, vectors)
+                embedded += len(texts)
+                print(f"Ingested {path}: {len(texts)} chunks")
+        return embedded
+
+    def _embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Embed in batches; a failed batch is retried once on its own, the others keep their vectors."""
+        if not self.index.embedding_model or not texts:
+            return None
+        batches = [texts[i:i + self.embed_batch_size] for i in range(0, len(texts), self.embed_batch_size)]
+
+        def embed_batch(batch: List[str]) -> Optional[np.ndarray]:
+            for attempt in range(2):
+                try:
+                    return self.index.embed(batch)
+                except Exception as e:
+                    print(f"Embedding batch failed (attempt {attempt + 1}): {e}")
+            return None
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_embeddings) as pool:
+            results = list(pool.map(embed_batch, batches))
+        # The document is then searched lexically until embed_missing succeeds
+        return None if any(vectors is None for vectors in results) else np.vstack(results)
+
+    def _snapshot_paths(self, digest: str):
+        base = os.path.join(self.cache_dir, digest)
+        return f"{base}.json", f"{base}.npy"
+
+    def _load_snapshot(self, path: str, digest: str) -> bool:
+        texts_path, vectors_path = self._snapshot_paths(digest)
+        if not os.path.exists(texts_path):
+            return False
+        with open(texts_path) as f:
+            texts = json.load(f)
+        if self.index.embedding_model and not os.path.exists(vectors_path):
+            # Saved while the embedding service was failing: embed the saved chunks instead of re-parsing
+            vectors = self.index.replace_source(texts, source=path)
+            if vectors is not None:
+                np.save(vectors_path, vectors)
+            return True
+        vectors = np.load(vectors_path) if self.index.embedding_model else None
+        self.index.replace_source(texts, source=path, vectors=vectors)
+        return True
+
+    def _save_snapshot(self, digest: str, texts: List[str], vectors: Optional[np.ndarray]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        texts_path, vectors_path = self._snapshot_paths(digest)
+        with open(texts_path, "w") as f:
+            json.dump(texts, f)
+        if vectors is not None:
+            np.save(vectors_path, vectors)
+
+    def _read_manifest(self) -> Dict[str, str]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as f:
+            return {path: entry["sha256"] for path, entry in json.load(f).items()}
+
+    def _write_manifest(self, current: Dict[str, str]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest = {path: {"sha256": digest} for path, digest in current.items()}
+        with open(self.manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    def _prune(self, digests: set) -> None:
+        """Delete snapshots of document versions that are no longer in data_dir."""
+        for name in os.listdir(self.cache_dir):
+            digest, ext = os.path.splitext(name)
+            if ext in (".json", ".npy") and name != "manifest.json" and digest not in digests:
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+class SharedIndex:
+    """
+    Serves a PolicyIndex from the snapshot published by IngestionPipeline.publish,
+    with the embedding matrix memory-mapped read-only, and follows new generations.
+
+    Args:
+        index (PolicyIndex): Index to load the published snapshot into.
+        cache_dir (str): The publishing pipeline's cache_dir.
+        interval (float): Seconds between checks for a new generation.
+    """
+
+    def __init__(self, index: PolicyIndex, cache_dir: str = ".cache/ingest", interval: float = 5.0):
+        self.index = index
+        self.directory = os.path.join(cache_dir, "published")
+        self.interval = interval
+        self.generation: Optional[str] = None
+
+    def current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.directory, "current")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> bool:
+        """Load the current generation if it isn't loaded yet. Returns True when the index changed."""
+        generation = self.current()
+        if generation is None or generation == self.generation:
+            return False
+        with open(os.path.join(self.directory, f"{generation}.json")) as f:
+            chunks = [tuple(chunk) for chunk in json.load(f)]
+        vectors_path = os.path.join(self.directory, f"{generation}.npy")
+        embeddings = np.load(vectors_path, mmap_mode="r") if os.path.exists(vectors_path) else None
+        self.index.load(chunks, embeddings)
+        self.generation = generation
+        return True
+
+    async def watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if await asyncio.to_thread(self.refresh):
+                    print(f"Worker {os.getpid()} loaded policy index generation {self.generation}")
+            except Exception as e:
+                print(f"Loading the published policy index failed: {e}")
+
+    def install(self, app: FastAPI) -> None:
+        """Load the published index before a worker starts serving, then follow new generations."""
+        inner = app.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan(app: FastAPI):
+            if not await asyncio.to_thread(self.refresh):
+                print(f"Worker {os.getpid()}: no published policy index in {self.directory} yet")
+            task = asyncio.create_task(self.watch())
+            try:
+                async with inner(app) as state:
+                    yield state
+            finally:
+                task.cancel()
+
+        app.router.lifespan_context = lifespan
@@ -0,0 +1,441 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+from acp_sdk.models import Message, MessagePart, RunCreateRequest, RunMode
+
+# === Open-loop load generator for the ACP servers ===
+#
+# Replays a corpus of health, doctor-finder and policy questions against the
+# agent servers at a fixed average rate. Arrivals follow a Poisson process and
+# never wait for earlier runs to finish (open loop), so queueing shows up as
+# latency, 429s and timeouts instead of silently lowering the offered load.
+# Every --interval seconds it prints what was sent and finished, the runs in
+# flight and the admission queue depth reported by the servers; at the end it
+# prints throughput, latency percentiles and error, timeout and reject rates.
+#
+#   python loadgen.py run --rps 2 --duration 60
+#   python loadgen.py run --rps 20 --duration 30 --stand-ins    # offline, fake LLM
+#   python loadgen.py run --corpus queries.jsonl --output results.json
+#
+# --stand-ins starts local servers on the corpus ports that expose the same
+# agents and admission limits as the real ones, but answer with a fake LLM
+# (log-normal latency, optional error rate), so runs need no network or keys.
+# --fake-cpu adds CPU-bound work per call, like the parsing and retrieval the
+# real servers do in-process; with ACP_WORKERS > 1 each stand-in serves from
+# that many processes, which shows how throughput scales with cores:
+#
+#   ACP_WORKERS=4 python loadgen.py run --rps 40 --duration 30 --stand-ins --fake-latency 0.5 --fake-cpu 0.05
+
+DEFAULT_CORPUS = [
+    {"kind": "health", "url": "http://127.0.0.1:8000", "agent": "health_agent",
+     "input": "Do I need rehabilitation after a shoulder reconstruction?"},
+    {"kind": "health", "url": "http://127.0.0.1:8000", "agent": "health_agent",
+     "input": "What are the symptoms of diabetes and what treatments are available?"},
+    {"kind": "health", "url": "http://127.0.0.1:8000", "agent": "health_agent",
+     "input": "How long is the recovery after a knee replacement?"},
+    {"kind": "doctor", "url": "http://127.0.0.1:8002", "agent": "doctor_finder_agent",
+     "input": "I'm based in Atlanta, GA. Are there any cardiologists near me?"},
+    {"kind": "doctor", "url": "http://127.0.0.1:8002", "agent": "doctor_finder_agent",
+     "input": "I'm based in New York City. Are there any dermatologists near me?"},
+    {"kind": "policy", "url": "http://127.0.0.1:8001", "agent": "policy_agent",
+     "input": "What is the waiting period for rehabilitation?"},
+    {"kind": "policy", "url": "http://127.0.0.1:8001", "agent": "policy_agent",
+     "input": "Is physiotherapy covered under my hospital policy?"},
+    {"kind": "policy", "url": "http://127.0.0.1:8001", "agent": "policy_agent",
+     "input": "What is the excess for a hospital admission?"},
+]
+
+# Admission limits of the real agents, mirrored by the stand-ins: (max_concurrency, max_queue, max_queue_time)
+STAND_IN_LIMITS = {
+    "health_agent": (2, 8, 60),
+    "policy_agent": (4, 16, 60),
+    "policy_batch_agent": (2, 4, 60),
+    "doctor_finder_agent": (4, 16, 60),
+    "doctor_agent": (2, 8, 60),
+}
+
+
+@dataclass
+class Outcome:
+    kind: str
+    sent: float
+    finished: Optional[float] = None
+    status: str = "in_flight"  # ok | error | timeout | rejected | in_flight
+
+    @property
+    def latency(self) -> Optional[float]:
+        return None if self.finished is None else self.finished - self.sent
+
+
+@dataclass
+class LoadReport:
+    duration: float
+    outcomes: List[Outcome] = field(default_factory=list)
+    dropped: int = 0
+    series: List[Dict[str, object]] = field(default_factory=list)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def load_corpus(path: Optional[str], kinds: Optional[List[str]]) -> List[Dict[str, str]]:
+    """Queries from a JSONL file (kind, url, agent, input and optional priority per line), or the built-in corpus."""
+    if path:
+        with open(path, encoding="utf-8") as f:
+            corpus = [json.loads(line) for line in f if line.strip()]
+    else:
+        corpus = list(DEFAULT_CORPUS)
+    if kinds:
+        corpus = [entry for entry in corpus if entry["kind"] in kinds]
+    if not corpus:
+        raise SystemExit("The corpus is empty")
+    return corpus
+
+
+def run_payload(agent: str, text: str) -> str:
+    return RunCreateRequest(
+        agent_name=agent, input=[Message(parts=[MessagePart(content=text)])], mode=RunMode.SYNC
+    ).model_dump_json()
+
+
+async def send(client: httpx.AsyncClient, entry: Dict[str, str], outcome: Outcome, timeout: float) -> None:
+    headers = {"Content-Type": "application/json"}
+    if entry.get("priority"):
+        headers["ACP-Priority"] = entry["priority"]
+    try:
+        response = await client.post(
+            f"{entry['url'].rstrip('/')}/runs",
+            content=run_payload(entry["agent"], entry["input"]),
+            headers=headers,
+            timeout=timeout,
+        )
+        if response.status_code == 429:
+            outcome.status = "rejected"
+        elif response.status_code >= 400 or response.json().get("status") != "completed":
+            outcome.status = "error"
+        else:
+            outcome.status = "ok"
+    except httpx.TimeoutException:
+        outcome.status = "timeout"
+    except (httpx.HTTPError, ValueError):
+        outcome.status = "error"
+    outcome.finished = time.perf_counter()
+
+
+async def queue_depths(client: httpx.AsyncClient, urls: List[str]) -> Dict[str, int]:
+    """Runs waiting for a slot per server, from GET /admission; servers without it are skipped."""
+    depths = {}
+    for url in urls:
+        try:
+            response = await client.get(f"{url.rstrip('/')}/admission", timeout=2.0)
+            if response.status_code == 200:
+                depths[url] = sum(limiter["queue_depth"] for limiter in response.json().values())
+        except (httpx.HTTPError, ValueError):
+            pass
+    return depths
+
+
+async def generate(
+    corpus: List[Dict[str, str]],
+    rps: float,
+    duration: float,
+    timeout: float,
+    interval: float,
+    max_in_flight: int,
+    seed: Optional[int],
+) -> LoadReport:
+    """Offer Poisson arrivals at `rps` for `duration` seconds, then wait for the runs in flight."""
+    rng = random.Random(seed)
+    report = LoadReport(duration=duration)
+    urls = sorted({entry["url"] for entry in corpus})
+    tasks = set()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(limits=limits) as client, httpx.AsyncClient() as probe:
+        start = time.perf_counter()
+        sampler = asyncio.create_task(sample(report, probe, urls, start, interval))
+        next_arrival = start
+        while True:
+            next_arrival += rng.expovariate(rps)
+            if next_arrival - start >= duration:
+                break
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            if len(tasks) >= max_in_flight:
+                # The client itself is saturated; count it rather than let the offered load drift down
+                report.dropped += 1
+                continue
+            entry = rng.choice(corpus)
+            outcome = Outcome(kind=entry["kind"], sent=time.perf_counter())
+            report.outcomes.append(outcome)
+            task = asyncio.create_task(send(client, entry, outcome, timeout))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(set(tasks))
+        sampler.cancel()
+        await sample_once(report, probe, urls, start)
+    return report
+
+
+async def sample(report: LoadReport, probe: httpx.AsyncClient, urls: List[str], start: float, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval - (time.perf_counter() - start) % interval)
+        await sample_once(report, probe, urls, start)
+
+
+async def sample_once(report: LoadReport, probe: httpx.AsyncClient, urls: List[str], start: float) -> None:
+    """Record and print the time series since the previous sample."""
+    now = time.perf_counter()
+    since = start + report.series[-1]["t"] if report.series else start
+    finished = [o for o in report.outcomes if o.finished is not None and o.finished > since]
+    latencies = [o.latency for o in finished if o.status == "ok"]
+    point = {
+        "t": round(now - start, 1),
+        "sent": sum(1 for o in report.outcomes if o.sent > since),
+        "ok": len(latencies),
+        "errors": sum(1 for o in finished if o.status == "error"),
+        "timeouts": sum(1 for o in finished if o.status == "timeout"),
+        "rejected": sum(1 for o in finished if o.status == "rejected"),
+        "in_flight": sum(1 for o in report.outcomes if o.finished is None),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "server_queue": await queue_depths(probe, urls),
+    }
+    report.series.append(point)
+    queue = sum(point["server_queue"].values()) if point["server_queue"] else "-"
+    print(
+        f"t={point['t']:>6}s sent {point['sent']:>4} ok {point['ok']:>4} err {point['errors']:>3} "
+        f"timeout {point['timeouts']:>3} 429 {point['rejected']:>3} in-flight {point['in_flight']:>4} "
+        f"server queue {queue:>4} p50 {_seconds(point['p50'])} p95 {_seconds(point['p95'])}"
+    )
+
+
+def summarize(report: LoadReport) -> Dict[str, Dict[str, object]]:
+    """Per query kind and overall: counts, rates, achieved throughput and latency percentiles."""
+    groups: Dict[str, List[Outcome]] = {"all": report.outcomes}
+    for outcome in report.outcomes:
+        groups.setdefault(outcome.kind, []).append(outcome)
+    summary = {}
+    for name, outcomes in groups.items():
+        sent = len(outcomes)
+        latencies = [o.latency for o in outcomes if o.status == "ok"]
+        counts = {status: sum(1 for o in outcomes if o.status == status) for status in ("ok", "error", "timeout", "rejected")}
+        summary[name] = {
+            "sent": sent,
+            **counts,
+            "throughput_rps": counts["ok"] / report.duration,
+            "error_rate": counts["error"] / sent if sent else 0.0,
+            "timeout_rate": counts["timeout"] / sent if sent else 0.0,
+            "reject_rate": counts["rejected"] / sent if sent else 0.0,
+            **{f"p{q}": percentile(latencies, q) for q in (50, 90, 95, 99)},
+            "mean": statistics.fmean(latencies) if latencies else None,
+        }
+    return summary
+
+
+def print_summary(summary: Dict[str, Dict[str, object]], report: LoadReport, rps: float) -> None:
+    offered = len(report.outcomes) + report.dropped
+    print(f"\nOffered {offered} runs ({offered / report.duration:.2f}/s, target {rps:.2f}/s), dropped client-side {report.dropped}")
+    print(
+        f"{'kind':<8}{'sent':>7}{'ok':>7}{'rps':>8}{'err%':>7}{'tmo%':>7}{'429%':>7}"
+        f"{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}"
+    )
+    for name, row in summary.items():
+        print(
+            f"{name:<8}{row['sent']:>7}{row['ok']:>7}{row['throughput_rps']:>8.2f}"
+            f"{row['error_rate'] * 100:>7.1f}{row['timeout_rate'] * 100:>7.1f}{row['reject_rate'] * 100:>7.1f}"
+            + "".join(f"{_seconds(row[f'p{q}']):>9}" for q in (50, 90, 95, 99))
+        )
+
+
+def _seconds(value: Optional[float]) -> str:
+    return f"{value:.2f}s" if value is not None else "-"
+
+
+# === Offline stand-in servers ===
+
+
+class FakeLLM:
+    """
+    Stands in for a model call: log-normal latency around `latency` seconds and an optional failure rate.
+
+    Args:
+        latency (float): Median seconds per call.
+        jitter (float): Sigma of the log-normal distribution; 0 for a constant latency.
+        error_rate (float): Share of calls that raise.
+        cpu (float): Seconds of CPU-bound work per call, run on the event loop like in-process work.
+    """
+
+    def __init__(self, latency: float = 2.0, jitter: float = 0.5, error_rate: float = 0.0, cpu: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.cpu = cpu
+
+    async def complete(self, prompt: str) -> str:
+        busy_until = time.thread_time() + self.cpu
+        while time.thread_time() < busy_until:
+            pass
+        await asyncio.sleep(random.lognormvariate(math.log(self.latency), self.jitter) if self.latency > 0 else 0)
+        if random.random() < self.error_rate:
+            raise RuntimeError("Fake LLM error")
+        return f"Stand-in answer to: {prompt[:200]}"
+
+
+def stand_in_server(agents: List[str], llm: FakeLLM):
+    """An ACP server exposing `agents`, each answering through the fake LLM behind the real admission limits."""
+    from acp_sdk.server import Server
+
+    from admission import AdmissionController
+
+    server = Server()
+    admission = AdmissionController()
+
+    def register(agent_name: str) -> None:
+        max_concurrency, max_queue, max_queue_time = STAND_IN_LIMITS.get(agent_name, (4, 16, 60))
+
+        @admission.limit(max_concurrency=max_concurrency, max_queue=max_queue, max_queue_time=max_queue_time, name=agent_name)
+        async def agent(input: List[Message]):
+            answer = await llm.complete(str(input[0].parts[0].content))
+            yield Message(parts=[MessagePart(content=answer)])
+
+        server.agent(name=agent_name, description=f"Stand-in for {agent_name} answering with a fake LLM")(agent)
+
+    for agent_name in agents:
+        register(agent_name)
+    return server, admission
+
+
+def create_stand_in_app():
+    """App factory for stand-in worker processes; the parent passes its settings in LOADGEN_STAND_IN."""
+    from serving import build_app
+
+    config = json.loads(os.environ["LOADGEN_STAND_IN"])
+    server, admission = stand_in_server(config["agents"], FakeLLM(**config["llm"]))
+    return build_app(server, admission)
+
+
+def start_stand_ins(
+    corpus: List[Dict[str, str]], latency: float, jitter: float, error_rate: float, cpu: float = 0.0, workers: int = 1
+) -> List[subprocess.Popen]:
+    """Start one stand-in per local server in the corpus and wait until they all answer."""
+    agents_by_url: Dict[str, set] = {}
+    for entry in corpus:
+        agents_by_url.setdefault(entry["url"].rstrip("/"), set()).add(entry["agent"])
+    processes = []
+    for url, agents in agents_by_url.items():
+        parsed = httpx.URL(url)
+        if parsed.host not in ("127.0.0.1", "localhost"):
+            raise SystemExit(f"--stand-ins only replaces local servers, not {url}")
+        processes.append(subprocess.Popen([
+            sys.executable, __file__, "stand-in", "--port", str(parsed.port), "--agents", ",".join(sorted(agents)),
+            "--latency", str(latency), "--jitter", str(jitter), "--error-rate", str(error_rate),
+            "--cpu", str(cpu), "--workers", str(workers),
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    deadline = time.monotonic() + 30
+    for url in agents_by_url:
+        while True:
+            try:
+                if httpx.get(f"{url}/agents", timeout=1.0).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                stop(processes)
+                raise SystemExit(f"Stand-in for {url} did not start")
+            time.sleep(0.1)
+    return processes
+
+
+def stop(processes: List[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Open-loop Poisson load generator for the ACP agent servers")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Offer load and report throughput, latency and errors")
+    run.add_argument("--rps", type=float, default=1.0, help="Mean arrival rate (runs per second)")
+    run.add_argument("--duration", type=float, default=60.0, help="Seconds to offer load for")
+    run.add_argument("--corpus", help="JSONL file of {kind, url, agent, input}; built-in queries by default")
+    run.add_argument("--kinds", help="Comma-separated query kinds to use, e.g. health,policy")
+    run.add_argument("--timeout", type=float, default=180.0, help="Seconds before a run counts as timed out")
+    run.add_argument("--interval", type=float, default=5.0, help="Seconds per time-series line")
+    run.add_argument("--max-in-flight", type=int, default=1000, help="Client-side cap on outstanding runs")
+    run.add_argument("--seed", type=int, help="Seed for arrivals and query choice")
+    run.add_argument("--output", help="Write the summary and time series to this JSON file")
+    run.add_argument("--stand-ins", action="store_true", help="Start local fake-LLM servers for the corpus")
+    run.add_argument("--fake-latency", type=float, default=2.0, help="Stand-in median LLM latency (seconds)")
+    run.add_argument("--fake-jitter", type=float, default=0.5, help="Stand-in log-normal sigma")
+    run.add_argument("--fake-error-rate", type=float, default=0.0, help="Stand-in share of failing LLM calls")
+    run.add_argument("--fake-cpu", type=float, default=0.0, help="Stand-in CPU seconds per call")
+    run.add_argument(
+        "--workers", type=int, default=int(os.getenv("ACP_WORKERS", "1")), help="Stand-in worker processes (ACP_WORKERS)"
+    )
+
+    stand_in = commands.add_parser("stand-in", help="Serve fake-LLM agents (started by run --stand-ins)")
+    stand_in.add_argument("--port", type=int, required=True)
+    stand_in.add_argument("--agents", required=True, help="Comma-separated agent names")
+    stand_in.add_argument("--latency", type=float, default=2.0)
+    stand_in.add_argument("--jitter", type=float, default=0.5)
+    stand_in.add_argument("--error-rate", type=float, default=0.0)
+    stand_in.add_argument("--cpu", type=float, default=0.0)
+    stand_in.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "stand-in":
+        from serving import serve, serve_workers
+
+        llm = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate, "cpu": args.cpu}
+        if args.workers > 1:
+            os.environ["LOADGEN_STAND_IN"] = json.dumps({"agents": args.agents.split(","), "llm": llm})
+            serve_workers("loadgen:create_stand_in_app", workers=args.workers, port=args.port, log_level="warning")
+        else:
+            server, admission = stand_in_server(args.agents.split(","), FakeLLM(**llm))
+            serve(server, admission, port=args.port, log_level="warning")
+        return
+
+    corpus = load_corpus(args.corpus, args.kinds.split(",") if args.kinds else None)
+    processes = (
+        start_stand_ins(corpus, args.fake_latency, args.fake_jitter, args.fake_error_rate, args.fake_cpu, args.workers)
+        if args.stand_ins
+        else []
+    )
+    try:
+        print(f"Offering {args.rps}/s for {args.duration:.0f}s over {len(corpus)} queries")
+        report = asyncio.run(
+            generate(corpus, args.rps, args.duration, args.timeout, args.interval, args.max_in_flight, args.seed)
+        )
+    finally:
+        stop(processes)
+    summary = summarize(report)
+    print_summary(summary, report, args.rps)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"rps": args.rps, "dropped": report.dropped, "summary": summary, "series": report.series}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from compression import content_words
+from routing import stems
+
+# === Plan cache for ACPCallingAgent ===
+#
+# Recurring queries follow the same plan ("health_agent, then policy_agent
+# with the health context, then final_answer"), yet the planner re-derives it
+# with an LLM call per step. PlanCache turns successful planner runs into
+# templates keyed by the query's intent (its set of word stems) and hands the
+# template back for similar queries, so ACPCallingAgent can run the agent calls
+# directly. If a cached step fails, the plan is dropped and the run continues
+# with LLM planning from the observations collected so far.
+
+# A step prompt uses earlier responses when this share of their content words reappears in it
+CONTEXT_OVERLAP = 0.5
+
+
+@dataclass
+class PlanStep:
+    """One agent call of a plan; `prompt` may use {query} and {<agent>_response}."""
+    agent: str
+    prompt: str
+
+
+@dataclass
+class Plan:
+    """
+    Agent calls answering a kind of query.
+
+    `answer` is the agent whose response is the final answer, or None when the
+    planner wrote its own, which ACPCallingAgent then writes with one LLM call
+    over every response.
+    """
+    steps: List[PlanStep]
+    answer: Optional[str] = None
+    intent: List[str] = field(default_factory=list)
+    uses: int = 0
+
+    @property
+    def agents(self) -> List[str]:
+        return [step.agent for step in self.steps]
+
+    def to_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "Plan":
+        return cls(
+            steps=[PlanStep(**step) for step in data["steps"]],
+            answer=data.get("answer"),
+            intent=list(data.get("intent", [])),
+            uses=int(data.get("uses", 0)),
+        )
+
+
+def intent_of(query: str) -> frozenset:
+    return frozenset(stems(query))
+
+
+def _uses_response(prompt: str, response: str) -> bool:
+    words = set(content_words(response))
+    return bool(words) and len(words & set(content_words(prompt))) >= CONTEXT_OVERLAP * len(words)
+
+
+def template_from_run(query: str, calls: Iterable[Tuple[str, str, str]], answer: object) -> Optional[Plan]:
+    """
+    Generalize a successful run into a plan.
+
+    Every step gets the user's query, prefixed with the earlier responses its
+    original prompt drew on. The answer is the response it repeats, if any.
+
+    Args:
+        query (str): The query the run answered.
+        calls (Iterable[Tuple[str, str, str]]): (agent, prompt, response) per agent call, in order.
+        answer: The run's final answer.
+
+    Returns:
+        Plan or None: None when the run called no agents.
+    """
+    steps = []
+    previous: List[Tuple[str, str]] = []
+    for agent, prompt, response in calls:
+        context = [name for name, earlier in previous if _uses_response(prompt, earlier)]
+        if context:
+            responses = "\n\n".join("{" + f"{name}_response" + "}" for name in dict.fromkeys(context))
+            steps.append(PlanStep(agent, f"Context: {responses}\n\n{{query}}"))
+        else:
+            steps.append(PlanStep(agent, "{query}"))
+        previous.append((agent, response))
+    if not steps:
+        return None
+    final = next((agent for agent, response in reversed(previous) if str(answer).strip() == response.strip()), None)
+    return Plan(steps=steps, answer=final, intent=sorted(intent_of(query)))
+
+
+class PlanCache:
+    """
+    Plans learned from successful runs, looked up by query intent.
+
+    Args:
+        min_similarity (float): Jaccard similarity of word stems a query needs with a cached intent.
+        max_plans (int): Plans kept; the least used are dropped first.
+        path (str, optional): JSON file the plans are saved to and loaded from.
+    """
+
+    def __init__(self, min_similarity: float = 0.6, max_plans: int = 256, path: Optional[str] = None):
+        self.min_similarity = min_similarity
+        self.max_plans = max_plans
+        self.path = path
+        self._plans: Dict[frozenset, Plan] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "learned": 0, "failures": 0, "llm_calls_saved": 0}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for data in json.load(f):
+                    plan = Plan.from_dict(data)
+                    self._plans[frozenset(plan.intent)] = plan
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def lookup(self, query: str, agents: Iterable[str]) -> Optional[Plan]:
+        """The cached plan for the most similar intent whose agents are all available, if any."""
+        intent = intent_of(query)
+        available = set(agents)
+        best, best_similarity = None, self.min_similarity
+        with self._lock:
+            for key, plan in self._plans.items():
+                similarity = len(intent & key) / len(intent | key) if intent | key else 0.0
+                if similarity >= best_similarity and set(plan.agents) <= available:
+                    best, best_similarity = plan, similarity
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            best.uses += 1
+            self.stats["hits"] += 1
+        return best
+
+    def learn(self, query: str, calls: List[Tuple[str, str, str]], answer: object) -> Optional[Plan]:
+        """Cache the plan of a run the planner completed without errors."""
+        plan = template_from_run(query, calls, answer)
+        if plan is None:
+            return None
+        with self._lock:
+            self._plans[frozenset(plan.intent)] = plan
+            if len(self._plans) > self.max_plans:
+                least_used = min(self._plans, key=lambda key: self._plans[key].uses)
+                del self._plans[least_used]
+            self.stats["learned"] += 1
+        self.save()
+        return plan
+
+    def record_success(self, plan: Plan) -> None:
+        # One planning call per agent call, plus the final answer unless one LLM call still writes it
+        self.stats["llm_calls_saved"] += len(plan.steps) + (plan.answer is not None)
+
+    def record_failure(self, plan: Plan) -> None:
+        """Drop a plan whose step failed; the planner will relearn it if it still applies."""
+        with self._lock:
+            self._plans.pop(frozenset(plan.intent), None)
+            self.stats["failures"] += 1
+        self.save()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            plans = [plan.to_dict() for plan in self._plans.values()]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        staging = f"{self.path}.tmp{os.getpid()}"
+        with open(staging, "w", encoding="utf-8") as f:
+            json.dump(plans, f)
+        os.replace(staging, self.path)
+
+    def summary(self) -> str:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return (
+            f"Plan cache: {len(self)} plans, {self.stats['hits']}/{lookups} queries served from cache, "
+            f"{self.stats['failures']} fell back to the planner, {self.stats['llm_calls_saved']} LLM calls saved"
+        )
@@ -0,0 +1,436 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from pypdf import PdfReader
+
+from embedding_cache import EmbeddingCache
+
+# === In-process retrieval index over policy documents ===
+#
+# RagTool embeds and searches one query at a time. This index keeps the chunk
+# embeddings in a single matrix so a whole batch of questions can be embedded
+# in one call and scored against every chunk with one matrix product, and keeps
+# a BM25 index over the same chunks so exact-term queries need no embedding.
+
+
+@dataclass
+class Chunk:
+    """A piece of a policy document."""
+    id: int
+    source: str
+    text: str
+
+
+def chunk_text(text: str, chunk_size: int = 1200, chunk_overlap: int = 200) -> List[str]:
+    """Split text into overlapping character windows (same settings as the RagTool config)."""
+    text = " ".join(text.split())
+    if not text:
+        return []
+    step = chunk_size - chunk_overlap
+    return [text[start:start + chunk_size] for start in range(0, max(len(text) - chunk_overlap, 1), step)]
+
+
+# === Lexical (BM25) index ===
+
+STOPWORDS = {
+    "a", "about", "am", "an", "and", "any", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "i", "if", "in", "is", "it", "my", "of", "on", "or", "the", "there", "this", "to", "what", "when",
+    "which", "will", "with", "would", "you", "your",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased content words plus adjacent-word bigrams, so phrases like "waiting period" match exactly."""
+    words = [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS]
+    return words + [f"{first}_{second}" for first, second in zip(words, words[1:])]
+
+
+class BM25Index:
+    """
+    Inverted index with Okapi BM25 scoring. Documents are identified by their
+    insertion position, which matches the chunk ids of PolicyIndex.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+
+    def add(self, text: str) -> None:
+        doc_id = len(self.doc_lengths)
+        tokens = tokenize(text)
+        for term, count in Counter(tokens).items():
+            self.postings[term][doc_id] = count
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+
+    def idf(self, term: str) -> float:
+        matches = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.doc_lengths) - matches + 0.5) / (matches + 0.5))
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """BM25 score of every document containing at least one query term."""
+        if not self.doc_lengths:
+            return {}
+        avg_length = self.total_length / len(self.doc_lengths)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, count in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * count * (self.k1 + 1) / (count + norm)
+        return scores
+
+    def coverage(self, query: str, doc_id: int) -> float:
+        """Fraction of the query's content words that appear in a document."""
+        words = {term for term in tokenize(query) if "_" not in term}
+        if not words:
+            return 0.0
+        return sum(doc_id in self.postings.get(word, ()) for word in words) / len(words)
+
+
+def _top_k(scores: Dict[int, float], k: int) -> List[Tuple[int, float]]:
+    return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+# === Hybrid policy index ===
+
+class PolicyIndex:
+    """
+    Chunks, embeddings and hybrid (BM25 + vector) search over policy documents.
+
+    Queries whose content words are all found in the best lexical match are
+    answered from the BM25 index alone, skipping the remote embedding call.
+    Other queries are embedded and ranked on a blend of both scores. Without an
+    embedding model, or when the embedding service fails, retrieval is lexical.
+    A document whose chunks could not be embedded is indexed with zero vectors
+    and ranked on its lexical score alone until `embed_missing` succeeds; the
+    other documents keep their vectors.
+
+    Args:
+        embedding_model (str, optional): LiteLLM embedding model id, None for lexical-only retrieval.
+        chunk_size (int): Characters per chunk.
+        chunk_overlap (int): Characters shared by consecutive chunks.
+        lexical_confidence (float): Query-word coverage of the best BM25 hit needed to skip embeddings.
+        dense_weight (float): Weight of the vector score in the hybrid blend.
+        cache (EmbeddingCache, optional): Cache consulted before every embedding request.
+    """
+
+    def __init__(
+        self,
+        embedding_model: Optional[str] = "text-embedding-ada-002",
+        chunk_size: int = 1200,
+        chunk_overlap: int = 200,
+        lexical_confidence: float = 1.0,
+        dense_weight: float = 0.5,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self.embedding_model = embedding_model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.lexical_confidence = lexical_confidence
+        self.dense_weight = dense_weight
+        self.cache = cache
+        self.chunks: List[Chunk] = []
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.lexical = BM25Index()
+        # Sources whose chunks have no vectors yet (their rows are zero, or the matrix is still empty)
+        self.unembedded: Set[str] = set()
+        self.stats = {"lexical": 0, "hybrid": 0, "embedding_failures": 0}
+        # Guards index mutation against concurrent lexical scoring
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts with at most one embedding request and L2-normalise the rows.
+        Texts found in the embedding cache are not sent.
+        """
+        if not texts:
+            return np.zeros((0, self.embeddings.shape[1]), dtype=np.float32)
+        if self.cache is None:
+            return self._embed_remote(texts)
+
+        cached = self.cache.get_many(self.embedding_model, texts)
+        missing = [i for i in range(len(texts)) if i not in cached]
+        if missing:
+            fresh = self._embed_remote([texts[i] for i in missing])
+            self.cache.put_many(self.embedding_model, [texts[i] for i in missing], fresh)
+            cached.update(zip(missing, fresh))
+        return np.stack([cached[i] for i in range(len(texts))])
+
+    def _embed_remote(self, texts: List[str]) -> np.ndarray:
+        import litellm  # slow to import; only needed once something is actually embedded
+
+        response = litellm.embedding(model=self.embedding_model, input=texts)
+        vectors = np.array([item["embedding"] for item in response.data], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add_texts(self, texts: List[str], source: str, vectors: Optional[np.ndarray] = None) -> None:
+        """
+        Index already chunked texts.
+
+        Args:
+            texts (list[str]): Chunks to add.
+            source (str): Document the chunks come from.
+            vectors (np.ndarray, optional): Precomputed normalised embeddings; computed here when omitted.
+        """
+        vectors = self._vectors_for(texts, source, vectors)
+        with self._lock:
+            self._insert(texts, source, vectors)
+
+    def replace_source(
+        self, texts: List[str], source: str, vectors: Optional[np.ndarray] = None
+    ) -> Optional[np.ndarray]:
+        """
+        Swap a document's chunks for new ones in one step, so queries see either
+        the old version or the new one, never neither. Embedding happens first,
+        outside the lock.
+
+        Returns:
+            np.ndarray or None: The vectors indexed for the chunks, None if they went without.
+        """
+        vectors = self._vectors_for(texts, source, vectors)
+        with self._lock:
+            self._remove(source)
+            self._insert(texts, source, vectors)
+        return vectors
+
+    def _vectors_for(self, texts: List[str], source: str, vectors: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if not self.embedding_model or vectors is not None or not texts:
+            return vectors
+        try:
+            return self.embed(texts)
+        except Exception as e:
+            # Only this document goes without vectors; embed_missing retries it later
+            print(f"Embedding {source} failed, it is searched lexically until re-embedded: {e}")
+            self.stats["embedding_failures"] += 1
+            return None
+
+    def _insert(self, texts: List[str], source: str, vectors: Optional[np.ndarray]) -> None:
+        """Append chunks; the caller holds the lock."""
+        if self.embedding_model and texts:
+            if vectors is None:
+                self.unembedded.add(source)
+                if len(self.embeddings):
+                    vectors = np.zeros((len(texts), self.embeddings.shape[1]), dtype=np.float32)
+            elif not len(self.embeddings) and self.chunks:
+                # First vectors of the index: earlier chunks all went without, give them zero rows
+                self.embeddings = np.zeros((len(self.chunks), vectors.shape[1]), dtype=np.float32)
+            if vectors is not None:
+                self.embeddings = vectors if not len(self.embeddings) else np.vstack([self.embeddings, vectors])
+        start = len(self.chunks)
+        self.chunks.extend(Chunk(id=start + i, source=source, text=text) for i, text in enumerate(texts))
+        for text in texts:
+            self.lexical.add(text)
+
+    def embed_missing(self) -> Dict[str, Tuple[List[str], np.ndarray]]:
+        """
+        Retry embedding the documents whose embedding failed.
+
+        Returns:
+            dict: (chunk texts, vectors) of every document embedded now, by source.
+        """
+        embedded = {}
+        for source in sorted(self.unembedded):
+            with self._lock:
+                texts = [chunk.text for chunk in self.chunks if chunk.source == source]
+            try:
+                vectors = self.embed(texts)
+            except Exception as e:
+                print(f"Embedding {source} failed again: {e}")
+                self.stats["embedding_failures"] += 1
+                continue
+            with self._lock:
+                ids = [chunk.id for chunk in self.chunks if chunk.source == source]
+                if len(ids) != len(texts):
+                    continue  # Replaced meanwhile
+                if not len(self.embeddings):
+                    self.embeddings = np.zeros((len(self.chunks), vectors.shape[1]), dtype=np.float32)
+                elif not self.embeddings.flags.writeable:
+                    self.embeddings = np.array(self.embeddings)
+                self.embeddings[ids] = vectors
+                self.unembedded.discard(source)
+            embedded[source] = (texts, vectors)
+        return embedded
+
+    def load(self, chunks: List[Tuple[str, str]], embeddings: Optional[np.ndarray] = None) -> None:
+        """
+        Replace the whole index with (source, text) chunks and their embedding matrix.
+        The matrix is used as given, so a read-only memory map stays shared between processes.
+        """
+        lexical = BM25Index(self.lexical.k1, self.lexical.b)
+        for _, text in chunks:
+            lexical.add(text)
+        with self._lock:
+            self.chunks = [Chunk(id=i, source=source, text=text) for i, (source, text) in enumerate(chunks)]
+            self.lexical = lexical
+            if self.embedding_model and embeddings is not None and len(embeddings) == len(chunks):
+                self.embeddings = embeddings
+                missing = ~np.asarray(embeddings).any(axis=1)
+                self.unembedded = {chunk.source for chunk, zero in zip(self.chunks, missing) if zero}
+            else:
+                # No vectors for these chunks: serve lexical results until a snapshot with vectors comes
+                self.embeddings = np.zeros((0, 0), dtype=np.float32)
+                self.unembedded = {chunk.source for chunk in self.chunks} if self.embedding_model else set()
+
+    def add_pdf(self, path: str) -> None:
+        """Extract, chunk and embed a PDF."""
+        text = "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+        self.add_texts(chunk_text(text, self.chunk_size, self.chunk_overlap), source=path)
+
+    def remove_source(self, source: str) -> int:
+        """Drop every chunk of a document and renumber the rest. Returns the number of chunks removed."""
+        with self._lock:
+            return self._remove(source)
+
+    def _remove(self, source: str) -> int:
+        """remove_source; the caller holds the lock."""
+        self.unembedded.discard(source)
+        keep = [chunk for chunk in self.chunks if chunk.source != source]
+        removed = len(self.chunks) - len(keep)
+        if not removed:
+            return 0
+        if len(self.embeddings):
+            self.embeddings = self.embeddings[[chunk.id for chunk in keep]]
+        self.chunks = [Chunk(id=i, source=chunk.source, text=chunk.text) for i, chunk in enumerate(keep)]
+        self.lexical = BM25Index(self.lexical.k1, self.lexical.b)
+        for chunk in self.chunks:
+            self.lexical.add(chunk.text)
+        return removed
+
+    def sources(self) -> List[str]:
+        return sorted({chunk.source for chunk in self.chunks})
+
+    def _lexical(self, query: str, k: int) -> Tuple[List[Tuple[int, float]], Dict[int, float], bool]:
+        scores = self.lexical.scores(query)
+        hits = _top_k(scores, k)
+        confident = bool(hits) and self.lexical.coverage(query, hits[0][0]) >= self.lexical_confidence
+        return hits, scores, confident
+
+    def _blend(
+        self, dense: np.ndarray, lexical: Dict[int, float], k: int, missing: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Min-max normalise both score sets and combine them with dense_weight.
+        Chunks without vectors (`missing`) are ranked on their lexical score alone.
+        """
+        top_lexical = max(lexical.values(), default=0.0) or 1.0
+        lexical_scores = np.zeros(len(dense), dtype=np.float32)
+        for doc_id, score in lexical.items():
+            lexical_scores[doc_id] = score / top_lexical
+        embedded = dense if missing is None or not missing.any() else dense[~missing]
+        if not len(embedded):
+            embedded = dense
+        dense_range = float(embedded.max() - embedded.min()) or 1.0
+        dense_scores = (dense - embedded.min()) / dense_range
+        if missing is not None:
+            dense_scores[missing] = lexical_scores[missing]
+        blended = self.dense_weight * dense_scores + (1 - self.dense_weight) * lexical_scores
+        k = min(k, len(blended))
+        top = np.argpartition(-blended, k - 1)[:k]
+        return [(int(idx), float(blended[idx])) for idx in sorted(top, key=lambda idx: -blended[idx])]
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[Chunk, float]]:
+        """Retrieve the top-k chunks for one query (see search_batch)."""
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, questions: List[str], k: int = 4) -> List[List[Tuple[Chunk, float]]]:
+        """
+        Retrieve the top-k chunks for every question in one pass over the index.
+
+        Lexically confident questions are served from BM25; the rest are embedded
+        together in a single request and ranked on the hybrid score.
+
+        Args:
+            questions (list[str]): Questions to retrieve for.
+            k (int): Chunks per question.
+
+        Returns:
+            list[list[tuple[Chunk, float]]]: (chunk, score) pairs per question, best first.
+        """
+        # Score lexically and capture a consistent view of the index; the
+        # remote embedding call below runs without holding the lock
+        with self._lock:
+            chunks, embeddings = self.chunks, self.embeddings
+            if not questions or not chunks:
+                return [[] for _ in questions]
+            # Zero rows are chunks whose document is waiting to be re-embedded
+            vectors_ready = bool(self.embedding_model) and len(embeddings) == len(chunks)
+            missing = ~embeddings.any(axis=1) if vectors_ready and self.unembedded else None
+            results = []
+            pending = []
+            for question in questions:
+                hits, scores, confident = self._lexical(question, k)
+                results.append(hits)
+                if confident or not vectors_ready:
+                    self.stats["lexical"] += 1
+                else:
+                    pending.append((len(results) - 1, scores))
+
+        if pending:
+            try:
+                query_vectors = self.embed([questions[i] for i, _ in pending])
+                dense = query_vectors @ embeddings.T
+                for row, (i, scores) in enumerate(pending):
+                    results[i] = self._blend(dense[row], scores, k, missing)
+                self.stats["hybrid"] += len(pending)
+            except Exception as e:
+                # Keep answering from the lexical index when the embedding service is unavailable
+                print(f"Embedding failed, using lexical retrieval only: {e}")
+                self.stats["embedding_failures"] += 1
+                self.stats["lexical"] += len(pending)
+
+        return [[(chunks[chunk_id], score) for chunk_id, score in hits] for hits in results]
+
+    def group_by_context(
+        self, hits: List[List[Tuple[Chunk, float]]], max_questions: int = 4, max_chunks: int = 8
+    ) -> List["ContextGroup"]:
+        """
+        Group a batch's questions that retrieved some of the same chunks, so each
+        group is answered from one copy of its documentation.
+
+        Args:
+            hits (list): search_batch results.
+            max_questions (int): Largest number of questions in a group.
+            max_chunks (int): Largest number of distinct chunks in a group's context.
+
+        Returns:
+            list[ContextGroup]: Groups in order of their first question; every question is in exactly one.
+        """
+        groups: List[ContextGroup] = []
+        for question, question_hits in enumerate(hits):
+            ids = {chunk.id: chunk for chunk, _ in question_hits}
+            for group in groups:
+                shared = {chunk.id for chunk in group.chunks}
+                if (
+                    shared & ids.keys()
+                    and len(group.questions) < max_questions
+                    and len(shared | ids.keys()) <= max_chunks
+                ):
+                    group.questions.append(question)
+                    group.chunks.extend(chunk for chunk_id, chunk in ids.items() if chunk_id not in shared)
+                    break
+            else:
+                groups.append(ContextGroup(questions=[question], chunks=list(ids.values())))
+        return groups
+
+
+@dataclass
+class ContextGroup:
+    """Questions of a batch answered together, and the distinct chunks they retrieved."""
+    questions: List[int]
+    chunks: List[Chunk]
@@ -0,0 +1,24 @@
+from typing import Any
+
+from crewai.tools import BaseTool
+
+from policy_index import PolicyIndex
+
+
+class PolicySearchTool(BaseTool):
+    """CrewAI tool searching a PolicyIndex (BM25 fast path, hybrid fallback)."""
+
+    name: str = "Search policy documents"
+    description: str = (
+        "Searches the insurance policy documentation and returns the most relevant passages. "
+        "Use short queries with the exact policy terms you are looking for, e.g. 'waiting period rehabilitation'."
+    )
+    index: Any = None
+    top_k: int = 4
+
+    def _run(self, query: str) -> str:
+        index: PolicyIndex = self.index
+        hits = index.search(query, self.top_k)
+        if not hits:
+            return "No relevant policy passages found."
+        return "\n\n".join(f"[{chunk.source}] {chunk.text}" for chunk, _ in hits)
@@ -0,0 +1,135 @@
+import random
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+
+# === Load-balanced agent replicas ===
+#
+# Insurer and hospital servers run as several replicas, each serving the same
+# agents. A ReplicaSet groups the clients of the servers serving an agent and
+# stands in for a single ACP client: every `run_sync` goes to the replica
+# picked by the balancing policy, using the requests each replica has
+# outstanding and its observed latency.
+#
+#   least_outstanding  fewest runs in flight, faster replica on ties
+#   power_of_two       two random replicas, the one with the lower expected
+#                      wait ((outstanding + 1) * latency); avoids herding many
+#                      orchestrators onto the same replica
+#
+# A replica that refuses the connection is skipped and the run sent to the
+# next one, since nothing ran there. Other errors are returned to the caller.
+# Replicas whose circuit is open (circuit.GuardedClient) are left out while
+# any other replica is available.
+
+LEAST_OUTSTANDING = "least_outstanding"
+POWER_OF_TWO = "power_of_two"
+
+
+class Replica:
+    """One server of a replica set with its load and latency."""
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.outstanding = 0
+        self.calls = 0
+        self.errors = 0
+        self.avg_latency: Optional[float] = None
+
+    @property
+    def available(self) -> bool:
+        return getattr(self.client, "available", True)
+
+    @property
+    def url(self) -> str:
+        http = getattr(self.client, "client", None)
+        return str(getattr(http, "base_url", "")) or repr(self.client)
+
+    def expected_wait(self) -> float:
+        # Unmeasured replicas look idle, so each one gets tried early and measured
+        return (self.outstanding + 1) * (self.avg_latency or 0.0)
+
+    def record(self, seconds: float) -> None:
+        self.calls += 1
+        self.avg_latency = seconds if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * seconds
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "outstanding": self.outstanding,
+            "calls": self.calls,
+            "errors": self.errors,
+            "avg_latency": self.avg_latency,
+        }
+
+
+class ReplicaSet:
+    """
+    Several clients serving the same agents, used like a single ACP client.
+
+    Args:
+        clients (List): ACP clients (or DetachedClients) of the replicas, or Replica objects
+            shared with the replica sets of the other agents on the same servers.
+        balancing (str): "least_outstanding" or "power_of_two".
+    """
+
+    def __init__(self, clients: List[Any], balancing: str = LEAST_OUTSTANDING):
+        if not clients:
+            raise ValueError("A replica set needs at least one client")
+        if balancing not in (LEAST_OUTSTANDING, POWER_OF_TWO):
+            raise ValueError(f"Unknown balancing policy: {balancing}")
+        self.replicas = [client if isinstance(client, Replica) else Replica(client) for client in clients]
+        self.balancing = balancing
+
+    def __len__(self) -> int:
+        return len(self.replicas)
+
+    @property
+    def available(self) -> bool:
+        return any(replica.available for replica in self.replicas)
+
+    def add(self, client: Any) -> None:
+        replica = client if isinstance(client, Replica) else Replica(client)
+        if all(existing.client is not replica.client for existing in self.replicas):
+            self.replicas.append(replica)
+
+    def pick(self, exclude: Optional[Set[int]] = None) -> Replica:
+        """The replica the next run should go to, skipping the positions in `exclude`."""
+        candidates = [replica for i, replica in enumerate(self.replicas) if i not in (exclude or set())]
+        candidates = [replica for replica in candidates if replica.available] or candidates
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.balancing == POWER_OF_TWO:
+            candidates = random.sample(candidates, 2)
+            return min(candidates, key=Replica.expected_wait)
+        fewest = min(replica.outstanding for replica in candidates)
+        idle = [replica for replica in candidates if replica.outstanding == fewest]
+        return min(idle, key=lambda replica: (replica.avg_latency or 0.0, random.random()))
+
+    async def run_sync(self, input: Any, *, agent: str, **kwargs: Any) -> Any:
+        tried: Set[int] = set()
+        while True:
+            replica = self.pick(tried)
+            replica.outstanding += 1
+            started = time.monotonic()
+            try:
+                run = await replica.client.run_sync(input, agent=agent, **kwargs)
+            except httpx.ConnectError:
+                replica.errors += 1
+                tried.add(self.replicas.index(replica))
+                if len(tried) == len(self.replicas):
+                    raise
+                continue
+            except Exception:
+                replica.errors += 1
+                raise
+            finally:
+                replica.outstanding -= 1
+            replica.record(time.monotonic() - started)
+            return run
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        return {replica.url: {**replica.snapshot(), "available": replica.available} for replica in self.replicas}
+
+    def __getattr__(self, name: str) -> Any:
+        # Anything else (sessions, agent discovery) goes to the first replica
+        return getattr(self.replicas[0].client, name)
@@ -0,0 +1,221 @@
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from compression import content_words
+
+# === Local routing for ACPCallingAgent ===
+#
+# Most orchestrated queries need exactly one agent, yet the planner spends a
+# full LLM round trip deciding "call policy_agent" and another one turning
+# its answer into a final answer. The router scores the query against each
+# agent's name, description and example queries locally (TF-IDF over word
+# stems, optionally blended with embedding similarity) and, when one agent
+# clearly wins, the agent is called directly and its answer returned.
+# Ambiguous queries, and ones whose clauses point at different agents, still
+# go to the LLM planner, and so do queries with a clause no agent clearly
+# matches: a router that can't tell what a clause asks for can't know the
+# winning agent answers it. One-line descriptions share too few words with real
+# queries ("hospital" is only in health_agent's, yet excess questions are for
+# policy_agent), so every agent starts from typical queries in SEED_EXAMPLES.
+# Queries the planner answered with a single agent are learned as examples of
+# that agent, so the hit rate grows with use.
+
+STEM_LENGTH = 5
+MAX_EXAMPLES = 200
+CLAUSE_SPLIT = re.compile(r"[?;.!]|\band\b|\balso\b|\bthen\b", re.IGNORECASE)
+
+# Typical queries of the agents served by the hospital and insurer servers
+SEED_EXAMPLES: Dict[str, List[str]] = {
+    "health_agent": [
+        "What are the symptoms of a rotator cuff tear and how is it treated?",
+        "Do I need physiotherapy after knee surgery?",
+        "How long does recovery from a hip replacement take?",
+        "What does rehabilitation involve after an operation on my shoulder?",
+        "Is it normal to have swelling and pain weeks after surgery?",
+        "What exercises help regain range of motion after a reconstruction?",
+        "What treatment options are there for diabetes?",
+        "Should I see a doctor or specialist about chest pain?",
+        "How should I prepare for a procedure at the hospital?",
+    ],
+    "policy_agent": [
+        "Is physiotherapy covered by my insurance?",
+        "What is the waiting period for hospital cover?",
+        "How much is the excess on my policy?",
+        "Does my insurance cover a hospital stay for surgery?",
+        "What benefits and limits apply to extras cover?",
+        "Are pre-existing conditions excluded from my cover?",
+        "How much will I get back when I claim for rehabilitation?",
+        "What gap do I pay for an inpatient admission?",
+        "Which premium tier includes joint reconstructions?",
+    ],
+}
+
+
+def stems(text: str) -> List[str]:
+    """Content words cut to a common prefix, so "policy"/"policies" and "cover"/"coverage" match."""
+    return [word[:STEM_LENGTH] for word in content_words(text.replace("_", " "))]
+
+
+@dataclass
+class Route:
+    """The agent a query was routed to and how every agent scored."""
+    agent: str
+    score: float
+    scores: Dict[str, float]
+
+
+class AgentRouter:
+    """
+    Route queries that clearly target a single agent without asking the LLM.
+
+    Args:
+        min_score (float): Similarity the best agent needs to be routed to directly.
+        max_runner_up (float): Largest allowed ratio of the second-best score to the best;
+            above it the query likely needs several agents and goes to the planner.
+        embed (Callable, optional): Embeds a list of texts (e.g. `PolicyIndex.embed`); blended
+            with the keyword score when given.
+        embed_weight (float): Weight of the embedding similarity in the blend.
+        examples (Dict[str, List[str]], optional): Typical queries per agent to start from;
+            SEED_EXAMPLES by default. Agents without examples are matched on their description alone.
+    """
+
+    def __init__(
+        self,
+        min_score: float = 0.15,
+        max_runner_up: float = 0.5,
+        embed: Optional[Callable[[List[str]], np.ndarray]] = None,
+        embed_weight: float = 0.5,
+        examples: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.min_score = min_score
+        self.max_runner_up = max_runner_up
+        self.embed = embed
+        self.embed_weight = embed_weight
+        self._names: List[str] = []
+        self._descriptions: Dict[str, str] = {}
+        self._examples: Dict[str, List[str]] = {
+            name: list(queries) for name, queries in (SEED_EXAMPLES if examples is None else examples).items()
+        }
+        self._profiles: Dict[str, str] = {}
+        self._idf: Dict[str, float] = {}
+        self._vectors: Dict[str, Dict[str, float]] = {}
+        self._embeddings: Optional[np.ndarray] = None
+        self.planner_seconds: Optional[float] = None
+        self.stats = {"queries": 0, "routed": 0, "fallbacks": 0, "llm_calls_saved": 0, "seconds_saved": 0.0}
+
+    def fit(self, descriptions: Dict[str, str], examples: Optional[Dict[str, List[str]]] = None) -> "AgentRouter":
+        """
+        Index agents by name, description and example queries; refit whenever the set of agents changes.
+
+        Args:
+            descriptions (Dict[str, str]): Description of every agent by name.
+            examples (Dict[str, List[str]], optional): Typical queries per agent, added to the ones already learned.
+
+        Returns:
+            AgentRouter: The router itself.
+        """
+        self._descriptions = dict(descriptions)
+        for name, queries in (examples or {}).items():
+            self._examples.setdefault(name, []).extend(queries)
+        self._names = list(descriptions)
+        self._profiles = {
+            name: " ".join([name, description, *self._examples.get(name, [])[-MAX_EXAMPLES:]])
+            for name, description in descriptions.items()
+        }
+        documents = {name: Counter(stems(profile)) for name, profile in self._profiles.items()}
+        # Words every agent's description shares ("agent", "questions") carry no routing signal
+        document_frequency = Counter(stem for counts in documents.values() for stem in counts)
+        self._idf = {stem: math.log((1 + len(documents)) / (1 + df)) for stem, df in document_frequency.items()}
+        self._vectors = {name: self._weigh(counts) for name, counts in documents.items()}
+        if self.embed is not None and self._names:
+            self._embeddings = _normalize(np.asarray(self.embed([self._profiles[name] for name in self._names])))
+        return self
+
+    def _weigh(self, counts: Counter) -> Dict[str, float]:
+        vector = {stem: (1 + math.log(count)) * self._idf.get(stem, 0.0) for stem, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {stem: weight / norm for stem, weight in vector.items() if weight} if norm else {}
+
+    def scores(self, query: str) -> Dict[str, float]:
+        """Similarity of the query to every agent, between 0 and 1."""
+        query_vector = self._weigh(Counter(stem for stem in stems(query) if stem in self._idf))
+        scores = {
+            name: sum(weight * self._vectors[name].get(stem, 0.0) for stem, weight in query_vector.items())
+            for name in self._names
+        }
+        if self._embeddings is not None:
+            similarity = self._embeddings @ _normalize(np.asarray(self.embed([query])))[0]
+            scores = {
+                name: (1 - self.embed_weight) * scores[name] + self.embed_weight * max(float(similarity[i]), 0.0)
+                for i, name in enumerate(self._names)
+            }
+        return scores
+
+    def _best(self, text: str) -> Optional[Route]:
+        scores = self.scores(text)
+        if not scores:
+            return None
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best, best_score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if best_score < self.min_score or runner_up > self.max_runner_up * best_score:
+            return None
+        return Route(agent=best, score=best_score, scores=scores)
+
+    def route(self, query: str) -> Optional[Route]:
+        """The single agent to call for `query`, or None when the planner should decide."""
+        self.stats["queries"] += 1
+        route = self._best(query)
+        if route is None:
+            return None
+        # "Do I need rehab ... and what is my waiting period?" asks two agents; a clause
+        # no agent clearly matches may ask for another one too, so the planner decides
+        clauses = [clause for clause in CLAUSE_SPLIT.split(query) if stems(clause)]
+        if len(clauses) > 1:
+            for clause in clauses:
+                clause_route = self._best(clause)
+                if clause_route is None or clause_route.agent != route.agent:
+                    return None
+        return route
+
+    def learn(self, agent: str, query: str) -> None:
+        """Remember a query the planner answered with `agent` alone as an example of it."""
+        if agent not in self._descriptions:
+            return
+        self._examples.setdefault(agent, []).append(query)
+        self.fit(self._descriptions)
+
+    def record_planner_call(self, seconds: float) -> None:
+        """Feed the latency of an LLM planning call, used to estimate the time routing saves."""
+        self.planner_seconds = seconds if self.planner_seconds is None else 0.8 * self.planner_seconds + 0.2 * seconds
+
+    def record_routed(self, llm_calls_saved: int = 2) -> None:
+        self.stats["routed"] += 1
+        self.stats["llm_calls_saved"] += llm_calls_saved
+        self.stats["seconds_saved"] += llm_calls_saved * (self.planner_seconds or 0.0)
+
+    def record_fallback(self) -> None:
+        """A routed call failed and the query went to the planner after all."""
+        self.stats["fallbacks"] += 1
+
+    @property
+    def hit_rate(self) -> float:
+        return self.stats["routed"] / self.stats["queries"] if self.stats["queries"] else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"Router: {self.stats['routed']}/{self.stats['queries']} queries routed locally ({self.hit_rate:.0%}), "
+            f"{self.stats['fallbacks']} fell back to the planner, {self.stats['llm_calls_saved']} LLM calls and "
+            f"~{self.stats['seconds_saved']:.1f}s saved"
+        )
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(vectors).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
@@ -1,63 +1,191 @@
 from collections.abc import AsyncGenerator
 from acp_sdk.models import Message, MessagePart
 from acp_sdk.server import Context, RunYield, RunYieldResume, Server
-from smolagents import CodeAgent, DuckDuckGoSearchTool, LiteLLMModel, VisitWebpageTool
+import functools
 import logging 
 from dotenv import load_dotenv
+from admission import AdmissionController
+from agent_pool import AgentPool
+from coalescing import SingleFlight
+from run_store import SqliteStore
+from serving import build_app, serve, serve_workers
+from wire_compression import WireCompression
+from warmup import Warmup, force_import, lazy_import
+
+# Imported on first use (or during warmup) so the server binds its port at once
+smolagents = lazy_import("smolagents")
+litellm = lazy_import("litellm")
 
 load_dotenv() 
 
 server = Server()
+admission = AdmissionController()
+single_flight = SingleFlight(admission)
+# Runs and their results persist across restarts and are shared by every worker
+run_store = SqliteStore(".cache/runs/hospital.sqlite")
 from dotenv import load_dotenv
 load_dotenv()
 import os
 os.environ['OPENAI_API_KEY']=os.getenv('OPENAI_API_KEY')
-model = LiteLLMModel(
-    model_id="openai/gpt-4",  
-    max_tokens=2048
+
+
+@functools.lru_cache(maxsize=None)
+def get_model():
+    return smolagents.LiteLLMModel(
+        model_id="openai/gpt-4",  
+        max_tokens=2048
+    )
+
+
+def prime_llm() -> None:
+    """Open the connection to the LLM provider with a one-token completion."""
+    litellm.completion(model="openai/gpt-4", messages=[{"role": "user", "content": "ping"}], max_tokens=1)
+
+
+@functools.lru_cache(maxsize=None)
+def get_page_cache():
+    # Visited pages are shared by every pooled agent (and every worker process)
+    from page_cache import PageCache
+    return PageCache(path=".cache/pages.sqlite", ttl=24 * 3600, max_bytes=256 * 1024 * 1024)
+
+
+def build_health_agent():
+    from page_cache import CachedVisitWebpageTool
+    return smolagents.CodeAgent(
+        tools=[smolagents.DuckDuckGoSearchTool(), CachedVisitWebpageTool(get_page_cache())], model=get_model()
+    )
+
+
+# Pre-built CodeAgents run off the event loop; the pool size matches the admission limit
+health_pool = AgentPool(
+    build_health_agent,
+    size=2,
+    name="health_agent",
 )
 
+
+def build_warmup() -> Warmup:
+    warmup = Warmup("SMOL AI Hospital agent server")
+    warmup.add("imports", lambda: force_import(smolagents) or get_model())
+    warmup.add("agent pool", health_pool.fill)
+    warmup.add("llm connection", prime_llm, required=False)
+    return warmup
+
 @server.agent()
+@single_flight.coalesce()
+@admission.limit(max_concurrency=2, max_queue=8, max_queue_time=60)
 async def health_agent(input: list[Message], context: Context) -> AsyncGenerator[RunYield, RunYieldResume]:
     "This is a CodeAgent which supports the hospital to handle health based questions for patients. Current or prospective patients can use it to find answers about their health and hospital treatments."
-    agent = CodeAgent(tools=[DuckDuckGoSearchTool(), VisitWebpageTool()], model=model)
-
     prompt = input[0].parts[0].content
-    response = agent.run(prompt)
+    response = await health_pool.run(prompt)
 
     yield Message(parts=[MessagePart(content=str(response))])
 
 
+def create_app():
+    """App factory for worker processes."""
+    return build_app(server, admission, single_flight, build_warmup(), health_pool, WireCompression.from_env(), store=run_store)
+
 if __name__ == "__main__":
-    server.run(port=8000)
+    # ACP_WORKERS > 1 runs CodeAgents in that many processes behind the one port
+    workers = int(os.getenv("ACP_WORKERS", "1"))
+    print(f"Unfinished runs from the last start marked failed: {run_store.recover()}")
+    if workers > 1:
+        serve_workers("smol_health_agent:create_app", workers=workers, port=8000)
+    else:
+        serve(server, admission, single_flight, build_warmup(), health_pool, WireCompression.from_env(), store=run_store, port=8000)
 from collections.abc import AsyncGenerator
 from acp_sdk.models import Message, MessagePart
 from acp_sdk.server import Context, RunYield, RunYieldResume, Server
-from smolagents import CodeAgent, DuckDuckGoSearchTool, LiteLLMModel, VisitWebpageTool
+import functools
 import logging 
 from dotenv import load_dotenv
+from admission import AdmissionController
+from agent_pool import AgentPool
+from coalescing import SingleFlight
+from run_store import SqliteStore
+from serving import build_app, serve, serve_workers
+from wire_compression import WireCompression
+from warmup import Warmup, force_import, lazy_import
+
+# Imported on first use (or during warmup) so the server binds its port at once
+smolagents = lazy_import("smolagents")
+litellm = lazy_import("litellm")
 
 load_dotenv() 
 
 server = Server()
+admission = AdmissionController()
+single_flight = SingleFlight(admission)
+# Runs and their results persist across restarts and are shared by every worker
+run_store = SqliteStore(".cache/runs/hospital.sqlite")
 
-model = LiteLLMModel(
-    model_id="openai/gpt-4",  
-    max_tokens=2048
+
+
+@functools.lru_cache(maxsize=None)
+def get_model():
+    return smolagents.LiteLLMModel(
+        model_id="openai/gpt-4",  
+        max_tokens=2048
+    )
+
+
+def prime_llm() -> None:
+    """Open the connection to the LLM provider with a one-token completion."""
+    litellm.completion(model="openai/gpt-4", messages=[{"role": "user", "content": "ping"}], max_tokens=1)
+
+
+@functools.lru_cache(maxsize=None)
+def get_page_cache():
+    # Visited pages are shared by every pooled agent (and every worker process)
+    from page_cache import PageCache
+    return PageCache(path=".cache/pages.sqlite", ttl=24 * 3600, max_bytes=256 * 1024 * 1024)
+
+
+def build_health_agent():
+    from page_cache import CachedVisitWebpageTool
+    return smolagents.CodeAgent(
+        tools=[smolagents.DuckDuckGoSearchTool(), CachedVisitWebpageTool(get_page_cache())], model=get_model()
+    )
+
+
+# Pre-built CodeAgents run off the event loop; the pool size matches the admission limit
+health_pool = AgentPool(
+    build_health_agent,
+    size=2,
+    name="health_agent",
 )
 
+
+def build_warmup() -> Warmup:
+    warmup = Warmup("SMOL AI Hospital agent server")
+    warmup.add("imports", lambda: force_import(smolagents) or get_model())
+    warmup.add("agent pool", health_pool.fill)
+    warmup.add("llm connection", prime_llm, required=False)
+    return warmup
+
 @server.agent()
+@single_flight.coalesce()
+@admission.limit(max_concurrency=2, max_queue=8, max_queue_time=60)
 async def health_agent(input: list[Message], context: Context) -> AsyncGenerator[RunYield, RunYieldResume]:
     "This is a CodeAgent which supports the hospital to handle health based questions for patients. Current or prospective patients can use it to find answers about their health and hospital treatments."
-    agent = CodeAgent(tools=[DuckDuckGoSearchTool(), VisitWebpageTool()], model=model)
-
     prompt = input[0].parts[0].content
-    response = agent.run(prompt)
+    response = await health_pool.run(prompt)
 
     yield Message(parts=[MessagePart(content=str(response))])
 
 
+def create_app():
+    """App factory for worker processes."""
+    return build_app(server, admission, single_flight, build_warmup(), health_pool, WireCompression.from_env(), store=run_store)
+
 if __name__ == "__main__":
     print(f"SMOL AI Hospital agent server running....")
 
-    server.run(port=8000)
\ No newline at end of file
+    # ACP_WORKERS > 1 runs CodeAgents in that many processes behind the one port
+    workers = int(os.getenv("ACP_WORKERS", "1"))
+    print(f"Unfinished runs from the last start marked failed: {run_store.recover()}")
+    if workers > 1:
+        serve_workers("smol_health_agent:create_app", workers=workers, port=8000)
+    else:
+        serve(server, admission, single_flight, build_warmup(), health_pool, WireCompression.from_env(), store=run_store, port=8000)
\ No newline at end of file
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from admission import BATCH, INTERACTIVE, AdmissionRejected, AgentLimiter, PriorityClass
+
+
+def capped_limiter(max_queue_time: float = 1.0) -> AgentLimiter:
+    # Batch may hold one slot at most, keeping the rest free for interactive runs
+    return AgentLimiter(
+        "policy_agent",
+        max_concurrency=4,
+        max_queue=8,
+        max_queue_time=max_queue_time,
+        classes=[PriorityClass(INTERACTIVE, weight=8.0), PriorityClass(BATCH, weight=1.0, max_concurrency=1)],
+    )
+
+
+def test_interactive_runs_past_batch_waiting_on_its_cap():
+    async def scenario():
+        limiter = capped_limiter()
+        assert await limiter.acquire(BATCH) == BATCH
+        waiting_batch = asyncio.create_task(limiter.acquire(BATCH))
+        await asyncio.sleep(0)
+        assert limiter.classes[BATCH].snapshot()["queue_depth"] == 1
+
+        # Three slots are free; the interactive run must not queue behind the capped batch run
+        assert await asyncio.wait_for(limiter.acquire(INTERACTIVE), timeout=0.5) == INTERACTIVE
+        assert limiter.running == 2
+        assert not waiting_batch.done()
+
+        limiter.release(BATCH)
+        assert await asyncio.wait_for(waiting_batch, timeout=0.5) == BATCH
+        assert limiter.classes[BATCH].running == 1
+
+    asyncio.run(scenario())
+
+
+def test_waiter_is_dispatched_when_slots_are_free():
+    async def scenario():
+        limiter = capped_limiter()
+        for _ in range(3):
+            await limiter.acquire(INTERACTIVE)
+        await limiter.acquire(BATCH)
+        queued = asyncio.create_task(limiter.acquire(INTERACTIVE))
+        await asyncio.sleep(0)
+        assert not queued.done()
+
+        limiter.release(BATCH)
+        assert await asyncio.wait_for(queued, timeout=0.5) == INTERACTIVE
+        assert limiter.running == 4
+
+    asyncio.run(scenario())
+
+
+def test_interactive_is_served_before_queued_batch_runs():
+    async def scenario():
+        limiter = AgentLimiter("policy_agent", max_concurrency=1, max_queue=8, max_queue_time=1.0)
+        await limiter.acquire(INTERACTIVE)
+        order = []
+
+        async def run(priority: str, name: str):
+            await limiter.acquire(priority)
+            order.append(name)
+            limiter.release(priority)
+
+        tasks = [asyncio.create_task(run(BATCH, f"b{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(run(INTERACTIVE, "i0")))
+        await asyncio.sleep(0)
+        limiter.release(INTERACTIVE)
+        await asyncio.gather(*tasks)
+        assert order.index("i0") < order.index("b2")
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_and_timeout_reject():
+    async def scenario():
+        limiter = AgentLimiter("policy_agent", max_concurrency=1, max_queue=1, max_queue_time=0.05)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.is_full()
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+        with pytest.raises(AdmissionRejected):
+            await waiting
+        assert limiter.rejected == 1 and limiter.timed_out == 1
+
+    asyncio.run(scenario())
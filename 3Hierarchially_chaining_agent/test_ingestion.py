@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import ingestion
+from ingestion import IngestionPipeline
+from policy_index import PolicyIndex
+
+
+class FakePage:
+    def __init__(self, text: str):
+        self.text = text
+
+    def extract_text(self) -> str:
+        return self.text
+
+
+class FakeReader:
+    """Reads a text file as a one-page PDF."""
+
+    def __init__(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            self.pages = [FakePage(f.read())]
+
+
+class FlakyEmbeddings:
+    """Stands in for the embedding service; fails every request while `down` is set, and the next `failures`."""
+
+    def __init__(self):
+        self.down = False
+        self.failures = 0
+        self.requests = 0
+
+    def __call__(self, texts):
+        self.requests += 1
+        if self.down or self.failures:
+            self.failures = max(0, self.failures - 1)
+            raise RuntimeError("embedding service unavailable")
+        vectors = np.array([[len(text), sum(map(ord, text)) % 97 + 1, 1.0] for text in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "PdfReader", FakeReader)
+    monkeypatch.setattr(ingestion, "ProcessPoolExecutor", ThreadPoolExecutor)
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "hospital.pdf").write_text("Hospital cover includes rehabilitation after two months. " * 40)
+    index = PolicyIndex(embedding_model="fake-embeddings", chunk_size=400, chunk_overlap=50)
+    index._embed_remote = FlakyEmbeddings()
+    return IngestionPipeline(index, data_dir=str(data_dir), cache_dir=str(tmp_path / "cache"), workers=1)
+
+
+def test_recovered_vectors_count_as_a_change(pipeline):
+    path = pipeline.scan().popitem()[0]
+    pipeline.index._embed_remote.down = True
+    first = pipeline.sync()
+    assert first.added == [path]
+    assert pipeline.index.unembedded == {path}
+
+    pipeline.index._embed_remote.down = False
+    second = pipeline.sync()
+    assert second.reembedded == [path]
+    assert second.chunks_embedded == len(pipeline.index)
+    assert second.changed
+    assert pipeline.index.unembedded == set()
+    assert pipeline.index.embeddings.any(axis=1).all()
+
+
+def test_unchanged_sync_reports_no_change(pipeline):
+    assert pipeline.sync().changed
+    again = pipeline.sync()
+    assert not again.changed
+    assert again.reembedded == [] and again.chunks_embedded == 0
+
+
+def test_vectors_embedded_after_a_failure_are_snapshotted(pipeline, monkeypatch):
+    path = pipeline.scan().popitem()[0]
+    pipeline.index._embed_remote.failures = 1
+    pipeline.sync()
+    assert pipeline.index.unembedded == set()
+
+    def no_parsing(path):
+        raise AssertionError(f"{path} was parsed again")
+
+    monkeypatch.setattr(ingestion, "PdfReader", no_parsing)
+    index = PolicyIndex(embedding_model="fake-embeddings", chunk_size=400, chunk_overlap=50)
+    index._embed_remote = FlakyEmbeddings()
+    restarted = IngestionPipeline(index, data_dir=pipeline.data_dir, cache_dir=pipeline.cache_dir)
+    assert restarted.sync().unchanged == [path]
+    assert index._embed_remote.requests == 0
+    assert np.array_equal(index.embeddings, pipeline.index.embeddings)
+
+
+def test_snapshot_without_vectors_is_embedded_on_restart_without_parsing(pipeline, monkeypatch):
+    pipeline.index._embed_remote.down = True
+    pipeline.sync()
+    monkeypatch.setattr(ingestion, "PdfReader", lambda path: pytest.fail(f"{path} was parsed again"))
+    index = PolicyIndex(embedding_model="fake-embeddings", chunk_size=400, chunk_overlap=50)
+    index._embed_remote = FlakyEmbeddings()
+    IngestionPipeline(index, data_dir=pipeline.data_dir, cache_dir=pipeline.cache_dir).sync()
+    assert index.unembedded == set()
+    assert index.embeddings.any(axis=1).all()
+
+
+def test_only_the_failed_batch_is_embedded_again(pipeline):
+    pipeline.embed_batch_size = 2
+    pipeline.max_concurrent_embeddings = 1
+    pipeline.index._embed_remote.failures = 1
+    pipeline.sync()
+    batches = -(-len(pipeline.index) // 2)
+    assert batches > 1
+    assert pipeline.index._embed_remote.requests == batches + 1
+    assert pipeline.index.unembedded == set()
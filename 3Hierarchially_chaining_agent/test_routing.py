@@ -0,0 +1,56 @@
+from routing import AgentRouter
+
+# Descriptions the hospital and insurer servers publish for their agents
+DESCRIPTIONS = {
+    "policy_agent": "This is an agent for questions around policy coverage, it uses a RAG pattern to find answers based on policy documentation. Use it to help answer questions on coverage and waiting periods.",
+    "policy_batch_agent": "This is an agent for answering many policy coverage questions at once. Send each question as its own message part; an answer message is streamed back for each question as soon as it is ready.",
+    "health_agent": "This is a CodeAgent which supports the hospital to handle health based questions for patients. Current or prospective patients can use it to find answers about their health and hospital treatments.",
+}
+
+
+def router() -> AgentRouter:
+    return AgentRouter().fit(DESCRIPTIONS)
+
+
+def routed(query: str):
+    route = router().route(query)
+    return route and route.agent
+
+
+def test_two_agent_query_goes_to_the_planner():
+    # The orchestration query from agent.py needs health_agent and policy_agent
+    assert routed(
+        "do i need rehabilitation after a shoulder reconstruction and what is the waiting period from my insurance?"
+    ) is None
+
+
+def test_clause_without_a_confident_route_goes_to_the_planner():
+    assert routed("What is the waiting period for rehabilitation and should I book the flights?") is None
+
+
+def test_health_queries_route_to_health_agent():
+    assert routed(
+        "Do I need rehabilitation after a shoulder reconstruction? "
+        "What does the rehabilitation process involve and how long does it typically take?"
+    ) == "health_agent"
+    assert routed("What are the symptoms of diabetes and what treatments are available?") == "health_agent"
+    assert routed("How long is the recovery after a knee replacement?") == "health_agent"
+
+
+def test_policy_queries_route_to_policy_agent():
+    assert routed("What is the waiting period for rehabilitation?") == "policy_agent"
+    # "hospital" is only in health_agent's description; the seed examples carry the insurance sense
+    assert routed("What is the excess for a hospital admission?") == "policy_agent"
+
+
+def test_unrelated_query_goes_to_the_planner():
+    assert routed("I'm based in Atlanta, GA. Are there any cardiologists near me?") is None
+
+
+def test_learned_queries_route():
+    agents = router()
+    query = "Which cardiologist should I see for palpitations?"
+    assert agents.route(query) is None
+    agents.learn("health_agent", "Which cardiologist should I see for chest pain?")
+    assert agents.route(query).agent == "health_agent"
+    assert agents.stats["queries"] == 2
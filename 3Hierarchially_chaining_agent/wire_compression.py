@@ -0,0 +1,195 @@
+import gzip
+import os
+import zlib
+from typing import Optional, Set, Tuple
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+
+# === Compressed transport for large inter-agent payloads ===
+#
+# Chained workflows ship whole upstream answers between processes: the health
+# context goes into policy_agent, sub-agent outputs come back to the
+# orchestrator. Those payloads are prose and JSON that gzip shrinks several
+# times over, which matters on anything slower than loopback.
+#
+# Server side, WireCompression (a serving extension):
+#   - gzips responses of at least `minimum_size` bytes for clients sending
+#     Accept-Encoding: gzip (httpx does by default); SSE streams stay as is
+#   - accepts request bodies sent with Content-Encoding: gzip, and says so
+#     with an `Accept-Encoding: gzip` header on every response (RFC 7694)
+#
+# Client side, CompressingTransport is an httpx transport for ACP clients.
+# It gzips request bodies of at least `minimum_size` bytes, but only for
+# servers that advertised support, so servers without the extension never
+# see a compressed body. Pass it as `Client(transport=CompressingTransport())`.
+#
+# Compressing costs CPU, which loopback and LAN calls don't win back (see
+# bench_wire.py), so servers enable it from the environment: set
+# WIRE_COMPRESSION_MIN_BYTES on servers reached over slower links. Level 1
+# keeps nearly all of the size win of higher levels at far less CPU.
+#
+# Install WireCompression after extensions that read request bodies
+# (AdmissionController), so they see the decompressed body.
+
+GZIP = "gzip"
+MAX_DECOMPRESSED_BYTES = 64 * 1024 * 1024
+
+
+class WireCompression:
+    """
+    Negotiated gzip for ACP request and response bodies.
+
+    Args:
+        minimum_size (int): Bodies smaller than this many bytes are sent as they are.
+        level (int): gzip level.
+        enabled (bool): Whether `install` adds anything to the app.
+    """
+
+    def __init__(self, minimum_size: int = 1024, level: int = 1, enabled: bool = True):
+        self.minimum_size = minimum_size
+        self.level = level
+        self.enabled = enabled
+
+    @classmethod
+    def from_env(cls) -> "WireCompression":
+        """Enabled when WIRE_COMPRESSION_MIN_BYTES is set, with that threshold."""
+        minimum_size = os.getenv("WIRE_COMPRESSION_MIN_BYTES")
+        return cls(minimum_size=int(minimum_size or 1024), enabled=minimum_size is not None)
+
+    def install(self, app: FastAPI) -> None:
+        if not self.enabled:
+            return
+        app.add_middleware(GZipMiddleware, minimum_size=self.minimum_size, compresslevel=self.level)
+        app.add_middleware(RequestDecompressionMiddleware)
+
+
+class RequestDecompressionMiddleware:
+    """ASGI middleware inflating gzip request bodies and advertising that it does."""
+
+    def __init__(self, app, max_size: int = MAX_DECOMPRESSED_BYTES):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def advertise(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"accept-encoding", GZIP.encode())]
+            await send(message)
+
+        headers = dict(scope.get("headers", []))
+        encoding = headers.get(b"content-encoding", b"").decode("latin-1").strip().lower()
+        if encoding in ("", "identity"):
+            await self.app(scope, receive, advertise)
+            return
+        if encoding != GZIP:
+            response = JSONResponse(status_code=415, content={"detail": f"Unsupported Content-Encoding: {encoding}"})
+            await response(scope, receive, advertise)
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        try:
+            # Bounded, so a small compressed body can't expand into gigabytes
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            body = inflater.decompress(body, self.max_size)
+            if inflater.unconsumed_tail:
+                response = JSONResponse(status_code=413, content={"detail": "Request body too large"})
+                await response(scope, receive, advertise)
+                return
+        except zlib.error:
+            response = JSONResponse(status_code=400, content={"detail": "Malformed gzip request body"})
+            await response(scope, receive, advertise)
+            return
+
+        scope = dict(scope)
+        scope["headers"] = [
+            (key, value) for key, value in scope["headers"] if key not in (b"content-encoding", b"content-length")
+        ] + [(b"content-length", str(len(body)).encode())]
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, replay, advertise)
+
+
+class CompressingTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport gzipping large request bodies for servers that accept them.
+
+    Args:
+        transport (httpx.AsyncBaseTransport, optional): Transport doing the actual I/O.
+        minimum_size (int): Bodies smaller than this many bytes are sent as they are.
+        level (int): gzip level.
+    """
+
+    def __init__(
+        self,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        minimum_size: int = 1024,
+        level: int = 1,
+    ):
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.minimum_size = minimum_size
+        self.level = level
+        self._accepting: Set[Tuple[bytes, bytes, Optional[int]]] = set()
+        self.stats = {"compressed": 0, "body_bytes": 0, "sent_bytes": 0}
+
+    def _learn(self, origin, response: httpx.Response) -> None:
+        if GZIP in response.headers.get("accept-encoding", "").lower():
+            self._accepting.add(origin)
+        else:
+            self._accepting.discard(origin)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        origin = (request.url.raw_scheme, request.url.raw_host, request.url.port)
+        if request.method in ("POST", "PUT", "PATCH") and "content-encoding" not in request.headers:
+            body = await request.aread()
+            self.stats["body_bytes"] += len(body)
+            if origin in self._accepting and len(body) >= self.minimum_size:
+                compressed = gzip.compress(body, compresslevel=self.level)
+                if len(compressed) < len(body):
+                    headers = request.headers.copy()
+                    headers["Content-Encoding"] = GZIP
+                    headers.pop("Content-Length", None)
+                    response = await self.transport.handle_async_request(
+                        httpx.Request(request.method, request.url, headers=headers, content=compressed,
+                                      extensions=request.extensions)
+                    )
+                    if response.status_code != 415:
+                        self._learn(origin, response)
+                        self.stats["compressed"] += 1
+                        self.stats["sent_bytes"] += len(compressed)
+                        return response
+                    # The server stopped accepting gzip; nothing ran, so resend the body as it is
+                    await response.aclose()
+                    self._accepting.discard(origin)
+            self.stats["sent_bytes"] += len(body)
+        response = await self.transport.handle_async_request(request)
+        self._learn(origin, response)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    def summary(self) -> str:
+        saved = 1 - self.stats["sent_bytes"] / self.stats["body_bytes"] if self.stats["body_bytes"] else 0.0
+        return (
+            f"Wire compression: {self.stats['compressed']} request bodies compressed, "
+            f"{self.stats['body_bytes']} -> {self.stats['sent_bytes']} bytes ({saved:.0%} saved)"
+        )
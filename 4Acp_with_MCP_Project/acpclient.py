@@ -2,11 +2,13 @@ import asyncio
 import nest_asyncio
 from acp_sdk.client import Client
 from colorama import Fore 
+from run_store import DetachedClient
 
 nest_asyncio.apply() 
 async def run_doctor_workflow() -> None:
     async with Client(base_url="http://localhost:8000") as hospital:
-        run1 = await hospital.run_sync(
+        # Submitted asynchronously and long-polled: no connection is held open through the run
+        run1 = await DetachedClient(hospital).run_sync(
             agent="doctor_agent", input="I'm based in Atlanta,GA. Are there any Cardiologists near me?"
         )
         content = run1.output[0].parts[0].content
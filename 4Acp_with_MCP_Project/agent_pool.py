@@ -0,0 +1,153 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import FastAPI
+
+# === Warm pool of smolagents agents ===
+#
+# Building a CodeAgent (model wrapper, tools, system prompt, executor) on every
+# request is wasted work, and `agent.run` is blocking: called inside an async
+# handler it freezes the whole server for the duration of the run. The pool
+# keeps pre-built agents, leases one per run, executes the run on its own
+# thread pool (so at most `size` runs execute at once) and resets the agent's
+# memory and executor state before handing it to the next run.
+
+
+def reset_agent(agent: Any) -> None:
+    """Forget everything a previous run left behind on a smolagents agent."""
+    memory = getattr(agent, "memory", None)
+    if memory is not None:
+        memory.reset()
+    monitor = getattr(agent, "monitor", None)
+    if monitor is not None:
+        monitor.reset()
+    if isinstance(getattr(agent, "state", None), dict):
+        agent.state.clear()
+    executor = getattr(agent, "python_executor", None)
+    if executor is not None and isinstance(getattr(executor, "state", None), dict):
+        # Variables defined by the previous run's code must not leak into the next one
+        executor.state = {"__name__": "__main__"}
+
+
+class AgentPool:
+    """
+    Pre-built agents leased for one run at a time.
+
+    Args:
+        factory (callable): Builds one agent; called at most `size` times.
+        size (int): Agents in the pool, which is also the number of concurrent runs.
+        name (str): Pool name, used for its threads and its /pools route.
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int = 2, name: str = "agents"):
+        self.factory = factory
+        self.size = size
+        self.name = name
+        self.created = 0
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"{name}-run")
+        self.runs = 0
+        self.failures = 0
+        self.avg_run_seconds: Optional[float] = None
+        self.avg_wait_seconds: Optional[float] = None
+
+    async def fill(self) -> None:
+        """Build every agent now (a warmup step) instead of on the first runs."""
+        loop = asyncio.get_running_loop()
+        while self.created < self.size:
+            self.created += 1
+            try:
+                agent = await loop.run_in_executor(self._executor, self.factory)
+            except BaseException:
+                # A failed build must not take a slot for good, or later leases wait forever
+                self.created -= 1
+                raise
+            self._idle.put_nowait(agent)
+
+    async def _lease(self) -> Any:
+        if self._idle.empty() and self.created < self.size:
+            self.created += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, self.factory)
+            except BaseException:
+                self.created -= 1
+                raise
+        return await self._idle.get()
+
+    def _release(self, agent: Any) -> None:
+        self._idle.put_nowait(agent)
+
+    def _run(self, agent: Any, prompt: str, kwargs: Dict[str, Any]) -> Any:
+        try:
+            return agent.run(prompt, **kwargs)
+        finally:
+            reset_agent(agent)
+
+    async def run(self, prompt: str, **kwargs: Any) -> Any:
+        """
+        Run a prompt on a leased agent without blocking the event loop.
+
+        Args:
+            prompt (str): Task passed to `agent.run`.
+            **kwargs: Extra `agent.run` arguments.
+
+        Returns:
+            The agent's final answer.
+        """
+        waited = time.monotonic()
+        agent = await self._lease()
+        started = time.monotonic()
+        self.avg_wait_seconds = _ewma(self.avg_wait_seconds, started - waited)
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._run, agent, prompt, kwargs)
+        try:
+            result = await asyncio.shield(future)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            if future.done():
+                self._release(agent)
+            else:
+                # The caller went away but the thread still runs: return the agent when it's done
+                future.add_done_callback(lambda _: self._release(agent))
+        self.runs += 1
+        self.avg_run_seconds = _ewma(self.avg_run_seconds, time.monotonic() - started)
+        return result
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "size": self.size,
+            "created": self.created,
+            "idle": self._idle.qsize(),
+            "busy": self.created - self._idle.qsize(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "avg_run_seconds": self.avg_run_seconds,
+            "avg_wait_seconds": self.avg_wait_seconds,
+        }
+
+    def install(self, app: FastAPI) -> None:
+        """Serve the pool's counters on GET /pools/<name> and stop its threads with the app."""
+
+        @app.get(f"/pools/{self.name}")
+        async def read_pool() -> Dict[str, object]:
+            return self.snapshot()
+
+        inner = app.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan(app: FastAPI):
+            try:
+                async with inner(app) as state:
+                    yield state
+            finally:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+
+        app.router.lifespan_context = lifespan
+
+
+def _ewma(previous: Optional[float], value: float, alpha: float = 0.2) -> float:
+    return value if previous is None else (1 - alpha) * previous + alpha * value
@@ -0,0 +1,130 @@
+import argparse
+import gc
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+from doctor_directory import DoctorDirectory, build_snapshot
+
+# === Doctor directory benchmark ===
+#
+# Generates synthetic directories of realistic doctors.json records and, for
+# each size, compares the nested-dict representation the MCP server used to
+# filter with a list comprehension against the columnar snapshot: memory
+# footprint, build time and filter / nearest-doctor latency.
+#
+#   uv run bench_directory.py --sizes 10000 100000 1000000
+
+SPECIALTIES = [
+    "Cardiology", "Dermatology", "Endocrinology", "Family Medicine", "Gastroenterology", "General Surgery",
+    "Internal Medicine", "Neurology", "Obstetrics and Gynecology", "Oncology", "Ophthalmology", "Orthopedics",
+    "Otolaryngology", "Pediatrics", "Physical Therapy", "Psychiatry", "Pulmonology", "Radiology", "Rheumatology",
+    "Urology",
+]
+# (city, state, latitude, longitude) centres records are scattered around
+CITIES = [
+    ("New York", "NY", 40.71, -74.01), ("Los Angeles", "CA", 34.05, -118.24), ("Chicago", "IL", 41.88, -87.63),
+    ("Houston", "TX", 29.76, -95.37), ("Phoenix", "AZ", 33.45, -112.07), ("Philadelphia", "PA", 39.95, -75.17),
+    ("San Antonio", "TX", 29.42, -98.49), ("San Diego", "CA", 32.72, -117.16), ("Dallas", "TX", 32.78, -96.8),
+    ("Atlanta", "GA", 33.75, -84.39), ("Miami", "FL", 25.76, -80.19), ("Seattle", "WA", 47.61, -122.33),
+    ("Denver", "CO", 39.74, -104.99), ("Boston", "MA", 42.36, -71.06), ("Detroit", "MI", 42.33, -83.05),
+    ("Minneapolis", "MN", 44.98, -93.27), ("Portland", "OR", 45.52, -122.68), ("Nashville", "TN", 36.16, -86.78),
+]
+
+
+def synthetic_doctors(count: int, seed: int = 7) -> Dict[str, dict]:
+    rng = random.Random(seed)
+    doctors = {}
+    for i in range(count):
+        city, state, lat, lon = rng.choice(CITIES)
+        doctors[f"DOC{i:07d}"] = {
+            "name": f"Dr {rng.choice(['Sarah', 'James', 'Maria', 'David', 'Aisha', 'Wei'])} {i}",
+            "specialty": rng.choice(SPECIALTIES),
+            "address": {
+                "street": f"{rng.randint(1, 9999)} Main Street",
+                "city": city,
+                "state": state,
+                "zip_code": f"{rng.randint(10000, 99999)}",
+            },
+            "latitude": round(lat + rng.gauss(0, 0.4), 5),
+            "longitude": round(lon + rng.gauss(0, 0.4), 5),
+            "phone": f"({rng.randint(200, 999)}) 555-{rng.randint(1000, 9999)}",
+            "years_experience": rng.randint(1, 40),
+            "accepts_new_patients": rng.random() < 0.7,
+            "languages": rng.sample(["English", "Spanish", "Mandarin", "Hindi", "French"], 2),
+        }
+    return doctors
+
+
+def median_ms(fn: Callable[[], object], repeat: int) -> float:
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def bench(size: int, repeat: int, workdir: str) -> Dict[str, float]:
+    gc.collect()
+    tracemalloc.start()
+    doctors = synthetic_doctors(size)
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    dict_state = median_ms(lambda: [d for d in doctors.values() if d["address"]["state"] == "TX"], repeat)
+    dict_both = median_ms(
+        lambda: [d for d in doctors.values() if d["address"]["state"] == "TX" and d["specialty"] == "Cardiology"],
+        repeat,
+    )
+
+    path = os.path.join(workdir, f"doctors-{size}")
+    started = time.perf_counter()
+    build_snapshot(doctors, path)
+    build_seconds = time.perf_counter() - started
+    del doctors
+    gc.collect()
+
+    directory = DoctorDirectory(path=path, places_url=None).open()
+    columns = directory.nbytes()
+    return {
+        "dict_mb": dict_bytes / 1e6,
+        "columns_mb": sum(size for name, size in columns.items() if name != "records") / 1e6,
+        "snapshot_mb": directory_size(path) / 1e6,
+        "build_s": build_seconds,
+        "dict_state_ms": dict_state,
+        "state_ms": median_ms(lambda: directory.filter(state="TX"), repeat),
+        "dict_state_specialty_ms": dict_both,
+        "state_specialty_ms": median_ms(lambda: directory.filter(state="TX", specialty="cardiologist"), repeat),
+        "nearest_ms": median_ms(lambda: directory.nearest(33.75, -84.39, k=10, specialty="cardiologist"), repeat),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the columnar doctor directory against nested dicts")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=20, help="Timed repetitions per query (median is reported)")
+    args = parser.parse_args()
+
+    columns = [
+        "dict_mb", "columns_mb", "snapshot_mb", "build_s", "dict_state_ms", "state_ms",
+        "dict_state_specialty_ms", "state_specialty_ms", "nearest_ms",
+    ]
+    print(f"{'records':>10} " + " ".join(f"{name:>23}" for name in columns))
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            result = bench(size, args.repeat, workdir)
+            print(f"{size:>10} " + " ".join(f"{result[name]:>23.3f}" for name in columns))
+
+
+if __name__ == "__main__":
+    main()
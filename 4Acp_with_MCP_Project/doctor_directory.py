@@ -0,0 +1,413 @@
+import io
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+# === Shared, read-only doctor directory ===
+#
+# The MCP server used to download doctors.json on every tool call, and every
+# MCP server process (one per doctor_agent run) held its own parsed copy. The
+# directory is now downloaded once into a snapshot: one JSON record per line
+# plus an offsets array and filter columns. Every process memory-maps the
+# snapshot read-only, so the records live once in the OS page cache, and only
+# the records that match a query are ever parsed.
+#
+# For "near me" questions the snapshot also holds each doctor's coordinates
+# and a grid index: positions sorted by 0.5 degree cell, with the start of
+# each cell. A nearest-doctor query scans rings of cells outwards from the
+# query point and stops once no unscanned cell can beat the k-th match, so it
+# only touches the doctors around that point. Records without coordinates are
+# placed at their ZIP code (or city) centroid from the GeoNames US postal
+# code gazetteer, which is also used to resolve the places users type.
+#
+# Filters run on columns, not records: state, city and specialty are interned
+# into small integer codes (the vocabularies live in columns.json), so a filter
+# is one vectorized comparison per column over a few bytes per doctor. The
+# snapshot stays compact and cheap to map at a million records; see
+# bench_directory.py for footprint and latency at 10k, 100k and 1M.
+
+DOCTORS_URL = 'https://raw.githubusercontent.com/nicknochnack/ACPWalkthrough/refs/heads/main/doctors.json'
+PLACES_URL = 'https://download.geonames.org/export/zip/US.zip'
+CELL_DEGREES = 0.5
+LON_CELLS = int(360 / CELL_DEGREES)
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 69.0
+# Bump when the snapshot layout changes: older snapshots are rebuilt
+SNAPSHOT_VERSION = 2
+CATEGORIES = ("state", "city", "specialty")
+# Past this many rings (~700 miles) the matches are sparse: compare against all of them instead
+MAX_RINGS = 20
+
+
+def load_places(url: str = PLACES_URL) -> Dict[str, Dict[str, List[float]]]:
+    """
+    Download the US postal code gazetteer.
+
+    Returns:
+        dict: {"zip": {"30309": [lat, lon]}, "city": {"atlanta|GA": [lat, lon]}}; cities map to the mean of their ZIP codes.
+    """
+    resp = requests.get(url)
+    resp.raise_for_status()
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as archive:
+        lines = archive.read("US.txt").decode("utf-8").splitlines()
+    zips: Dict[str, List[float]] = {}
+    cities: Dict[str, List[List[float]]] = {}
+    for line in lines:
+        # country, postal code, place, state name, state code, ..., latitude, longitude, accuracy
+        fields = line.split("\t")
+        if len(fields) < 11 or not fields[9] or not fields[10]:
+            continue
+        point = [float(fields[9]), float(fields[10])]
+        zips[fields[1]] = point
+        cities.setdefault(place_key(fields[2], fields[4]), []).append(point)
+    return {
+        "zip": zips,
+        "city": {key: np.mean(points, axis=0).round(5).tolist() for key, points in cities.items()},
+    }
+
+
+def place_key(city: str, state: str) -> str:
+    return f"{' '.join(city.lower().split())}|{state.strip().upper()}"
+
+
+def specialty_matches(query: str, specialty: str) -> bool:
+    """Loose specialty match, so "cardiologist" finds "Cardiology" and "pediatrician" finds "Pediatrics"."""
+    query, specialty = " ".join(query.lower().split()), " ".join(specialty.lower().split())
+    if not query or not specialty:
+        return False
+    return query in specialty or specialty in query or query[:6] == specialty[:6]
+
+
+def doctor_coordinates(doctor: dict, places: Optional[dict]) -> Tuple[float, float]:
+    """A doctor's own coordinates if the record has them, else its ZIP or city centroid, else NaN."""
+    address = doctor.get("address") or {}
+    for source in (doctor, address):
+        lat = source.get("latitude", source.get("lat"))
+        lon = source.get("longitude", source.get("lon", source.get("lng")))
+        if lat is not None and lon is not None:
+            return float(lat), float(lon)
+    if places:
+        zip_code = str(address.get("zip_code") or address.get("zip") or "")[:5]
+        point = places["zip"].get(zip_code) or places["city"].get(
+            place_key(address.get("city") or "", address.get("state") or "")
+        )
+        if point:
+            return point[0], point[1]
+    return math.nan, math.nan
+
+
+def category_values(doctor: dict) -> Tuple[str, str, str]:
+    """A record's state, city and specialty, normalised the way they are interned."""
+    address = doctor.get("address") or {}
+    return (
+        str(address.get("state") or "").strip().upper(),
+        " ".join(str(address.get("city") or "").lower().split()),
+        " ".join(str(doctor.get("specialty") or "").split()),
+    )
+
+
+def code_dtype(size: int) -> np.dtype:
+    """Smallest unsigned integer type that can hold `size` codes."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if size <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def cell_of(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    row = np.floor((np.asarray(lat) + 90) / CELL_DEGREES).astype(np.int64)
+    column = np.floor((np.asarray(lon) + 180) / CELL_DEGREES).astype(np.int64)
+    return row * LON_CELLS + column
+
+
+def haversine_miles(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def build_snapshot(doctors: Dict[str, dict], path: str, places: Optional[dict] = None) -> None:
+    """
+    Write a directory snapshot.
+
+    Args:
+        doctors (dict): Doctor records by id, as in doctors.json.
+        path (str): Snapshot directory; replaced atomically.
+        places (dict, optional): Gazetteer from `load_places`, used to place records without coordinates.
+    """
+    staging = f"{path}.tmp{os.getpid()}"
+    os.makedirs(staging, exist_ok=True)
+    rows = len(doctors)
+    # Columns are filled in place: a million records never exist as Python lists of values
+    offsets = np.zeros(rows + 1, dtype=np.int64)
+    coords = np.full((rows, 2), np.nan, dtype=np.float64)
+    codes = {name: np.zeros(rows, dtype=np.uint32) for name in CATEGORIES}
+    vocabularies: Dict[str, Dict[str, int]] = {name: {} for name in CATEGORIES}
+    with open(os.path.join(staging, "records.jsonl"), "wb") as f:
+        for position, doctor in enumerate(doctors.values()):
+            line = json.dumps(doctor).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets[position + 1] = offsets[position] + len(line)
+            coords[position] = doctor_coordinates(doctor, places)
+            for name, value in zip(CATEGORIES, category_values(doctor)):
+                vocabulary = vocabularies[name]
+                codes[name][position] = vocabulary.setdefault(value, len(vocabulary))
+    np.save(os.path.join(staging, "offsets.npy"), offsets)
+    for name in CATEGORIES:
+        np.save(os.path.join(staging, f"{name}_codes.npy"), codes[name].astype(code_dtype(len(vocabularies[name]))))
+    np.save(os.path.join(staging, "coords.npy"), coords.astype(np.float32))
+    # Grid index over the located records: positions grouped by cell, cells sorted
+    located = np.flatnonzero(~np.isnan(coords).any(axis=1))
+    cells = cell_of(coords[located, 0], coords[located, 1])
+    order = np.argsort(cells, kind="stable")
+    cell_keys, cell_starts = np.unique(cells[order], return_index=True)
+    np.save(os.path.join(staging, "grid_positions.npy"), located[order].astype(np.int64))
+    np.save(os.path.join(staging, "grid_cells.npy"), cell_keys.astype(np.int64))
+    np.save(os.path.join(staging, "grid_starts.npy"), np.append(cell_starts, len(located)).astype(np.int64))
+    with open(os.path.join(staging, "places.json"), "w", encoding="utf-8") as f:
+        json.dump(places or {"zip": {}, "city": {}}, f)
+    # Written last: its presence marks a complete snapshot
+    with open(os.path.join(staging, "columns.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": SNAPSHOT_VERSION, "rows": rows, "categories": {name: list(vocabularies[name]) for name in CATEGORIES}}, f)
+    if os.path.exists(path):
+        # Processes that already mapped the old files keep them until they close
+        old = f"{path}.old{os.getpid()}"
+        os.rename(path, old)
+        os.rename(staging, path)
+        shutil.rmtree(old)
+        return
+    try:
+        os.rename(staging, path)
+    except OSError:
+        # Another process published the snapshot first
+        shutil.rmtree(staging)
+
+class DoctorDirectory:
+    """
+    Read-only view over a doctor directory snapshot.
+
+    Args:
+        path (str): Snapshot directory, created from `url` on first use.
+        url (str): Where to download doctors.json from, or a local JSON file to convert.
+        places_url (str, optional): Where to download the gazetteer from; None skips geocoding.
+    """
+
+    def __init__(self, path: str = ".cache/doctors", url: str = DOCTORS_URL, places_url: Optional[str] = PLACES_URL):
+        self.path = path
+        self.url = url
+        self.places_url = places_url
+        self._records: Optional[mmap.mmap] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._codes: Dict[str, np.ndarray] = {}
+        self._coords: Optional[np.ndarray] = None
+        self._grid_positions: Optional[np.ndarray] = None
+        self._grid_cells: Optional[np.ndarray] = None
+        self._grid_starts: Optional[np.ndarray] = None
+        self.categories: Dict[str, List[str]] = {}
+        self._lookup: Dict[str, Dict[str, int]] = {}
+        self.places: Dict[str, Dict[str, List[float]]] = {}
+
+    def ensure(self) -> None:
+        """Download and snapshot the directory if there is no snapshot yet."""
+        try:
+            with open(os.path.join(self.path, "columns.json"), encoding="utf-8") as f:
+                if json.load(f).get("version") == SNAPSHOT_VERSION:
+                    return
+        except (OSError, ValueError):
+            pass
+        if os.path.exists(self.url):
+            with open(self.url, encoding="utf-8") as f:
+                doctors = json.load(f)
+        else:
+            resp = requests.get(self.url)
+            resp.raise_for_status()
+            doctors = json.loads(resp.text)
+        places = None
+        if self.places_url:
+            try:
+                places = load_places(self.places_url)
+            except (requests.exceptions.RequestException, zipfile.BadZipFile, KeyError) as e:
+                # Still serve by state; only records with their own coordinates can be found by distance
+                print(f"Gazetteer unavailable, nearest-doctor search limited: {e}")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        build_snapshot(doctors, self.path, places)
+
+    def open(self) -> "DoctorDirectory":
+        if self._records is None:
+            self.ensure()
+            with open(os.path.join(self.path, "records.jsonl"), "rb") as f:
+                self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            load = lambda name: np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+            self._offsets = load("offsets")
+            self._codes = {name: load(f"{name}_codes") for name in CATEGORIES}
+            self._coords = load("coords")
+            self._grid_positions = load("grid_positions")
+            # Small: searched on every query, so keep them in memory
+            self._grid_cells = np.array(load("grid_cells"))
+            self._grid_starts = np.array(load("grid_starts"))
+            with open(os.path.join(self.path, "columns.json"), encoding="utf-8") as f:
+                self.categories = json.load(f)["categories"]
+            self._lookup = {name: {value: code for code, value in enumerate(values)} for name, values in self.categories.items()}
+            with open(os.path.join(self.path, "places.json"), encoding="utf-8") as f:
+                self.places = json.load(f)
+        return self
+
+    def __len__(self) -> int:
+        self.open()
+        return len(self._coords)
+
+    def nbytes(self) -> Dict[str, int]:
+        """Size of each column, i.e. what filters and nearest-doctor queries read."""
+        self.open()
+        columns = {f"{name}_codes": codes for name, codes in self._codes.items()}
+        columns.update(coords=self._coords, offsets=self._offsets, grid=self._grid_positions)
+        sizes = {name: int(column.nbytes) for name, column in columns.items()}
+        sizes["records"] = len(self._records)
+        return sizes
+
+    def record(self, position: int) -> dict:
+        self.open()
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return json.loads(self._records[start:end])
+
+    def by_state(self, state: str) -> List[dict]:
+        """Doctors whose address is in the given two-letter state code."""
+        return [self.record(int(position)) for position in self.filter(state=state)]
+
+    def _wanted(self, name: str, value: str) -> np.ndarray:
+        """Lookup table over a column's codes: True for the codes matching `value`."""
+        wanted = np.zeros(len(self.categories[name]), dtype=bool)
+        if name == "specialty":
+            wanted[[code for code, known in enumerate(self.categories[name]) if specialty_matches(value, known)]] = True
+        else:
+            key = value.strip().upper() if name == "state" else " ".join(value.lower().split())
+            code = self._lookup[name].get(key)
+            if code is not None:
+                wanted[code] = True
+        return wanted
+
+    def filter(self, state: Optional[str] = None, city: Optional[str] = None, specialty: Optional[str] = None) -> np.ndarray:
+        """
+        Positions of the doctors matching every given criterion, computed on the code columns.
+
+        Args:
+            state (str, optional): Two-letter state code.
+            city (str, optional): City name, case-insensitive.
+            specialty (str, optional): Specialty, matched loosely ("cardiologist" finds "Cardiology").
+
+        Returns:
+            np.ndarray: Matching record positions, in directory order.
+        """
+        self.open()
+        mask = None
+        for name, value in (("state", state), ("city", city), ("specialty", specialty)):
+            if value is None:
+                continue
+            matches = self._wanted(name, value)[self._codes[name]]
+            mask = matches if mask is None else mask & matches
+        if mask is None:
+            return np.arange(len(self), dtype=np.int64)
+        return np.flatnonzero(mask)
+
+    def locate(self, place: str) -> Optional[Tuple[float, float]]:
+        """
+        Coordinates of a place: "lat, lon", a ZIP code, "City, ST" or a city name.
+
+        Returns:
+            (lat, lon), or None if the place is unknown.
+        """
+        self.open()
+        place = place.strip()
+        numbers = re.fullmatch(r"(-?\d+(?:\.\d+)?)\s*[, ]\s*(-?\d+(?:\.\d+)?)", place)
+        if numbers:
+            return float(numbers.group(1)), float(numbers.group(2))
+        zip_code = re.search(r"\b(\d{5})(?:-\d{4})?\b", place)
+        if zip_code and zip_code.group(1) in self.places.get("zip", {}):
+            return tuple(self.places["zip"][zip_code.group(1)])
+        city_state = re.fullmatch(r"(.+?)\s*,\s*([A-Za-z]{2})", place)
+        if city_state:
+            point = self.places.get("city", {}).get(place_key(city_state.group(1), city_state.group(2)))
+            return tuple(point) if point else None
+        # A bare city name: take the first state that has it
+        prefix = place_key(place, "")
+        for key, point in self.places.get("city", {}).items():
+            if key.startswith(prefix):
+                return tuple(point)
+        return None
+
+    def _cells_positions(self, keys: np.ndarray) -> np.ndarray:
+        """Positions of every doctor in the given grid cells."""
+        slots = np.searchsorted(self._grid_cells, keys)
+        slots = slots[(slots < len(self._grid_cells)) & (self._grid_cells[np.minimum(slots, len(self._grid_cells) - 1)] == keys)]
+        if not len(slots):
+            return np.empty(0, dtype=np.int64)
+        starts, ends = self._grid_starts[slots], self._grid_starts[slots + 1]
+        return np.concatenate([self._grid_positions[start:end] for start, end in zip(starts, ends)])
+
+    def nearest(
+        self, lat: float, lon: float, k: int = 5, specialty: Optional[str] = None, max_miles: Optional[float] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        The k doctors closest to a point.
+
+        Args:
+            lat (float): Latitude of the point.
+            lon (float): Longitude of the point.
+            k (int): Number of doctors to return.
+            specialty (str, optional): Only doctors whose specialty matches loosely.
+            max_miles (float, optional): Ignore doctors farther away than this.
+
+        Returns:
+            list[(position, miles)]: Record positions and distances, closest first.
+        """
+        self.open()
+        wanted = self._wanted("specialty", specialty) if specialty else None
+        if wanted is not None and not wanted.any():
+            return []
+        row = int(math.floor((lat + 90) / CELL_DEGREES))
+        column = int(math.floor((lon + 180) / CELL_DEGREES))
+        found = np.empty(0, dtype=np.int64)
+        distances = np.empty(0, dtype=np.float64)
+        for ring in range(MAX_RINGS + 1):
+            if ring == MAX_RINGS:
+                found = self._grid_positions[:]
+                if wanted is not None:
+                    found = found[wanted[self._codes["specialty"][found]]]
+                coords = self._coords[found]
+                distances = haversine_miles(lat, lon, coords[:, 0], coords[:, 1])
+                break
+            if ring == 0:
+                rows, columns = np.array([row]), np.array([column])
+            else:
+                span = np.arange(-ring, ring + 1)
+                rows = np.concatenate([np.full(len(span), row - ring), np.full(len(span), row + ring), row + span[1:-1], row + span[1:-1]])
+                columns = np.concatenate([column + span, column + span, np.full(len(span) - 2, column - ring), np.full(len(span) - 2, column + ring)])
+            inside = (rows >= 0) & (rows < int(180 / CELL_DEGREES))
+            positions = self._cells_positions(rows[inside] * LON_CELLS + np.mod(columns[inside], LON_CELLS))
+            if wanted is not None and len(positions):
+                positions = positions[wanted[self._codes["specialty"][positions]]]
+            if len(positions):
+                coords = self._coords[positions]
+                found = np.concatenate([found, positions])
+                distances = np.concatenate([distances, haversine_miles(lat, lon, coords[:, 0], coords[:, 1])])
+            # Anything in the next ring is at least `ring` cells away; longitude cells narrow towards the poles
+            edge_latitude = min(89.0, abs(lat) + (ring + 1) * CELL_DEGREES)
+            bound = ring * CELL_DEGREES * MILES_PER_DEGREE * math.cos(math.radians(edge_latitude))
+            if max_miles is not None and bound > max_miles:
+                break
+            if len(found) >= k and np.partition(distances, k - 1)[k - 1] <= bound:
+                break
+        if max_miles is not None:
+            keep = distances <= max_miles
+            found, distances = found[keep], distances[keep]
+        order = np.argsort(distances, kind="stable")[:k]
+        return [(int(found[i]), float(distances[i])) for i in order]
@@ -1,9 +1,11 @@
 from colorama import Fore
 from mcp.server.fastmcp import FastMCP
-import json 
-import requests
+
+from doctor_directory import DoctorDirectory
 
 mcp = FastMCP("doctorserver")
+# Downloaded once, then memory-mapped read-only by every MCP server process
+directory = DoctorDirectory()
     
 # Build server function
 @mcp.tool()
@@ -18,14 +20,32 @@ def list_doctors(state:str) -> str:
         Example Response "{"DOC001":{"name":"Dr John James", "specialty":"Cardiology"...}...}" 
         """
     
-    url = 'https://raw.githubusercontent.com/nicknochnack/ACPWalkthrough/refs/heads/main/doctors.json'
-    resp = requests.get(url)
-    doctors = json.loads(resp.text)
-
-    matches = [doctor for doctor in doctors.values() if doctor['address']['state'] == state]    
+    matches = directory.by_state(state)
     return str(matches) 
 
+@mcp.tool()
+def find_nearest_doctors(location: str, specialty: str = "", k: int = 5) -> str:
+    """This tool returns the doctors closest to a place, optionally of one specialty.
+    Args:
+        location: where the user is: a city and state ("Atlanta, GA"), a ZIP code ("30309")
+            or latitude and longitude ("33.78, -84.38")
+        specialty: the kind of doctor wanted, e.g. "cardiologist"; empty for any
+        k: how many doctors to return
+
+    Returns:
+        str: the closest doctors, nearest first, each with its distance in miles
+        Example Response "[{"name":"Dr John James", "specialty":"Cardiology", ..., "distance_miles": 2.4}...]"
+        """
+
+    point = directory.locate(location)
+    if point is None:
+        return f"Unknown location: {location}. Use a city and state such as 'Atlanta, GA', a ZIP code or 'lat, lon'."
+    nearest = directory.nearest(point[0], point[1], k=max(1, min(int(k), 50)), specialty=specialty or None)
+    return str([{**directory.record(position), "distance_miles": round(miles, 1)} for position, miles in nearest])
+
 # Kick off server if file is run 
 if __name__ == "__main__":
     print("MCP  server running...")
+    # Fetch or map the directory before the first tool call
+    directory.open()
     mcp.run(transport="stdio")
\ No newline at end of file
@@ -0,0 +1,159 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional
+
+import requests
+from smolagents import VisitWebpageTool
+
+# === Shared on-disk cache of visited web pages ===
+#
+# Health agents keep visiting the same medical reference pages. Each visit
+# used to refetch the HTML and reconvert it to markdown. Converted pages are
+# now stored zlib-compressed in a sqlite file shared by every agent and
+# process: fresh entries are a local read, expired entries are revalidated
+# with If-None-Match / If-Modified-Since, and the least recently used pages
+# are evicted once the cache exceeds its size cap.
+
+
+class PageCache:
+    """
+    Compressed, size-capped cache of webpage markdown keyed by URL.
+
+    Args:
+        path (str): sqlite file holding the cache.
+        ttl (float): Seconds a page is served without revalidation.
+        max_bytes (int): Cap on the compressed size of all pages; least recently used pages are evicted.
+    """
+
+    def __init__(self, path: str = ".cache/pages.sqlite", ttl: float = 24 * 3600, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stale_served": 0, "evicted": 0}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL lets several server processes read while one writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, content BLOB, etag TEXT, last_modified TEXT, "
+            "fetched_at REAL, accessed_at REAL, size INTEGER)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)")
+        self._db.commit()
+
+    def get(self, url: str) -> Optional[Dict[str, object]]:
+        """The cached entry for a URL (content decompressed, `fresh` flag set), or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content, etag, last_modified, fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        content, etag, last_modified, fetched_at = row
+        return {
+            "content": zlib.decompress(content).decode("utf-8"),
+            "etag": etag,
+            "last_modified": last_modified,
+            "fresh": time.time() - fetched_at < self.ttl,
+        }
+
+    def put(self, url: str, content: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        blob = zlib.compress(content.encode("utf-8"), 6)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages (url, content, etag, last_modified, fetched_at, accessed_at, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, blob, etag, last_modified, now, now, len(blob)),
+            )
+            self._evict()
+            self._db.commit()
+
+    def touch(self, url: str) -> None:
+        """Mark a revalidated page fresh again."""
+        with self._lock:
+            now = time.time()
+            self._db.execute("UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+            self._db.commit()
+
+    def _evict(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for url, size in self._db.execute("SELECT url, size FROM pages ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            victims.append((url,))
+            total -= size
+        self._db.executemany("DELETE FROM pages WHERE url = ?", victims)
+        self.stats["evicted"] += len(victims)
+
+    def fetch(self, url: str, timeout: float = 20) -> str:
+        """
+        Page markdown from the cache, revalidated or refetched when expired.
+
+        Raises:
+            requests.exceptions.RequestException: When the page can't be fetched and isn't cached.
+        """
+        entry = self.get(url)
+        if entry is not None and entry["fresh"]:
+            self.stats["hits"] += 1
+            return entry["content"]
+
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            response = requests.get(url, timeout=timeout, headers=headers)
+            if entry is not None and response.status_code == 304:
+                self.touch(url)
+                self.stats["revalidated"] += 1
+                return entry["content"]
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            if entry is None:
+                raise
+            # The site is down or slow: an expired copy beats no answer
+            self.stats["stale_served"] += 1
+            return entry["content"]
+
+        try:
+            from markdownify import markdownify
+        except ImportError as e:
+            raise ImportError("You must install `markdownify` to convert visited pages: `pip install markdownify`.") from e
+        self.stats["misses"] += 1
+        content = re.sub(r"\n{3,}", "\n\n", markdownify(response.text).strip())
+        self.put(url, content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return content
+
+
+class CachedVisitWebpageTool(VisitWebpageTool):
+    """VisitWebpageTool reading pages through a shared PageCache."""
+
+    def __init__(self, cache: PageCache, max_output_length: int = 40000):
+        super().__init__(max_output_length=max_output_length)
+        self.cache = cache
+
+    def forward(self, url: str) -> str:
+        try:
+            content = self.cache.fetch(url)
+        except requests.exceptions.Timeout:
+            return "The request timed out. Please try again later or check the URL."
+        except requests.exceptions.RequestException as e:
+            return f"Error fetching the webpage: {str(e)}"
+        except ImportError:
+            raise
+        except Exception as e:
+            return f"An unexpected error occurred: {str(e)}"
+        return self._truncate_content(content, self.max_output_length)
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterator
+from typing import Any, Dict, Optional
+
+import httpx
+from acp_sdk.client import Client
+from acp_sdk.models import ACPError, Error, ErrorCode, Run, RunStatus
+from acp_sdk.server.store.store import Store, StoreModel
+from fastapi import FastAPI, HTTPException
+
+# === Persistent run results and long-polling ===
+#
+# Crew and CodeAgent runs take about a minute, and `run_sync` holds a client
+# connection open for all of it. ACP also supports async submission: POST /runs
+# with mode "async" returns the run id at once and the run continues on the
+# server. Its default store keeps runs in memory for an hour, though, so
+# results are lost on restart and each worker process sees only its own runs.
+#
+# SqliteStore is a drop-in ACP store backed by a local sqlite file. Runs,
+# their events and sessions survive restarts and are visible to every worker
+# sharing the file. Installed on an app, it also adds
+# GET /runs/{run_id}/wait?timeout=..., which answers as soon as the run stops
+# (or when the timeout expires), so clients long-poll instead of polling hot.
+#
+# On the client side, `wait_for_run` collects a submitted run and
+# `DetachedClient` wraps an ACP client so that `run_sync` submits
+# asynchronously and long-polls: code written against `run_sync` (workflows,
+# FastACP tools) stops holding a connection open for the whole run.
+
+DEFAULT_RUN_TIMEOUT = 600.0
+TERMINAL = {RunStatus.COMPLETED.value, RunStatus.FAILED.value, RunStatus.CANCELLED.value}
+STOPPED = TERMINAL | {RunStatus.AWAITING.value}
+
+
+class SqliteStore(Store):
+    """
+    ACP key-value store persisted in sqlite.
+
+    Pass it to `serving.build_app(..., store=...)`. Watches see writes from
+    this process immediately and writes from other processes within `poll_interval`.
+
+    Args:
+        path (str): sqlite file holding the store.
+        retention (float): Seconds an entry is kept after its last write.
+        poll_interval (float): How often watches check for writes by other processes.
+    """
+
+    def __init__(self, path: str = ".cache/runs.sqlite", retention: float = 7 * 24 * 3600, poll_interval: float = 0.5):
+        super().__init__()
+        self.path = path
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._changed = asyncio.Event()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL lets worker processes read while one writes; NORMAL skips the fsync on every commit
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, version INTEGER, updated_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_updated ON entries (updated_at)")
+        self._db.commit()
+
+    def _read(self, key: str):
+        with self._lock:
+            return self._db.execute("SELECT value, version FROM entries WHERE key = ?", (key,)).fetchone()
+
+    async def get(self, key) -> Optional[StoreModel]:
+        row = self._read(str(key))
+        return StoreModel.model_validate_json(row[0]) if row else None
+
+    async def set(self, key, value) -> None:
+        with self._lock:
+            if value is None:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (str(key),))
+            else:
+                self._db.execute(
+                    "INSERT INTO entries (key, value, version, updated_at) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, version = version + 1, "
+                    "updated_at = excluded.updated_at",
+                    (str(key), value.model_dump_json(), time.time()),
+                )
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._prune()
+            self._db.commit()
+        # Wake every watcher; each one checks whether its own key changed
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def watch(self, key, *, ready: Optional[asyncio.Event] = None) -> AsyncIterator[Optional[StoreModel]]:
+        key = str(key)
+        row = self._read(key)
+        version = row[1] if row else None
+        if ready:
+            ready.set()
+        while True:
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            row = self._read(key)
+            if (row[1] if row else None) != version:
+                version = row[1] if row else None
+                yield StoreModel.model_validate_json(row[0]) if row else None
+
+    def _prune(self) -> None:
+        self._db.execute("DELETE FROM entries WHERE updated_at < ?", (time.time() - self.retention,))
+
+    def recover(self) -> int:
+        """
+        Fail runs a previous server process left unfinished, so nobody waits on them forever.
+
+        Call it once before serving, never from a worker: other workers' runs are in flight.
+
+        Returns:
+            int: Number of runs marked failed.
+        """
+        recovered = 0
+        with self._lock:
+            self._prune()
+            # Run entries are "run_<id>"; skip the cancel/resume entries that share the prefix
+            rows = self._db.execute(
+                "SELECT key, value FROM entries WHERE key LIKE 'run\\_%' ESCAPE '\\' "
+                "AND key NOT LIKE 'run\\_cancel\\_%' ESCAPE '\\' AND key NOT LIKE 'run\\_resume\\_%' ESCAPE '\\'"
+            ).fetchall()
+            for key, value in rows:
+                data = json.loads(value)
+                run = data.get("run") or {}
+                if run.get("status") in TERMINAL:
+                    continue
+                run["status"] = RunStatus.FAILED.value
+                run["error"] = {"code": "server_error", "message": "The server stopped before the run finished"}
+                self._db.execute(
+                    "UPDATE entries SET value = ?, version = version + 1, updated_at = ? WHERE key = ?",
+                    (json.dumps(data), time.time(), key),
+                )
+                recovered += 1
+            self._db.commit()
+        return recovered
+
+    async def wait_for_run(self, run_id: str, timeout: float) -> Optional[Dict[str, object]]:
+        """The run once it stops, or as it is when `timeout` expires; None if unknown."""
+        key = f"run_{run_id}"
+
+        def current():
+            row = self._read(key)
+            return json.loads(row[0])["run"] if row else None
+
+        run = current()
+        if run is None or run.get("status") in STOPPED:
+            return run
+
+        async def stopped():
+            async for value in self.watch(key):
+                if value is None or value.model_dump()["run"].get("status") in STOPPED:
+                    return
+
+        try:
+            await asyncio.wait_for(stopped(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return current()
+
+    def install(self, app: FastAPI) -> None:
+        """Add the long-poll route to an ACP app."""
+
+        @app.get("/runs/{run_id}/wait")
+        async def wait_run(run_id: str, timeout: float = 30.0) -> Run:
+            run = await self.wait_for_run(run_id, min(max(timeout, 0.0), 120.0))
+            if run is None:
+                raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+            return Run.model_validate(run)
+
+
+# === Client side ===
+
+
+async def wait_for_run(
+    client: Client,
+    run_id: Any,
+    timeout: Optional[float] = None,
+    poll_timeout: float = 30.0,
+    poll_interval: float = 1.0,
+    max_connection_errors: int = 8,
+) -> Run:
+    """
+    Collect a run submitted with `client.run_async`.
+
+    Long-polls GET /runs/{run_id}/wait, or polls GET /runs/{run_id} on servers
+    without that route. Connection errors are retried with backoff (about a
+    minute in all by default), so the result is still collected if the server
+    restarts meanwhile; a server that stays down fails the run.
+
+    Args:
+        client (Client): ACP client for the server running the run.
+        run_id: Id of the submitted run.
+        timeout (float, optional): Give up after this many seconds; wait forever by default.
+        poll_timeout (float): How long each long-poll request is held open by the server.
+        poll_interval (float): Delay between plain polls, and first delay after a connection error.
+        max_connection_errors (int): Connection errors in a row after which the last one is raised.
+
+    Returns:
+        Run: The run once it completed, failed, was cancelled or awaits input.
+
+    Raises:
+        TimeoutError: When `timeout` expires first.
+        httpx.TransportError: When the server can't be reached `max_connection_errors` times in a row.
+        ACPError: When the server doesn't know the run, e.g. one kept in memory and lost on a restart.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    long_poll = True
+    connection_errors = 0
+    while True:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError(f"Run {run_id} still running after {timeout}s")
+        try:
+            if long_poll:
+                hold = poll_timeout if remaining is None else min(poll_timeout, remaining)
+                response = await client.client.get(
+                    f"runs/{run_id}/wait", params={"timeout": hold}, timeout=hold + 10
+                )
+                if response.status_code == 404:
+                    # Unknown run, or a server without the wait route: the plain read tells them apart
+                    run = await client.run_status(run_id=run_id)
+                    long_poll = False
+                else:
+                    response.raise_for_status()
+                    run = Run.model_validate(response.json())
+            else:
+                run = await client.run_status(run_id=run_id)
+        except httpx.TransportError:
+            connection_errors += 1
+            if connection_errors >= max_connection_errors:
+                raise
+            await asyncio.sleep(min(poll_interval * 2 ** (connection_errors - 1), 10.0))
+            continue
+        except ACPError as e:
+            if e.error.code != ErrorCode.NOT_FOUND:
+                raise
+            raise ACPError(
+                Error(
+                    code=ErrorCode.NOT_FOUND,
+                    message=f"Run {run_id} is unknown to the server; it was likely lost when the server restarted",
+                )
+            ) from e
+        connection_errors = 0
+        if run.status.value in STOPPED:
+            return run
+        if not long_poll:
+            await asyncio.sleep(poll_interval)
+
+
+class DetachedClient:
+    """
+    ACP client whose `run_sync` submits the run asynchronously and long-polls for its result.
+
+    Everything else is delegated to the wrapped client, so it can stand in for
+    one in workflows and agent collections.
+
+    Args:
+        client (Client): The ACP client to wrap.
+        timeout (float, optional): Give up on a run after this many seconds; None waits for as long as it runs.
+        poll_timeout (float): How long each long-poll request is held open.
+    """
+
+    def __init__(self, client: Client, timeout: Optional[float] = DEFAULT_RUN_TIMEOUT, poll_timeout: float = 30.0):
+        self.wrapped = client
+        self.timeout = timeout
+        self.poll_timeout = poll_timeout
+
+    async def run_sync(self, input: Any, *, agent: str, **kwargs: Any) -> Run:
+        run = await self.wrapped.run_async(input, agent=agent, **kwargs)
+        return await wait_for_run(self.wrapped, run.run_id, timeout=self.timeout, poll_timeout=self.poll_timeout)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.wrapped, name)
@@ -0,0 +1,85 @@
+from typing import Optional
+
+import uvicorn
+from acp_sdk.server import Server, create_app
+from acp_sdk.server.store import Store
+from acp_sdk.server.logging import configure_logger
+from fastapi import FastAPI
+
+# === Running ACP servers with runtime extensions ===
+#
+# `Server.run` builds its FastAPI app internally, which leaves no place to add
+# middleware or extra routes. These helpers build the same app and let each
+# extension (anything with an `install(app)` method) hook into it first.
+#
+# `serve_workers` runs N worker processes behind one port. uvicorn starts each
+# worker by importing an app factory, so an entry point exposes e.g.
+# `create_app()` returning `build_app(server, ...)`. In-process state such as
+# admission limits and coalescing is per worker.
+#
+# Passing a persistent `store` (run_store.SqliteStore) keeps runs and their
+# results across restarts and shares them between workers, so a client can
+# submit a run asynchronously and collect the result from any worker later.
+
+
+def build_app(server: Server, *extensions, store: Optional[Store] = None) -> FastAPI:
+    """
+    Build the ACP FastAPI app for a server and install extensions on it.
+
+    Args:
+        server (Server): ACP server with its agents registered.
+        *extensions: Objects exposing `install(app)`, e.g. an AdmissionController.
+        store (Store, optional): Where ACP keeps runs and sessions; in memory for an hour by default.
+            Installed like an extension too if it has `install(app)`.
+
+    Returns:
+        FastAPI: The ready-to-serve app.
+    """
+    app = create_app(*server.agents, lifespan=server.lifespan, store=store)
+    if hasattr(store, "install"):
+        store.install(app)
+    for extension in extensions:
+        extension.install(app)
+    return app
+
+
+def serve(
+    server: Server,
+    *extensions,
+    store: Optional[Store] = None,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    **uvicorn_kwargs,
+) -> None:
+    """
+    Drop-in replacement for `server.run(port=...)` that installs extensions first.
+
+    Args:
+        server (Server): ACP server with its agents registered.
+        *extensions: Objects exposing `install(app)`.
+        store (Store, optional): Where ACP keeps runs and sessions.
+        host (str): Interface to bind.
+        port (int): Port to bind.
+        **uvicorn_kwargs: Passed through to `uvicorn.run`.
+    """
+    configure_logger()
+    app = build_app(server, *extensions, store=store)
+    uvicorn.run(app, host=host, port=port, headers=[("server", "acp")], **uvicorn_kwargs)
+
+
+
+def serve_workers(factory: str, workers: int, host: str = "127.0.0.1", port: int = 8000, **uvicorn_kwargs) -> None:
+    """
+    Serve an ACP app from several worker processes sharing one port.
+
+    Args:
+        factory (str): Import path of a function building the app, e.g. "crewaiInsurance_agent:create_app".
+        workers (int): Number of worker processes.
+        host (str): Interface to bind.
+        port (int): Port to bind.
+        **uvicorn_kwargs: Passed through to `uvicorn.run`.
+    """
+    configure_logger()
+    uvicorn.run(
+        factory, factory=True, workers=workers, host=host, port=port, headers=[("server", "acp")], **uvicorn_kwargs
+    )
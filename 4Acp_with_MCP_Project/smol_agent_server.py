@@ -1,45 +1,125 @@
+import functools
+import threading
 from collections.abc import AsyncGenerator
+from contextlib import ExitStack
 from acp_sdk.models import Message, MessagePart
 from acp_sdk.server import RunYield, RunYieldResume, Server
-from smolagents import CodeAgent, DuckDuckGoSearchTool, LiteLLMModel, VisitWebpageTool, ToolCallingAgent, ToolCollection
-from mcp import StdioServerParameters
 from dotenv import load_dotenv
+from agent_pool import AgentPool
+from run_store import SqliteStore
+from serving import serve
+from warmup import Warmup, force_import, lazy_import
+
+# Imported on first use (or during warmup) so the server binds its port at once
+smolagents = lazy_import("smolagents")
+litellm = lazy_import("litellm")
+mcp = lazy_import("mcp")
+
 load_dotenv()
 import os
 os.environ['OPENAI_API_KEY']=os.getenv('OPENAI_API_KEY')
 server = Server()
 
-model = LiteLLMModel(
-    model_id="openai/gpt-4",  
-    max_tokens=2048
-)
 
-server_parameters = StdioServerParameters(
-    command="uv",
-    args=["run", "mcpserver.py"],
-    env=None,
+@functools.lru_cache(maxsize=None)
+def get_model():
+    return smolagents.LiteLLMModel(
+        model_id="openai/gpt-4",  
+        max_tokens=2048
+    )
+
+
+class MCPSession:
+    """
+    One MCP server process and its tools, kept for the life of the ACP server
+    instead of being spawned for every doctor_agent run.
+    """
+
+    def __init__(self, command: str, args: list):
+        self.command = command
+        self.args = args
+        self.tools = None
+        self._stack = ExitStack()
+        self._lock = threading.Lock()
+
+    def open(self) -> list:
+        with self._lock:
+            if self.tools is None:
+                server_parameters = mcp.StdioServerParameters(command=self.command, args=self.args, env=None)
+                tool_collection = self._stack.enter_context(
+                    smolagents.ToolCollection.from_mcp(server_parameters, trust_remote_code=True)
+                )
+                self.tools = [*tool_collection.tools]
+            return self.tools
+
+    def close(self) -> None:
+        with self._lock:
+            self._stack.close()
+            self.tools = None
+
+
+mcp_session = MCPSession(command="uv", args=["run", "mcpserver.py"])
+
+
+def prime_llm() -> None:
+    """Open the connection to the LLM provider with a one-token completion."""
+    litellm.completion(model="openai/gpt-4", messages=[{"role": "user", "content": "ping"}], max_tokens=1)
+
+
+@functools.lru_cache(maxsize=None)
+def get_page_cache():
+    # Visited pages are shared by every pooled agent
+    from page_cache import PageCache
+    return PageCache(path=".cache/pages.sqlite", ttl=24 * 3600, max_bytes=256 * 1024 * 1024)
+
+
+def build_health_agent():
+    from page_cache import CachedVisitWebpageTool
+    return smolagents.CodeAgent(
+        tools=[smolagents.DuckDuckGoSearchTool(), CachedVisitWebpageTool(get_page_cache())], model=get_model()
+    )
+
+
+# Pre-built agents, leased per run and executed off the event loop
+health_pool = AgentPool(
+    build_health_agent,
+    size=4,
+    name="health_agent",
 )
+doctor_pool = AgentPool(
+    lambda: smolagents.ToolCallingAgent(tools=mcp_session.open(), model=get_model()),
+    size=2,
+    name="doctor_agent",
+)
+
+# Runs and their results persist across restarts: submit async, collect later
+run_store = SqliteStore(".cache/runs/smol.sqlite")
+
+warmup = Warmup("Smol agent server")
+warmup.add("imports", lambda: force_import(smolagents, mcp) or get_model())
+warmup.add("mcp session", mcp_session.open)
+warmup.add("health agent pool", health_pool.fill)
+warmup.add("doctor agent pool", doctor_pool.fill)
+warmup.add("llm connection", prime_llm, required=False)
+warmup.on_shutdown(mcp_session.close)
 
 @server.agent()
 async def health_agent(input: list[Message]) -> AsyncGenerator[RunYield, RunYieldResume]:
     "This is a CodeAgent which supports the hospital to handle health based questions for patients. Current or prospective patients can use it to find answers about their health and hospital treatments."
-    agent = CodeAgent(tools=[DuckDuckGoSearchTool(), VisitWebpageTool()], model=model)
-
     prompt = input[0].parts[0].content
-    response = agent.run(prompt)
+    response = await health_pool.run(prompt)
 
     yield Message(parts=[MessagePart(content=str(response))])
 
 @server.agent()
 async def doctor_agent(input: list[Message]) -> AsyncGenerator[RunYield, RunYieldResume]:
     "This is a Doctor Agent which helps users find doctors near them."
-    with ToolCollection.from_mcp(server_parameters, trust_remote_code=True) as tool_collection:
-        agent = ToolCallingAgent(tools=[*tool_collection.tools], model=model)
-        prompt = input[0].parts[0].content
-        response = agent.run(prompt)
+    prompt = input[0].parts[0].content
+    response = await doctor_pool.run(prompt)
 
     yield Message(parts=[MessagePart(content=str(response))])
 
 if __name__ == "__main__":
     print("Smol agent running...")
-    server.run(port=8000)
\ No newline at end of file
+    print(f"Unfinished runs from the last start marked failed: {run_store.recover()}")
+    serve(server, warmup, health_pool, doctor_pool, store=run_store, port=8000)